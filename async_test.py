@@ -0,0 +1,72 @@
+#!/bin/python3
+
+import asyncio
+import unittest
+from twitchircclient import AsyncTwitchIrcClient
+
+class FakeWriter:
+
+    def __init__(self):
+        self.written=[]
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        pass
+
+class AsyncClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = AsyncTwitchIrcClient('twitch_username', '')
+        self.irc._writer = FakeWriter()
+
+    def test_coroutine_listeners_in_order(self):
+        handled = []
+        async def asynclistener(channel, username, tags, message):
+            await asyncio.sleep(0)
+            handled.append(('async', message))
+        def synclistener(channel, username, tags, message):
+            handled.append(('sync', message))
+        self.irc.messagespreader.add(asynclistener)
+        self.irc.messagespreader.add(synclistener)
+        async def run():
+            for message in ('first', 'second'):
+                await self.irc._handle_line(':a!a@a.tmi.twitch.tv PRIVMSG #channel :'+message)
+        asyncio.run(run())
+        self.assertEqual(handled, [('sync','first'), ('async','first'), ('sync','second'), ('async','second')])
+
+    def test_send_commands(self):
+        async def run():
+            await self.irc.join('channel')
+            await self.irc.sendprivmsg('Channel', 'Kappa')
+            await self.irc.timeout('channel', 'user', 10)
+            await self.irc.sendwhisper('user', 'hi')
+            await self.irc.part('channel')
+        asyncio.run(run())
+        self.assertEqual(self.irc._writer.written, [
+            b'JOIN #channel\r\n',
+            b'PRIVMSG #channel :Kappa\r\n',
+            b'PRIVMSG #channel :/timeout user 10\r\n',
+            b'PRIVMSG #twitch_username :/w user hi\r\n',
+            b'PART #channel\r\n'])
+        self.assertEqual((self.irc.joined_channels, self.irc.pending_joins), (set(), set()))
+
+    def test_line_breaks_are_rejected(self):
+        async def run():
+            with self.assertRaises(ValueError):
+                await self.irc.join_many(['channel', 'a\r\nPRIVMSG #x :spam'])
+            with self.assertRaises(ValueError):
+                await self.irc.part('channel\nJOIN #other')
+        asyncio.run(run())
+        self.assertEqual((self.irc._writer.written, self.irc.joined_channels), ([], set()))
+
+    def test_thread_options_are_rejected(self):
+        for option, value in (('rate_limit', True), ('dispatcher', object()), ('reactor', object()), ('write_delay', 0.01)):
+            with self.assertRaises(ValueError):
+                AsyncTwitchIrcClient('twitch_username', '', **{option: value})
+        AsyncTwitchIrcClient('twitch_username', '', rate_limit=False)
+
+    def test_pong(self):
+        asyncio.run(self.irc._handle_line('PING tmi.twitch.tv'))
+        self.assertEqual(self.irc._writer.written, [b'PONG tmi.twitch.tv\r\n'])
@@ -0,0 +1,373 @@
+#!/bin/python3
+"""
+Benchmarks for parsing and dispatching incoming lines
+Drives _handle_incomming of a MockIrcClient with synthetic twitch traffic and reports
+lines per second, the p50/p99 time per line and the allocated bytes per line.
+The old regex cascade is measured as scenario 'legacy', a client that only
+listens to messages as scenario 'messages', listeners of event objects as 'events'
+and 'dispatch' with ClientMetrics as 'metrics'. 'channels' has one message listener
+per channel filtered by the channel and 'unfiltered' the same listeners, which check the
+channel themselves.
+The memory kept by a message history is measured with and without interning.
+With --replay the lines of a log recorded by a TrafficRecorder are used instead of generated traffic.
+With --end-to-end a client recieves messages from a local FakeTwitchServer instead.
+With --outbound a client sends messages to a local FakeTwitchServer, the writes (syscalls, with TLS
+each one is at least one TLS record) per message are counted for every line on its own and with write_delay.
+Usage:
+    python3 benchmark.py [--lines N] [--seed S] [--replay LOG] [--save-baseline FILE] [--baseline FILE]
+    python3 benchmark.py --end-to-end N [--rate R]
+    python3 benchmark.py --outbound N [--write-delay SECONDS]
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import tracemalloc
+import twitchircclient.twitchircclient as tic
+from twitchircclient import MockIrcClient, TwitchIrcClient
+from twitchircclient.fakeserver import FakeTwitchServer
+from twitchircclient.recorder import read_records
+from twitchircclient.metrics import ClientMetrics
+from twitchircclient.outbound import encode_privmsg
+
+USERNAME = 'bench_user'
+
+#Share of each kind of line in the generated traffic
+TRAFFIC_MIX = (
+    ('privmsg', 55),
+    ('emote_privmsg', 20),
+    ('subgift', 5),
+    ('names', 10),
+    ('join_part', 5),
+    ('unknown', 5),
+)
+
+def _privmsg(rnd, username, channel, message, emotes=''):
+    tags = ('badge-info=subscriber/%d;badges=subscriber/12,bits/1000;client-nonce=%032x;color=#%06X;'
+        'display-name=%s;emotes=%s;first-msg=0;flags=;id=%08x-4977-403a-8a94-33c6bac34fb8;mod=0;'
+        'returning-chatter=0;room-id=1337;subscriber=1;tmi-sent-ts=%d;turbo=0;user-id=%d;user-type=')%(
+        rnd.randrange(60), rnd.getrandbits(128), rnd.getrandbits(24), username.capitalize(), emotes,
+        rnd.getrandbits(32), 1600000000000+rnd.randrange(10**9), rnd.randrange(10**8))
+    return '@%s :%s!%s@%s.tmi.twitch.tv PRIVMSG #%s :%s'%(tags, username, username, username, channel, message)
+
+def generate_traffic(count, seed=0, channels=50, users=2000):
+    """
+    Generates count lines of synthetic twitch traffic
+    Returns:
+        (list): The lines without \\r\\n
+    """
+    rnd = random.Random(seed)
+    kinds = [kind for kind, share in TRAFFIC_MIX for _ in range(share)]
+    words = ['Kappa', 'PogChamp', 'hello', 'what', 'is', 'this', 'LUL', 'gg', 'stream', 'nice', 'play']
+    lines = []
+    while len(lines)<count:
+        kind = rnd.choice(kinds)
+        channel = 'channel%d'%rnd.randrange(channels)
+        username = 'user%d'%rnd.randrange(users)
+        if kind=='privmsg':
+            message = ' '.join(rnd.choice(words) for _ in range(rnd.randrange(1, 15)))
+            lines.append(_privmsg(rnd, username, channel, message))
+        elif kind=='emote_privmsg':
+            message = ' '.join(['Kappa']*rnd.randrange(5, 30))
+            ranges = ','.join('%d-%d'%(pos*6, pos*6+4) for pos in range(message.count('Kappa')))
+            lines.append(_privmsg(rnd, username, channel, message, '25:'+ranges))
+        elif kind=='subgift':
+            recipient = 'user%d'%rnd.randrange(users)
+            lines.append(('@badge-info=;badges=staff/1,premium/1;color=#0000FF;display-name=%s;emotes=;'
+                'id=%08x-1d2c-4a17-8f8a-7d6b1cd7a0a1;login=%s;mod=0;msg-id=subgift;msg-param-months=1;'
+                'msg-param-recipient-display-name=%s;msg-param-recipient-id=%d;msg-param-recipient-user-name=%s;'
+                'msg-param-sub-plan-name=Channel\\sSubscription;msg-param-sub-plan=1000;room-id=1337;subscriber=0;'
+                'system-msg=%s\\sgifted\\sa\\sTier\\s1\\ssub\\sto\\s%s!;tmi-sent-ts=1600000000000;user-id=%d;user-type=staff'
+                ' :tmi.twitch.tv USERNOTICE #%s')%(username.capitalize(), rnd.getrandbits(32), username,
+                recipient.capitalize(), rnd.randrange(10**8), recipient, username, recipient, rnd.randrange(10**8), channel))
+        elif kind=='names':
+            for _ in range(rnd.randrange(1, 10)):
+                names = ' '.join('user%d'%rnd.randrange(users) for _ in range(rnd.randrange(10, 40)))
+                lines.append(':%s.tmi.twitch.tv 353 %s = #%s :%s'%(USERNAME, USERNAME, channel, names))
+            lines.append(':%s.tmi.twitch.tv 366 %s #%s :End of /NAMES list'%(USERNAME, USERNAME, channel))
+        elif kind=='join_part':
+            lines.append(':%s!%s@%s.tmi.twitch.tv %s #%s'%(username, username, username, rnd.choice(('JOIN','PART')), channel))
+        else:
+            lines.append(':tmi.twitch.tv %03d %s :unknown numeric reply %d'%(rnd.randrange(400, 500), USERNAME, rnd.randrange(1000)))
+    return lines[:count]
+
+def legacy_parse_tags(raw_tags):
+    """The eager tag parsing used before TagDict"""
+    tags = {}
+    for tag in raw_tags.split(';'):
+        splittag = tag.split('=',1)
+        tags[splittag[0]]=tic._deescape_tag(splittag[1])
+    return tags
+
+_nameslist_regex = re.compile('^:{login}.tmi.twitch.tv 353 {login} = '.format(login=USERNAME)+tic.channel_regex+' :(?P<names>[a-zA-Z0-9_ ]+)$')
+
+def legacy_handle(data):
+    """The regex cascade _handle_incomming used before the dispatcher, without spreading"""
+    for regex in (tic.privmsg_regex, tic.join_regex, tic.part_regex, tic.notice_regex,
+            tic.usernotice_regex, tic.roomstate_regex, tic.clearchat_regex, tic.userstate_regex,
+            tic.globaluserstate_regex, tic.host_regex, tic.whisper_regex,
+            tic.gain_operator_regex, tic.loose_operator_regex, _nameslist_regex):
+        match = regex.match(data)
+        if not match is None:
+            if 'tags' in regex.groupindex and match.group('tags') is not None:
+                legacy_parse_tags(match.group('tags'))
+            return match
+    return None
+
+def create_client(**kwargs):
+    """MockIrcClient with a listener on every spreader, like a bot that logs everything"""
+    irc = MockIrcClient(USERNAME, None, **kwargs)
+    def listener(**kwargs):
+        pass
+    for value in vars(irc).values():
+        if isinstance(value, tic.EventSpreader):
+            value.add(listener)
+    return irc
+
+def create_event_client():
+    """Like create_client, but the listeners get the event objects"""
+    irc = MockIrcClient(USERNAME, None)
+    def listener(event):
+        pass
+    for value in vars(irc).values():
+        if isinstance(value, tic.EventSpreader):
+            value.add_event(listener)
+    return irc
+
+def create_message_client():
+    """MockIrcClient that only listens to messages, the other lines are skipped"""
+    irc = MockIrcClient(USERNAME, None)
+    def listener(**kwargs):
+        pass
+    irc.messagespreader.add(listener)
+    return irc
+
+def create_channel_client(filtered, channels=500):
+    """MockIrcClient with a message listener for each of many channels"""
+    irc = MockIrcClient(USERNAME, None)
+    for index in range(channels):
+        channel = 'channel%d'%index
+        if filtered:
+            irc.messagespreader.add(lambda **kwargs: None, channel=channel)
+        else:
+            irc.messagespreader.add(lambda _channel=channel, **kwargs: kwargs['channel']==_channel)
+    return irc
+
+SCENARIOS = {
+    'dispatch': lambda: create_client()._handle_incomming,
+    'metrics': lambda: create_client(metrics=ClientMetrics())._handle_incomming,
+    'events': lambda: create_event_client()._handle_incomming,
+    'messages': lambda: create_message_client()._handle_incomming,
+    'channels': lambda: create_channel_client(True)._handle_incomming,
+    'unfiltered': lambda: create_channel_client(False)._handle_incomming,
+    'legacy': lambda: legacy_handle,
+}
+
+def _percentile(values, percent):
+    return values[min(len(values)-1, int(len(values)*percent/100))]
+
+def measure(handle, lines, alloc_sample=2000):
+    """
+    Returns:
+        (dict): lines_per_sec, p50_us, p99_us and alloc_bytes_per_line
+    """
+    #warm up
+    for line in lines[:1000]:
+        handle(line)
+    start = time.perf_counter()
+    for line in lines:
+        handle(line)
+    total = time.perf_counter()-start
+    durations = []
+    clock = time.perf_counter_ns
+    for line in lines:
+        before = clock()
+        handle(line)
+        durations.append(clock()-before)
+    durations.sort()
+    #bytes allocated while handling a line, even if they are freed afterwards
+    allocated = 0
+    sample = lines[:alloc_sample]
+    tracemalloc.start()
+    for line in sample:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        handle(line)
+        allocated += tracemalloc.get_traced_memory()[1]-current
+    tracemalloc.stop()
+    return {
+        'lines_per_sec': len(lines)/total,
+        'p50_us': _percentile(durations, 50)/1000,
+        'p99_us': _percentile(durations, 99)/1000,
+        'alloc_bytes_per_line': allocated/len(sample),
+    }
+
+def history_bytes(lines, intern_size):
+    """
+    Keeps the events of all lines like a message history
+    Returns:
+        (float): Bytes per line still allocated after all lines were handled
+    """
+    irc = MockIrcClient(USERNAME, None, intern_size=intern_size)
+    history = []
+    for value in vars(irc).values():
+        if isinstance(value, tic.EventSpreader):
+            value.add_event(history.append)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for line in lines:
+        irc._handle_incomming(line)
+    kept = tracemalloc.get_traced_memory()[0]-before
+    tracemalloc.stop()
+    return kept/len(lines)
+
+def measure_interning(lines, intern_size=10000):
+    """
+    Returns:
+        (dict): history bytes per line with and without interning
+    """
+    return {
+        'interned': history_bytes(lines, intern_size),
+        'not_interned': history_bytes(lines, 0),
+    }
+
+def run(count=100000, seed=0, scenarios=SCENARIOS, lines=None):
+    if lines is None:
+        lines = generate_traffic(count, seed)
+    return {name: measure(create(), lines) for name, create in scenarios.items()}
+
+def end_to_end(count, rate=None, timeout=60):
+    """
+    Sends count messages from a local FakeTwitchServer to a client
+    Returns:
+        (dict): messages_per_sec and lost messages
+    """
+    server = FakeTwitchServer()
+    server.start()
+    irc = TwitchIrcClient(USERNAME, 'oauth:benchmark', irc_hostname=server.host, irc_port=server.port, use_ssl=False)
+    recieved = []
+    done = threading.Event()
+    def listener(channel, username, tags, message):
+        recieved.append(message)
+        if len(recieved)==count:
+            done.set()
+    irc.messagespreader.add(listener)
+    joined = threading.Event()
+    irc.joinconfirmspreader.add(lambda channel: joined.set())
+    try:
+        irc.create_connection()
+        irc.join('channel')
+        joined.wait(10)
+        start = time.perf_counter()
+        server.generate('channel', count, rate)
+        done.wait(timeout)
+        total = time.perf_counter()-start
+    finally:
+        irc.shutdown()
+        server.stop()
+    return {'messages_per_sec': len(recieved)/total, 'lost': count-len(set(recieved))}
+
+class CountingSocket:
+    """Socket that counts the writes of the client"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.writes = 0
+        self.bytes = 0
+
+    def sendall(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+        self._sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+class CountingClient(TwitchIrcClient):
+
+    def _connect(self):
+        super()._connect()
+        self._sock = CountingSocket(self._sock)
+
+def outbound(count, write_delay=None, timeout=60):
+    """
+    Sends count PRIVMSGs from a client to a local FakeTwitchServer
+    Returns:
+        (dict): login_writes, writes_per_message and messages_per_sec
+    """
+    server = FakeTwitchServer(privmsg_limit=(count, 30))
+    server.start()
+    irc = CountingClient(USERNAME, 'oauth:benchmark', irc_hostname=server.host, irc_port=server.port, use_ssl=False,
+        write_delay=write_delay)
+    expected = sum(len(encode_privmsg('channel', str(number))) for number in range(count))
+    try:
+        irc.create_connection()
+        irc._authenticated.wait(10)
+        sock = irc._sock
+        login_writes = sock.writes
+        writes, sent = sock.writes, sock.bytes
+        start = time.perf_counter()
+        for number in range(count):
+            irc.sendprivmsg('channel', str(number))
+        deadline = time.monotonic()+timeout
+        while sock.bytes-sent<expected and time.monotonic()<deadline:
+            time.sleep(0.001)
+        total = time.perf_counter()-start
+    finally:
+        irc.shutdown()
+        server.stop()
+    return {'login_writes': login_writes, 'writes_per_message': (sock.writes-writes)/count, 'messages_per_sec': count/total}
+
+def print_results(results, baseline=None):
+    print('%-12s %14s %10s %10s %14s'%('scenario', 'lines/s', 'p50 us', 'p99 us', 'bytes/line'))
+    for name, result in results.items():
+        print('%-12s %14.0f %10.2f %10.2f %14.0f'%(name, result['lines_per_sec'], result['p50_us'],
+            result['p99_us'], result['alloc_bytes_per_line']))
+        if baseline and name in baseline:
+            base = baseline[name]
+            print('%-12s %13.2fx %9.2fx %9.2fx %13.2fx'%('  vs base', result['lines_per_sec']/base['lines_per_sec'],
+                result['p50_us']/base['p50_us'], result['p99_us']/base['p99_us'],
+                result['alloc_bytes_per_line']/max(base['alloc_bytes_per_line'], 1)))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parsing and dispatching of incoming lines')
+    parser.add_argument('--lines', type=int, default=100000, help='number of generated lines')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the traffic generator')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='run only these scenarios')
+    parser.add_argument('--baseline', help='JSON file with results to compare against')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--replay', metavar='LOG', help='use the lines of a recorded traffic log')
+    parser.add_argument('--end-to-end', type=int, metavar='N', help='send N messages through a local FakeTwitchServer')
+    parser.add_argument('--rate', type=float, help='messages per second for --end-to-end (default: as fast as possible)')
+    parser.add_argument('--outbound', type=int, metavar='N', help='send N messages to a local FakeTwitchServer')
+    parser.add_argument('--write-delay', type=float, default=0.005, help='write_delay for --outbound (default: 0.005)')
+    args = parser.parse_args()
+    if args.end_to_end:
+        result = end_to_end(args.end_to_end, args.rate)
+        print('end to end: %.0f messages/s, %d lost'%(result['messages_per_sec'], result['lost']))
+        raise SystemExit()
+    if args.outbound:
+        for name, write_delay in (('every line', None), ('coalesced', args.write_delay)):
+            result = outbound(args.outbound, write_delay)
+            print('%-12s login: %d writes, %.3f writes/message, %.0f messages/s'%(name, result['login_writes'],
+                result['writes_per_message'], result['messages_per_sec']))
+        raise SystemExit()
+    scenarios = {name: SCENARIOS[name] for name in (args.scenario or SCENARIOS)}
+    lines = None
+    if args.replay:
+        lines = [line for timestamp, line in read_records(args.replay)]
+    results = run(args.lines, args.seed, scenarios, lines)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    memory = measure_interning(lines[:20000] if lines else generate_traffic(min(args.lines, 20000), args.seed))
+    print('history bytes/line: %.0f interned, %.0f not interned (%.1f%% saved)'%(memory['interned'],
+        memory['not_interned'], 100-100*memory['interned']/memory['not_interned']))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,533 @@
+#!/bin/python3
+
+import socket
+import threading
+import time
+import unittest
+from twitchircclient import TwitchIrcClient, MockIrcClient
+from unittest import mock
+from twitchircclient.twitchircclient import LineFramer
+import twitchircclient.twitchircclient as tic
+from twitchircclient.ratelimit import SendQueue
+from twitchircclient.backoff import Backoff
+from twitchircclient.outbound import OutboundBuffer, encode_privmsg, encode_pong
+
+WELCOME = b':tmi.twitch.tv 001 twitch_username :Welcome, GLHF!\r\n'
+
+class SocketPairClient(TwitchIrcClient):
+    """Client connected to the other end of a socketpair instead of twitch"""
+
+    def _connect(self):
+        self._sock, self.server = socket.socketpair()
+
+def read_lines(sock, count):
+    framer = LineFramer()
+    lines = []
+    while len(lines)<count:
+        lines.extend(framer.recv_from(sock))
+    return lines
+
+class LineFramerTest(unittest.TestCase):
+
+    def test_partial_lines(self):
+        framer = LineFramer(16)
+        self.assertEqual(framer.feed(b'PING tmi'), [])
+        self.assertEqual(framer.feed(b'.twitch.tv\r\nPI'), ['PING tmi.twitch.tv'])
+        self.assertEqual(framer.feed(b'NG a\r\nPING b\r\n'), ['PING a', 'PING b'])
+        self.assertEqual(framer.feed(b'\r\n'), [''])
+
+    def test_split_multibyte_character(self):
+        framer = LineFramer(16)
+        encoded = 'PRIVMSG #channel :könig \U0001F600\r\n'.encode('utf-8')
+        split = encoded.index(b'\xf0')+2
+        self.assertEqual(framer.feed(encoded[:split]), [])
+        self.assertEqual(framer.feed(encoded[split:]), ['PRIVMSG #channel :könig \U0001F600'])
+
+    def test_invalid_utf8(self):
+        framer = LineFramer(16)
+        self.assertEqual(framer.feed(b'bad \xff line\r\n'), ['bad \ufffd line'])
+        self.assertEqual(framer.feed(b'PING a\r\nPING b\r\n'), ['PING a', 'PING b'])
+
+    def test_long_line(self):
+        framer = LineFramer(8)
+        line = 'x'*100
+        for pos in range(0, 100, 7):
+            self.assertEqual(framer.feed(line[pos:pos+7].encode('utf-8')), [])
+        self.assertEqual(framer.feed(b'\r\n'), [line])
+
+    def test_long_line_is_scanned_once(self):
+        framer = LineFramer(8)
+        for _ in range(50):
+            self.assertEqual(framer.feed(b'x'*7), [])
+        self.assertEqual(framer._scanned, 350)
+        #A linebreak split between two reads
+        self.assertEqual(framer.feed(b'\r'), [])
+        self.assertEqual(framer.feed(b'\nab\r'), ['x'*350])
+        self.assertEqual(framer._scanned, 3)
+        self.assertEqual(framer.feed(b'\n'), ['ab'])
+        framer.feed(b'cd')
+        framer.clear()
+        self.assertEqual(framer.feed(b'ef\r\n'), ['ef'])
+
+    def test_recv_from_socket(self):
+        framer = LineFramer(4)
+        reader, writer = socket.socketpair()
+        try:
+            writer.sendall(b'ab\r\ncd')
+            lines = []
+            while len(lines)<1:
+                lines.extend(framer.recv_from(reader))
+            self.assertEqual(lines, ['ab'])
+            writer.close()
+            while True:
+                lines = framer.recv_from(reader)
+                if lines is None:
+                    break
+                self.assertEqual(lines, [])
+        finally:
+            reader.close()
+            writer.close()
+
+
+class ReconnectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = SocketPairClient('twitch_username', 'oauth:token', send_timeout=5)
+        self.irc.create_connection()
+
+    def tearDown(self):
+        self.irc.shutdown()
+        self.irc._irc_reciever_thread.join(5)
+        self.irc.server.close()
+
+    def test_send_waits_for_authentication(self):
+        #Without recievers no capabilities are needed
+        self.assertEqual(read_lines(self.irc.server, 3)[:2], ['PASS oauth:token', 'NICK twitch_username'])
+        sender = threading.Thread(target=self.irc.sendprivmsg, args=('channel', 'Kappa'))
+        sender.start()
+        sender.join(0.1)
+        self.assertTrue(sender.is_alive())
+        self.irc.server.sendall(WELCOME)
+        sender.join(5)
+        self.assertEqual(read_lines(self.irc.server, 1), ['PRIVMSG #channel :Kappa'])
+
+    def test_failing_listener_keeps_the_read(self):
+        messages = []
+        def listener(channel, username, tags, message):
+            if message=='1':
+                raise ValueError('listener failed')
+            messages.append(message)
+        batches = []
+        self.irc.messagespreader.add(listener)
+        self.irc.messagespreader.add_batch(batches.append)
+        self.irc.server.sendall(WELCOME+b''.join(b':a!a@a.tmi.twitch.tv PRIVMSG #channel :%d\r\n'%number for number in range(3)))
+        for _ in range(500):
+            if batches:
+                break
+            time.sleep(0.01)
+        #The lines after the failing one and the batch of the read are still spread
+        self.assertEqual(messages, ['0', '2'])
+        self.assertEqual(len(batches), 1)
+
+    def test_reconnect(self):
+        self.irc.server.sendall(WELCOME)
+        self.irc.join('channel')
+        old_server = self.irc.server
+        self.irc.reconnect()
+        old_server.close()
+        self.assertEqual(read_lines(self.irc.server, 4)[-1], 'JOIN #channel')
+        self.irc.send_timeout = 0.05
+        with self.assertRaises(socket.timeout):
+            self.irc.send('PING twitchircclient\r\n')
+        self.irc.server.sendall(WELCOME)
+        self.irc._authenticated.wait(5)
+        self.assertGreater(self.irc.reconnect_latency, 0)
+        self.irc.pingtest()
+        self.assertEqual(read_lines(self.irc.server, 1), ['PING twitchircclient'])
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class SendQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.irc = MockIrcClient('twitch_username', None)
+        self.sent = []
+        self.irc.set_send_reciever(self.sent.append)
+        self.irc.send_queue = SendQueue(self.irc.send, clock=self.clock)
+
+    def test_message_limit(self):
+        for i in range(25):
+            self.irc.sendprivmsg('channel', str(i))
+        self.assertEqual(self.irc.send_queue.process(), 1.5)
+        self.assertEqual(len(self.sent), 20)
+        self.clock.now = 3
+        self.irc.send_queue.process()
+        self.assertEqual(self.sent[-1], 'PRIVMSG #channel :21\r\n')
+        metrics = self.irc.send_queue.metrics()
+        self.assertEqual(metrics['queued'], 3)
+        self.assertEqual(metrics['sent'], 22)
+        self.assertEqual(metrics['wait_max'], 3)
+
+    def test_bans_jump_ahead(self):
+        self.irc._handle_incomming('@badges=moderator/1;mod=1 :tmi.twitch.tv USERSTATE #channel')
+        for i in range(101):
+            self.irc.sendprivmsg('channel', str(i))
+        self.irc.send_queue.process()
+        self.assertEqual(len(self.sent), 100)
+        self.irc.ban('channel', 'spammer')
+        self.clock.now = 0.5
+        self.irc.send_queue.process()
+        self.assertEqual(self.sent[-1], 'PRIVMSG #channel :/ban spammer\r\n')
+
+    def test_moderator_messages_count_against_message_limit(self):
+        self.irc._handle_incomming('@badges=moderator/1;mod=1 :tmi.twitch.tv USERSTATE #moderated')
+        for i in range(100):
+            self.irc.sendprivmsg('moderated', str(i))
+        for i in range(20):
+            self.irc.sendprivmsg('channel', str(i))
+        self.irc.send_queue.process()
+        self.assertEqual(len(self.sent), 100)
+        self.assertTrue(all(line.startswith('PRIVMSG #moderated') for line in self.sent))
+        #The message bucket is empty, not in debt: it is full again after one window
+        self.clock.now = 30
+        self.irc.send_queue.process()
+        self.assertEqual(len(self.sent), 120)
+
+    def test_separate_buckets(self):
+        for i in range(3):
+            self.irc.join('channel%d'%i)
+        for i in range(5):
+            self.irc.sendwhisper('user', str(i))
+        self.irc.send_queue.process()
+        self.assertEqual(len(self.sent), 6)
+        self.assertEqual(self.irc.send_queue.metrics()['queued_by_class']['whisper'], 2)
+
+class JoinManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = MockIrcClient('twitch_username', None)
+        self.sent = []
+        self.irc.set_send_reciever(self.sent.append)
+
+    def test_pack_lines(self):
+        channels = ['channel%04d'%i for i in range(100)]
+        self.irc.join_many(channels)
+        self.assertEqual(len(self.sent), 3)
+        for line in self.sent:
+            self.assertLessEqual(len(line.encode('utf-8')), 512)
+            self.assertTrue(line.startswith('JOIN #channel'))
+            self.assertTrue(line.endswith('\r\n'))
+        self.assertEqual(','.join(line[5:-2] for line in self.sent), ','.join('#'+channel for channel in channels))
+        self.irc.part_many(channels[:10])
+        self.assertEqual(self.sent[-1], 'PART '+','.join('#'+channel for channel in channels[:10])+'\r\n')
+        self.assertEqual(len(self.irc.joined_channels), 90)
+
+    def test_joins_limited_by_bucket(self):
+        clock = FakeClock()
+        self.irc.send_queue = SendQueue(self.irc.send, clock=clock)
+        self.irc.join_many('channel%d'%i for i in range(50))
+        self.irc.send_queue.process()
+        self.assertEqual(self.sent, ['JOIN '+','.join('#channel%d'%i for i in range(20))+'\r\n'])
+        clock.now = 10
+        self.irc.send_queue.process()
+        self.assertEqual(len(self.sent), 2)
+
+    def test_join_confirmation(self):
+        confirmed = []
+        self.irc.joinconfirmspreader.add(lambda channel: confirmed.append(channel))
+        self.irc.join_many(['channel_a', 'Channel_B'])
+        self.assertEqual(self.irc.pending_joins, {'channel_a', 'channel_b'})
+        self.irc.mock_msg_incomming(':other!other@other.tmi.twitch.tv JOIN #channel_a')
+        self.irc.mock_msg_incomming(':twitch_username!twitch_username@twitch_username.tmi.twitch.tv JOIN #channel_b')
+        self.assertEqual(confirmed, ['channel_b'])
+        self.assertEqual(self.irc.pending_joins, {'channel_a'})
+        self.irc.part('Channel_A')
+        self.assertEqual(self.irc.pending_joins, set())
+
+class CapabilityTest(unittest.TestCase):
+
+    def tearDown(self):
+        self.irc.shutdown()
+        self.irc._irc_reciever_thread.join(5)
+        self.irc.server.close()
+
+    def test_requested_capabilities(self):
+        self.irc = SocketPairClient('twitch_username', 'oauth:token')
+        self.irc.messagespreader.add(lambda **kwargs: None)
+        self.irc.create_connection()
+        self.assertEqual(read_lines(self.irc.server, 4)[:2], ['CAP REQ :twitch.tv/tags', 'PASS oauth:token'])
+        #A new reciever gets its capability on the running connection
+        self.irc.partspreader.add(lambda **kwargs: None)
+        self.assertEqual(read_lines(self.irc.server, 1), ['CAP REQ :twitch.tv/membership'])
+        #Already requested
+        self.irc.joinspreader.add(lambda **kwargs: None)
+        self.irc.server.sendall(WELCOME)
+        self.irc.pingtest()
+        self.assertEqual(read_lines(self.irc.server, 1), ['PING twitchircclient'])
+
+    def test_explicit_capabilities(self):
+        self.irc = SocketPairClient('twitch_username', 'oauth:token', capabilities=[tic.CAP_TAGS, tic.CAP_COMMANDS])
+        self.irc.create_connection()
+        self.assertEqual(read_lines(self.irc.server, 5)[:3], ['CAP REQ :twitch.tv/commands', 'CAP REQ :twitch.tv/tags', 'PASS oauth:token'])
+
+class SkipCommandTest(unittest.TestCase):
+
+    def test_lines_without_recievers_are_not_parsed(self):
+        irc = MockIrcClient('twitch_username', None)
+        joins = []
+        messages = []
+        irc.joinspreader.add(lambda **kwargs: joins.append(kwargs))
+        with mock.patch.object(tic, '_parse_line', wraps=tic._parse_line) as parse_line:
+            irc.mock_msg_incomming(':user!user@user.tmi.twitch.tv PART #channel')
+            irc.mock_msg_incomming('@badges=;color= :user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa')
+            irc.mock_msg_incomming(':user.tmi.twitch.tv 353 twitch_username = #channel :a b c')
+            self.assertEqual(parse_line.call_count, 0)
+            irc.mock_msg_incomming(':user!user@user.tmi.twitch.tv JOIN #channel')
+            self.assertEqual(parse_line.call_count, 1)
+            irc.messagespreader.add(lambda **kwargs: messages.append(kwargs['message']))
+            irc.mock_msg_incomming('@badges=;color= :user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa')
+        self.assertEqual(joins, [{'username': 'user', 'channel': 'channel'}])
+        self.assertEqual(messages, ['Kappa'])
+
+class KeepaliveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.irc = MockIrcClient('twitch_username', None, keepalive=60, keepalive_timeout=10)
+        self.irc.keepalive.clock = self.clock
+        self.irc.keepalive.start()
+        self.sent = []
+        self.irc.set_send_reciever(self.sent.append)
+        self.health = []
+        self.irc.healthspreader.add_event(self.health.append)
+
+    def test_rtt(self):
+        self.assertIsNone(self.irc._keepalive_tick())
+        self.clock.now = 60
+        self.irc._keepalive_tick()
+        self.assertEqual(self.sent, ['PING :twitchircclient-1\r\n'])
+        self.clock.now = 60.5
+        #Foreign PONGs are ignored
+        self.irc.mock_msg_incomming(':tmi.twitch.tv PONG tmi.twitch.tv :twitchircclient')
+        self.irc.mock_msg_incomming(':tmi.twitch.tv PONG tmi.twitch.tv :twitchircclient-1')
+        self.assertEqual([(event.rtt, event.healthy) for event in self.health], [(0.5, True)])
+        self.clock.now = 120
+        self.irc._keepalive_tick()
+        self.clock.now = 122.5
+        self.irc.mock_msg_incomming(':tmi.twitch.tv PONG tmi.twitch.tv :twitchircclient-2')
+        self.assertEqual(self.health[-1].last_rtt, 2.5)
+        self.assertEqual(self.health[-1].rtt, 0.5+0.125*2)
+
+    def test_overdue_pong(self):
+        self.clock.now = 60
+        self.irc._keepalive_tick()
+        self.clock.now = 69
+        self.assertIsNone(self.irc._keepalive_tick())
+        self.clock.now = 70
+        self.assertEqual(self.irc._keepalive_tick(), 'reconnect')
+        self.assertEqual([(event.healthy, event.missed) for event in self.health], [(False, 1)])
+        #A late PONG doesn't count anymore
+        self.irc.mock_msg_incomming(':tmi.twitch.tv PONG tmi.twitch.tv :twitchircclient-1')
+        self.assertEqual(len(self.health), 1)
+
+    def test_reconnect_on_silent_connection(self):
+        irc = SocketPairClient('twitch_username', 'oauth:token', keepalive=0.05, keepalive_timeout=0.05)
+        reconnected = threading.Event()
+        irc.disconnectspreader.add(reconnected.set)
+        irc.create_connection()
+        old_server = irc.server
+        try:
+            old_server.sendall(WELCOME)
+            self.assertTrue(read_lines(old_server, 4)[-1].startswith('PING :twitchircclient-'))
+            #The server never answers
+            self.assertTrue(reconnected.wait(5))
+            #The reconnect logs in on a new connection
+            self.assertTrue(irc._connected.wait(5))
+            self.assertEqual(read_lines(irc.server, 3)[0], 'PASS oauth:token')
+        finally:
+            irc.shutdown()
+            irc._irc_reciever_thread.join(5)
+            irc._keepalive_thread.join(5)
+            old_server.close()
+            irc.server.close()
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = MockIrcClient('twitch_username', None)
+        self.batches = []
+
+    def privmsg(self, message):
+        return self.irc.generate_mock_privmsg(message=message, tags={'a': 'b'})
+
+    def test_batch_per_read(self):
+        self.irc.messagespreader.add_batch(lambda events: self.batches.append([event.message for event in events]))
+        self.irc.mock_burst_incomming([self.privmsg('1'), ':user!user@user.tmi.twitch.tv JOIN #channel', self.privmsg('2')])
+        self.irc.mock_msg_incomming(self.privmsg('3'))
+        self.assertEqual(self.batches, [['1', '2'], ['3']])
+
+    def test_size_window(self):
+        self.irc.messagespreader.add_batch(self.batches.append, max_size=2)
+        for i in range(5):
+            self.irc.mock_msg_incomming(self.privmsg(str(i)))
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2])
+        #The rest is delivered when the reciever is removed
+        self.irc.messagespreader.remove_batch(self.batches.append)
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+        self.assertFalse(self.irc.messagespreader.has_recievers())
+
+    def test_time_window(self):
+        clock = FakeClock()
+        self.irc.messagespreader.add_batch(self.batches.append, max_delay=1, clock=clock)
+        self.irc.mock_msg_incomming(self.privmsg('1'))
+        clock.now = 0.5
+        self.irc.mock_msg_incomming(self.privmsg('2'))
+        self.assertEqual(self.batches, [])
+        clock.now = 1
+        self.irc.mock_msg_incomming(self.privmsg('3'))
+        self.assertEqual([[event.message for event in batch] for batch in self.batches], [['1', '2', '3']])
+        self.irc.mock_msg_incomming(self.privmsg('4'))
+        self.irc.messagespreader.flush_batches(force=True)
+        self.assertEqual(len(self.batches), 2)
+
+class FailingClient(SocketPairClient):
+    """Fails to connect a few times after the first connection"""
+
+    failures = 0
+
+    def _connect(self):
+        if not getattr(self, 'server', None) is None and self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError('twitch is down')
+        super()._connect()
+
+class BackoffTest(unittest.TestCase):
+
+    def test_delays(self):
+        backoff = Backoff(initial=1, maximum=10, jitter=0.5, failure_threshold=6, cooldown=300, random=lambda: 0.5)
+        delays = [backoff.next_delay() for _ in range(8)]
+        self.assertEqual(delays, [0, 0.75, 1.5, 3, 6, 7.5, 225, 225])
+        self.assertEqual(backoff.state, 'open')
+        backoff.succeeded()
+        self.assertEqual((backoff.state, backoff.next_delay()), ('closed', 0))
+
+    def test_reconnect_after_failed_attempts(self):
+        irc = FailingClient('twitch_username', 'oauth:token', send_timeout=5, backoff=Backoff(initial=0.01, jitter=0))
+        irc.create_connection()
+        try:
+            irc.server.sendall(WELCOME)
+            irc.failures = 3
+            irc.reconnect()
+            self.assertEqual(irc.backoff.attempts, 4)
+            self.assertEqual(read_lines(irc.server, 3)[0], 'PASS oauth:token')
+            irc.server.sendall(WELCOME)
+            self.assertTrue(irc._authenticated.wait(5))
+            self.assertEqual(irc.backoff.attempts, 0)
+        finally:
+            irc.shutdown()
+            irc._irc_reciever_thread.join(5)
+            irc.server.close()
+
+    def test_open_circuit_fails_fast(self):
+        irc = MockIrcClient('twitch_username', None, send_timeout=5, backoff=Backoff(failure_threshold=1))
+        irc._authenticated.clear()
+        irc.backoff.next_delay()
+        irc.backoff.next_delay()
+        with self.assertRaises(ConnectionError):
+            irc.send('PING twitchircclient\r\n')
+
+class CountingSocket:
+    """Socket that remembers every write"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.writes = []
+
+    def sendall(self, data):
+        self.writes.append(bytes(data))
+        self._sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+class CountingClient(SocketPairClient):
+
+    def _connect(self):
+        super()._connect()
+        self._sock = CountingSocket(self._sock)
+
+class OutboundTest(unittest.TestCase):
+
+    def create_client(self, **kwargs):
+        irc = CountingClient('twitch_username', 'oauth:token', send_timeout=5, **kwargs)
+        irc.create_connection()
+        self.addCleanup(irc.server.close)
+        self.addCleanup(irc._irc_reciever_thread.join, 5)
+        self.addCleanup(irc.shutdown)
+        return irc
+
+    def test_templates(self):
+        self.assertEqual(encode_privmsg('channel', 'Kappa \u00fc'), 'PRIVMSG #channel :Kappa \u00fc\r\n'.encode('utf-8'))
+        self.assertEqual(encode_pong('PING :tmi.twitch.tv'), b'PONG :tmi.twitch.tv\r\n')
+
+    def test_line_breaks_are_rejected(self):
+        irc = MockIrcClient('twitch_username', None)
+        sent = []
+        irc.set_send_reciever(sent.append)
+        with self.assertRaises(ValueError):
+            irc.sendprivmsg('channel', 'Kappa\r\nPRIVMSG #other :spam')
+        with self.assertRaises(ValueError):
+            irc.sendprivmsg('channel\n', 'Kappa')
+        with self.assertRaises(ValueError):
+            irc.join('channel\r\nPART #other')
+        with self.assertRaises(ValueError):
+            irc.join_many(['channel', 'a\r\nPRIVMSG #x :spam'])
+        with self.assertRaises(ValueError):
+            irc.part('channel\nJOIN #other')
+        with self.assertRaises(ValueError):
+            irc.part_many(['a\r\nPRIVMSG #x :spam'])
+        self.assertEqual((sent, irc.joined_channels), ([], set()))
+
+    def test_login_in_one_write(self):
+        irc = self.create_client()
+        self.assertEqual(read_lines(irc.server, 3), ['PASS oauth:token', 'NICK twitch_username',
+            'USER twitch_username twitch_username twitch_username :twitch_username'])
+        self.assertEqual(len(irc._sock.writes), 1)
+
+    def test_lines_of_a_read_in_one_write(self):
+        irc = self.create_client()
+        irc.messagespreader.add(lambda channel, username, tags, message: irc.sendprivmsg(channel, 'echo '+message))
+        read_lines(irc.server, 3)
+        writes = len(irc._sock.writes)
+        irc.server.sendall(WELCOME+b''.join(b':a!a@a.tmi.twitch.tv PRIVMSG #channel :%d\r\n'%number for number in range(3)))
+        self.assertEqual(read_lines(irc.server, 3), ['PRIVMSG #channel :echo %d'%number for number in range(3)])
+        self.assertEqual(len(irc._sock.writes), writes+1)
+
+    def test_write_delay(self):
+        irc = self.create_client(write_delay=0.05)
+        read_lines(irc.server, 3)
+        irc.server.sendall(WELCOME)
+        self.assertTrue(irc._authenticated.wait(5))
+        writes = len(irc._sock.writes)
+        for number in range(5):
+            irc.sendprivmsg('channel', str(number))
+        self.assertEqual(read_lines(irc.server, 5), ['PRIVMSG #channel :%d'%number for number in range(5)])
+        self.assertEqual(len(irc._sock.writes), writes+1)
+
+    def test_full_buffer_is_written_at_once(self):
+        writes = []
+        outbound = OutboundBuffer(writes.append, delay=10, max_size=10)
+        outbound.put(b'12345')
+        self.assertEqual(writes, [])
+        outbound.put(b'67890')
+        self.assertEqual(writes, [b'1234567890'])
+        outbound.flush()
+        self.assertEqual((outbound.lines, outbound.writes), (2, 1))
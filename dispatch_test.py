@@ -0,0 +1,84 @@
+#!/bin/python3
+
+import threading
+import unittest
+from twitchircclient import MockIrcClient
+from twitchircclient.dispatch import Dispatcher, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST
+
+class DispatcherTest(unittest.TestCase):
+
+    def test_order_per_channel(self):
+        dispatcher = Dispatcher(workers=4)
+        irc = MockIrcClient('twitch_username', None, dispatcher=dispatcher)
+        recieved = {}
+        def listener(channel, username, tags, message):
+            recieved.setdefault(channel, []).append(int(message))
+        irc.messagespreader.add(listener)
+        for i in range(200):
+            irc.mock_msg_incomming(irc.generate_mock_privmsg(channel='channel%d'%(i%7), message=str(i)))
+        dispatcher.stop()
+        self.assertEqual(sum(len(messages) for messages in recieved.values()), 200)
+        for channel, messages in recieved.items():
+            self.assertEqual(messages, sorted(messages))
+        metrics = dispatcher.metrics()
+        self.assertEqual(metrics['dispatched'], 200)
+        self.assertEqual(metrics['dropped'], 0)
+
+    def test_event_recievers(self):
+        dispatcher = Dispatcher(workers=2)
+        irc = MockIrcClient('twitch_username', None, dispatcher=dispatcher)
+        events = []
+        irc.whisperspreader.add_event(events.append)
+        irc.mock_msg_incomming(irc.generate_mock_whisper(username='user', message='hi'))
+        dispatcher.stop()
+        self.assertEqual([(event.username, event.message) for event in events], [('user', 'hi')])
+
+    def test_filtered_recievers(self):
+        dispatcher = Dispatcher(workers=2)
+        irc = MockIrcClient('twitch_username', None, dispatcher=dispatcher)
+        messages = []
+        irc.messagespreader.add(lambda **kwargs: messages.append(kwargs['message']), channel='channel1')
+        for i in range(10):
+            irc.mock_msg_incomming(irc.generate_mock_privmsg(channel='channel%d'%(i%2), message=str(i)))
+        dispatcher.stop()
+        self.assertEqual(messages, ['1', '3', '5', '7', '9'])
+        self.assertEqual(dispatcher.metrics()['dispatched'], 5)
+
+    def test_batches(self):
+        dispatcher = Dispatcher(workers=2)
+        irc = MockIrcClient('twitch_username', None, dispatcher=dispatcher)
+        batches = []
+        irc.messagespreader.add_batch(lambda events: batches.append([event.message for event in events]))
+        irc.mock_burst_incomming([irc.generate_mock_privmsg(channel='channel%d'%i, message=str(i)) for i in range(3)])
+        irc.mock_msg_incomming(irc.generate_mock_privmsg(message='3'))
+        dispatcher.stop()
+        self.assertEqual(batches, [['0', '1', '2'], ['3']])
+
+    def test_overflow(self):
+        for overflow, expected in ((OVERFLOW_DROP_OLDEST, [0, 3, 4]), (OVERFLOW_DROP_NEWEST, [0, 1, 2])):
+            dispatcher = Dispatcher(workers=1, maxsize=2, overflow=overflow)
+            blocker = threading.Event()
+            started = threading.Event()
+            called = []
+            def listener(i):
+                started.set()
+                blocker.wait(5)
+                called.append(i)
+            dispatcher.submit('channel', listener, 0)
+            started.wait(5)
+            for i in range(1, 5):
+                dispatcher.submit('channel', listener, i)
+            blocker.set()
+            dispatcher.stop()
+            self.assertEqual(called, expected)
+            self.assertEqual(dispatcher.metrics()['dropped'], 2)
+
+    def test_submit_after_stop(self):
+        dispatcher = Dispatcher(workers=2)
+        called = []
+        self.assertTrue(dispatcher.submit('channel', called.append, 0))
+        dispatcher.stop()
+        self.assertFalse(dispatcher.submit('channel', called.append, 1))
+        self.assertEqual(called, [0])
+        self.assertEqual(dispatcher.metrics()['queued'], 0)
+        self.assertFalse(any(thread.is_alive() for thread in dispatcher._threads))
@@ -0,0 +1,245 @@
+#!/bin/python3
+
+import asyncio
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from twitchircclient import TwitchIrcClient, AsyncTwitchIrcClient
+from twitchircclient.backoff import Backoff
+from twitchircclient.fakeserver import FakeTwitchServer
+from twitchircclient.metrics import ClientMetrics
+
+def wait_until(predicate, timeout=5):
+    end = time.monotonic()+timeout
+    while time.monotonic()<end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+class Collector:
+    """Collects the numbers of generated messages"""
+
+    def __init__(self):
+        self.numbers = []
+        self.lock = threading.Lock()
+
+    def __call__(self, channel, username, tags, message):
+        with self.lock:
+            self.numbers.append(int(message.split()[0]))
+
+class FakeServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTwitchServer()
+        self.server.start()
+        self.clients = []
+
+    def tearDown(self):
+        for irc in self.clients:
+            irc.shutdown()
+            irc._irc_reciever_thread.join(5)
+        self.server.stop()
+
+    def create_client(self, **kwargs):
+        irc = TwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host,
+            irc_port=self.server.port, use_ssl=False, send_timeout=5, **kwargs)
+        self.clients.append(irc)
+        return irc
+
+    def connect_and_join(self, irc, channel='channel'):
+        confirmed = threading.Event()
+        irc.joinconfirmspreader.add(lambda channel: confirmed.set())
+        irc.create_connection()
+        irc.join(channel)
+        self.assertTrue(confirmed.wait(5))
+
+    def test_no_message_loss(self):
+        irc = self.create_client(read_size=64)
+        collector = Collector()
+        irc.messagespreader.add(collector)
+        self.connect_and_join(irc)
+        self.server.split_utf8 = True
+        self.server.generate('channel', 500, message=lambda number: '%d könig \U0001F600 Kappa'%number).join()
+        self.assertTrue(wait_until(lambda: len(collector.numbers)==500))
+        self.assertEqual(collector.numbers, list(range(500)))
+
+    def test_reconnect_after_dropped_connection(self):
+        irc = self.create_client()
+        collector = Collector()
+        irc.messagespreader.add(collector)
+        self.connect_and_join(irc)
+        self.server.drop_connections()
+        self.assertTrue(wait_until(lambda: self.server.accepted==2 and self.server.members('channel')))
+        self.assertTrue(irc._authenticated.wait(5))
+        self.assertIsNotNone(irc.reconnect_latency)
+        self.server.generate('channel', 10).join()
+        self.assertTrue(wait_until(lambda: len(collector.numbers)==10))
+
+    def test_reconnect_after_stalled_read(self):
+        irc = self.create_client(socket_timeout=0.3)
+        self.connect_and_join(irc)
+        self.server.stall(1)
+        self.assertTrue(wait_until(lambda: self.server.accepted>=2))
+        #Logged in again after the stall
+        self.assertTrue(wait_until(lambda: irc._authenticated.is_set() and irc.reconnect_latency is not None))
+
+    def test_privmsg_fanout_and_rate_limit(self):
+        self.server.privmsg_limit = (5, 30)
+        sender = self.create_client()
+        reciever = self.create_client()
+        collector = Collector()
+        reciever.messagespreader.add(collector)
+        self.connect_and_join(sender)
+        self.connect_and_join(reciever)
+        for number in range(8):
+            sender.sendprivmsg('channel', str(number))
+        self.assertTrue(wait_until(lambda: self.server.dropped_privmsgs==3))
+        self.assertTrue(wait_until(lambda: len(collector.numbers)==5))
+        self.assertEqual(collector.numbers, list(range(5)))
+
+    def test_ping(self):
+        irc = self.create_client()
+        self.connect_and_join(irc)
+        irc.pingtest()
+        self.assertTrue(wait_until(lambda: 'PING twitchircclient' in self.server.recieved_lines))
+
+    def test_async_client(self):
+        collector = Collector()
+        async def run():
+            irc = AsyncTwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host,
+                irc_port=self.server.port, use_ssl=False)
+            irc.messagespreader.add(collector)
+            joined = asyncio.Event()
+            irc.joinconfirmspreader.add(lambda channel: joined.set())
+            await irc.create_connection()
+            await irc.join('channel')
+            await asyncio.wait_for(joined.wait(), 5)
+            self.server.generate('channel', 100)
+            for _ in range(500):
+                if len(collector.numbers)==100:
+                    break
+                await asyncio.sleep(0.01)
+            await irc.shutdown()
+        asyncio.run(run())
+        self.assertEqual(collector.numbers, list(range(100)))
+
+    def test_async_client_survives_failing_listener(self):
+        collector = Collector()
+        def failing(channel, username, tags, message):
+            if message=='0':
+                raise ValueError('listener failed')
+        async def run():
+            irc = AsyncTwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host,
+                irc_port=self.server.port, use_ssl=False)
+            irc.messagespreader.add(failing)
+            irc.messagespreader.add(collector)
+            joined = asyncio.Event()
+            irc.joinconfirmspreader.add(lambda channel: joined.set())
+            await irc.create_connection()
+            await irc.join('channel')
+            await asyncio.wait_for(joined.wait(), 5)
+            self.server.generate('channel', 4)
+            for _ in range(500):
+                if len(collector.numbers)==3:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertFalse(irc._reciever_task.done())
+            await irc.shutdown()
+        asyncio.run(run())
+        self.assertEqual(collector.numbers, [1, 2, 3])
+
+    def test_async_keepalive_reconnects_once(self):
+        async def run():
+            irc = AsyncTwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host,
+                irc_port=self.server.port, use_ssl=False, keepalive=0.2, keepalive_timeout=0.2)
+            connected = asyncio.Event()
+            irc.connectspreader.add(connected.set)
+            await irc.create_connection()
+            await asyncio.wait_for(connected.wait(), 5)
+            connected.clear()
+            self.server.stall(0.5)
+            await asyncio.wait_for(connected.wait(), 5)
+            #A second reconnect would wait for the backoff
+            await asyncio.sleep(1.5)
+            await irc.shutdown()
+            return irc
+        irc = asyncio.run(run())
+        self.assertEqual(self.server.accepted, 2)
+        self.assertEqual(irc.backoff.attempts, 0)
+
+    def test_async_shutdown_during_backoff(self):
+        async def run():
+            irc = AsyncTwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host,
+                irc_port=self.server.port, use_ssl=False, backoff=Backoff(initial=60, jitter=0))
+            await irc.create_connection()
+            self.server.stop()
+            for _ in range(500):
+                if irc.backoff.attempts==2:
+                    break
+                await asyncio.sleep(0.01)
+            #The reciever waits 60 seconds for the next attempt
+            start = time.monotonic()
+            await asyncio.wait_for(irc.shutdown(), 5)
+            return time.monotonic()-start
+        self.assertLess(asyncio.run(run()), 1)
+
+@unittest.skipIf(shutil.which('openssl') is None, 'openssl is needed to create a certificate')
+class FakeTLSServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.certfile = os.path.join(self.tempdir, 'cert.pem')
+        self.keyfile = os.path.join(self.tempdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+            '-keyout', self.keyfile, '-out', self.certfile], check=True, capture_output=True)
+        self.server = FakeTwitchServer(certfile=self.certfile, keyfile=self.keyfile)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+
+    def test_tls_connection(self):
+        #The default SSLContext doesn't verify the certificate
+        irc = TwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host, irc_port=self.server.port, send_timeout=5)
+        collector = Collector()
+        irc.messagespreader.add(collector)
+        confirmed = threading.Event()
+        irc.joinconfirmspreader.add(lambda channel: confirmed.set())
+        try:
+            irc.create_connection()
+            irc.join('channel')
+            self.assertTrue(confirmed.wait(5))
+            self.server.generate('channel', 50).join()
+            self.assertTrue(wait_until(lambda: len(collector.numbers)==50))
+        finally:
+            irc.shutdown()
+            irc._irc_reciever_thread.join(5)
+
+    def test_session_resumption(self):
+        metrics = ClientMetrics()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        irc = TwitchIrcClient('twitch_username', 'oauth:test', irc_hostname=self.server.host, irc_port=self.server.port,
+            send_timeout=5, ssl_context=context, metrics=metrics)
+        try:
+            irc.create_connection()
+            self.assertTrue(irc._authenticated.wait(5))
+            self.assertFalse(irc.tls_session_reused)
+            self.server.drop_connections()
+            self.assertTrue(wait_until(lambda: self.server.accepted==2 and irc._authenticated.is_set()))
+            self.assertTrue(irc.tls_session_reused)
+            self.assertIs(irc._get_ssl_context(), context)
+            self.assertGreater(irc.tls_handshake_time, 0)
+            snapshot = metrics.snapshot()
+            self.assertEqual((snapshot['tls_handshake_time']['count'], snapshot['tls_resumed']), (2, 1))
+        finally:
+            irc.shutdown()
+            irc._irc_reciever_thread.join(5)
@@ -0,0 +1,62 @@
+#!/bin/python3
+
+import unittest
+from twitchircclient import MockIrcClient
+from twitchircclient.metrics import ClientMetrics
+from twitchircclient.ratelimit import SendQueue
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.slow = []
+        self.metrics = ClientMetrics(listener_budget=0.5, on_slow_listener=lambda name, seconds: self.slow.append((name, seconds)), clock=self.clock)
+        self.irc = MockIrcClient('twitch_username', None, metrics=self.metrics)
+
+    def test_lines_per_command(self):
+        def messagelistener(channel, username, tags, message):
+            self.clock.now += 1
+        self.irc.messagespreader.add(messagelistener)
+        self.irc.mock_msg_incomming('@color= :user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa')
+        self.irc.mock_msg_incomming(':user!user@user.tmi.twitch.tv PART #channel')
+        self.irc.mock_msg_incomming('PING :tmi.twitch.tv')
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['lines'], {'PRIVMSG': 1, 'PART': 1, 'PING': 1})
+        self.assertEqual(snapshot['bytes']['PING'], len('PING :tmi.twitch.tv\r\n'))
+        #The skipped PART and the PING are neither parsed nor dispatched
+        self.assertEqual(snapshot['parse_time']['count'], 1)
+        self.assertEqual(snapshot['dispatch_time']['count'], 1)
+        self.assertEqual(snapshot['dispatch_time']['sum'], 1)
+        name = messagelistener.__qualname__
+        self.assertEqual(snapshot['listeners'][name], {'calls': 1, 'seconds': 1, 'max': 1, 'slow': 1})
+        self.assertEqual(self.slow, [(name, 1)])
+
+    def test_send_wait(self):
+        self.irc.send_queue = SendQueue(self.irc.send, clock=self.clock)
+        self.irc.send_queue.on_sent = self.metrics.line_sent
+        self.irc.sendprivmsg('channel', 'Kappa')
+        self.clock.now = 0.002
+        self.irc.send_queue.process()
+        self.assertEqual(self.metrics.snapshot()['send_wait']['buckets'][0.005], 1)
+
+    def test_prometheus(self):
+        self.irc.messagespreader.add(lambda **kwargs: None)
+        self.irc.mock_msg_incomming('@color= :user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa')
+        text = self.metrics.prometheus()
+        self.assertIn('twitchircclient_lines_total{command="PRIVMSG"} 1\n', text)
+        self.assertIn('twitchircclient_parse_time_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('twitchircclient_parse_time_seconds_count 1\n', text)
+        self.assertIn('# TYPE twitchircclient_dispatch_time_seconds histogram\n', text)
+        self.assertIn('twitchircclient_listener_calls_total{listener="MetricsTest.test_prometheus.<locals>.<lambda>"} 1\n', text)
+
+    def test_disabled(self):
+        irc = MockIrcClient('twitch_username', None)
+        self.assertNotIn('_call', vars(irc.messagespreader))
@@ -0,0 +1,72 @@
+#!/bin/python3
+
+import unittest
+from twitchircclient import MockIrcClient, TwitchIrcClientPool
+from twitchircclient.pool import STRATEGY_LOAD
+
+WELCOME = ':tmi.twitch.tv 001 twitch_username :Welcome, GLHF!'
+
+class PoolTest(unittest.TestCase):
+
+    def create_pool(self, strategy):
+        pool = TwitchIrcClientPool('twitch_username', None, size=3, strategy=strategy, client_class=MockIrcClient)
+        self.sent = [[] for shard in pool.shards]
+        for index, shard in enumerate(pool.shards):
+            shard.set_send_reciever(self.sent[index].append)
+        return pool
+
+    def test_shared_spreaders(self):
+        pool = self.create_pool('hash')
+        recieved = []
+        pool.messagespreader.add(lambda channel, username, tags, message: recieved.append(message))
+        for index, shard in enumerate(pool.shards):
+            shard.mock_msg_incomming(shard.generate_mock_privmsg(message=str(index)))
+        self.assertEqual(recieved, ['0', '1', '2'])
+
+    def test_shared_ssl_context(self):
+        pool = self.create_pool('hash')
+        contexts = set(id(shard._get_ssl_context()) for shard in pool.shards)
+        self.assertEqual(len(contexts), 1)
+
+    def test_hash_assignment(self):
+        pool = self.create_pool('hash')
+        channels = ['channel%d'%i for i in range(30)]
+        pool.join_many(channels)
+        self.assertEqual(set(pool.channels), set(channels))
+        self.assertEqual(len(set(pool.channels.values())), 3)
+        for channel in channels:
+            shard = pool.shard_for(channel)
+            self.assertIn(channel, shard.joined_channels)
+        pool.sendprivmsg('channel7', 'Kappa')
+        index = pool.channels['channel7']
+        self.assertEqual(self.sent[index][-1], 'PRIVMSG #channel7 :Kappa\r\n')
+        #the same channels always land on the same connection
+        other = self.create_pool('hash')
+        other.join_many(channels)
+        self.assertEqual(other.channels, pool.channels)
+
+    def test_shared_rate_limits(self):
+        pool = TwitchIrcClientPool('twitch_username', None, size=4, strategy=STRATEGY_LOAD, client_class=MockIrcClient, rate_limit=True)
+        sent = []
+        for shard in pool.shards:
+            shard.set_send_reciever(sent.append)
+        for i in range(40):
+            pool.join('channel%d'%i)
+        for shard in pool.shards:
+            shard.send_queue.process()
+        #20 joins per 10 seconds for the account, not for every connection
+        self.assertEqual(len(sent), 20)
+        self.assertEqual(len(set(id(shard.send_queue.account_limits) for shard in pool.shards)), 1)
+
+    def test_rebalance_after_reconnect(self):
+        pool = self.create_pool(STRATEGY_LOAD)
+        down = pool.shards[0]
+        down.disconnectspreader.spread()
+        pool.join_many('channel%d'%i for i in range(10))
+        self.assertEqual(len(down.joined_channels), 0)
+        down.mock_msg_incomming(WELCOME)
+        loads = [len(shard.joined_channels) for shard in pool.shards]
+        self.assertEqual(sorted(loads), [3, 3, 4])
+        self.assertEqual(sum(loads), 10)
+        self.assertEqual(len(self.sent[0]), 3)
+        self.assertTrue(all(line.startswith('JOIN') for line in self.sent[0]))
@@ -0,0 +1,152 @@
+#!/bin/python3
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from twitchircclient import TwitchIrcClient
+from twitchircclient.fakeserver import FakeTwitchServer
+from twitchircclient.reactor import Reactor
+from fakeserver_test import Collector, wait_until
+
+class ReactorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTwitchServer()
+        self.server.start()
+        self.reactor = Reactor()
+        self.reactor.start()
+        self.clients = []
+
+    def tearDown(self):
+        for irc in self.clients:
+            irc.shutdown()
+        self.reactor.stop()
+        self.server.stop()
+
+    def create_client(self, username='twitch_username', **kwargs):
+        irc = TwitchIrcClient(username, 'oauth:test', irc_hostname=self.server.host, irc_port=self.server.port,
+            use_ssl=False, send_timeout=5, reactor=self.reactor, **kwargs)
+        self.clients.append(irc)
+        return irc
+
+    def test_many_clients(self):
+        collectors = []
+        confirmed = threading.Semaphore(0)
+        for index in range(20):
+            irc = self.create_client('user%d'%index)
+            collector = Collector()
+            irc.messagespreader.add(collector)
+            irc.joinconfirmspreader.add(lambda channel: confirmed.release())
+            collectors.append(collector)
+            irc.create_connection()
+            irc.join('channel')
+        for _ in range(20):
+            self.assertTrue(confirmed.acquire(timeout=5))
+        self.assertEqual(self.reactor._thread.name, 'twitchircclient-reactor')
+        self.server.generate('channel', 100).join()
+        self.assertTrue(wait_until(lambda: all(len(collector.numbers)==100 for collector in collectors)))
+        for collector in collectors:
+            self.assertEqual(collector.numbers, list(range(100)))
+
+    def test_send_from_listener(self):
+        #Listeners run in the reactor thread, sending from there must not wait
+        sender = self.create_client('sender')
+        echo = self.create_client('echo')
+        echo.messagespreader.add(lambda channel, username, tags, message: echo.sendprivmsg(channel, 'echo '+message))
+        collector = Collector()
+        sender.messagespreader.add(lambda channel, username, tags, message: collector(channel, username, tags, message.split()[1]))
+        for irc in (sender, echo):
+            confirmed = threading.Event()
+            irc.joinconfirmspreader.add(lambda channel: confirmed.set())
+            irc.create_connection()
+            irc.join('channel')
+            self.assertTrue(confirmed.wait(5))
+        for number in range(3):
+            sender.sendprivmsg('channel', str(number))
+        self.assertTrue(wait_until(lambda: len(collector.numbers)==3))
+        self.assertEqual(collector.numbers, [0, 1, 2])
+
+    def test_write_delay(self):
+        sender = self.create_client('sender', write_delay=0.02)
+        reader = self.create_client('reader')
+        collector = Collector()
+        reader.messagespreader.add(collector)
+        for irc in (sender, reader):
+            confirmed = threading.Event()
+            irc.joinconfirmspreader.add(lambda channel: confirmed.set())
+            irc.create_connection()
+            irc.join('channel')
+            self.assertTrue(confirmed.wait(5))
+        for number in range(5):
+            sender.sendprivmsg('channel', str(number))
+        self.assertTrue(wait_until(lambda: len(collector.numbers)==5))
+        self.assertEqual(collector.numbers, list(range(5)))
+
+    def test_reconnect(self):
+        irc = self.create_client()
+        collector = Collector()
+        irc.messagespreader.add(collector)
+        confirmed = threading.Event()
+        irc.joinconfirmspreader.add(lambda channel: confirmed.set())
+        irc.create_connection()
+        irc.join('channel')
+        self.assertTrue(confirmed.wait(5))
+        self.server.drop_connections()
+        self.assertTrue(wait_until(lambda: self.server.accepted==2 and self.server.members('channel')))
+        self.assertTrue(irc._authenticated.wait(5))
+        self.server.generate('channel', 10).join()
+        self.assertTrue(wait_until(lambda: len(collector.numbers)==10))
+
+    def test_keepalive(self):
+        irc = self.create_client(keepalive=0.05)
+        health = []
+        irc.healthspreader.add_event(health.append)
+        irc.create_connection()
+        self.assertTrue(wait_until(lambda: len(health)>=2))
+        self.assertTrue(all(event.healthy for event in health))
+        self.assertIsNone(irc._keepalive_thread)
+
+@unittest.skipIf(shutil.which('openssl') is None, 'openssl is needed to create a certificate')
+class ReactorTLSTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        certfile = os.path.join(self.tempdir, 'cert.pem')
+        keyfile = os.path.join(self.tempdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+            '-keyout', keyfile, '-out', certfile], check=True, capture_output=True)
+        self.server = FakeTwitchServer(certfile=certfile, keyfile=keyfile)
+        self.server.start()
+        self.reactor = Reactor()
+        self.reactor.start()
+
+    def tearDown(self):
+        self.reactor.stop()
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+
+    def test_tls_connections(self):
+        clients = [TwitchIrcClient('user%d'%index, 'oauth:test', irc_hostname=self.server.host, irc_port=self.server.port,
+            send_timeout=5, reactor=self.reactor) for index in range(3)]
+        collectors = []
+        try:
+            for irc in clients:
+                collector = Collector()
+                irc.messagespreader.add(collector)
+                collectors.append(collector)
+                confirmed = threading.Event()
+                irc.joinconfirmspreader.add(lambda channel: confirmed.set())
+                irc.create_connection()
+                irc.join('channel')
+                self.assertTrue(confirmed.wait(5))
+            #Bursts bigger than a TLS record
+            self.server.generate('channel', 300, message=lambda number: '%d %s'%(number, 'Kappa '*50)).join()
+            self.assertTrue(wait_until(lambda: all(len(collector.numbers)==300 for collector in collectors)))
+            for collector in collectors:
+                self.assertEqual(collector.numbers, list(range(300)))
+        finally:
+            for irc in clients:
+                irc.shutdown()
@@ -0,0 +1,81 @@
+#!/bin/python3
+
+import os
+import shutil
+import tempfile
+import unittest
+from twitchircclient import MockIrcClient
+from twitchircclient.recorder import TrafficRecorder, ReplayClient, read_records
+
+LINES = [
+    '@badges=;color=;emotes=25:0-4 :user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa könig',
+    ':user!user@user.tmi.twitch.tv JOIN #channel',
+    'PING :tmi.twitch.tv',
+    '@login=user;target-msg-id=1 :tmi.twitch.tv CLEARMSG #channel :Kappa',
+    ':user!user@user.tmi.twitch.tv PRIVMSG #channel :second',
+]
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'traffic.tirc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def record(self, compress):
+        clock = FakeClock()
+        with TrafficRecorder(self.path, compress=compress, block_size=128, clock=clock) as recorder:
+            irc = MockIrcClient('twitch_username', None, recorder=recorder)
+            for line in LINES:
+                clock.now += 0.5
+                irc.mock_msg_incomming(line)
+
+    def test_read_records(self):
+        for compress in (False, True):
+            self.record(compress)
+            self.assertEqual(list(read_records(self.path)), [(0.5*(i+1), line) for i, line in enumerate(LINES)])
+            os.remove(self.path)
+
+    def test_append(self):
+        self.record(True)
+        self.record(False)
+        self.assertEqual([line for timestamp, line in read_records(self.path)], LINES+LINES)
+
+    def test_not_a_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'PING\r\n')
+        with self.assertRaises(ValueError):
+            list(read_records(self.path))
+
+    def test_replay(self):
+        self.record(True)
+        irc = ReplayClient(self.path, 'twitch_username')
+        messages = []
+        irc.messagespreader.add(lambda channel, username, tags, message: messages.append(message))
+        sent = []
+        irc.set_send_reciever(sent.append)
+        self.assertEqual(irc.replay(), 5)
+        self.assertEqual(messages, ['Kappa könig', 'second'])
+        self.assertEqual(sent, ['PONG :tmi.twitch.tv\r\n'])
+
+    def test_replay_realtime(self):
+        self.record(False)
+        clock = FakeClock()
+        irc = ReplayClient(self.path)
+        times = []
+        irc.messagespreader.add(lambda **kwargs: times.append(clock.now))
+        irc.replay(realtime=True, speed=2, sleep=clock.sleep, clock=clock)
+        self.assertEqual(times, [0, 1])
@@ -1,7 +1,12 @@
 #!/bin/python3
 
+import json
 import unittest
 from twitchircclient import TwitchIrcClient
+from twitchircclient.twitchircclient import TagDict
+from twitchircclient.events import PrivMsg, Join, JoinConfirm
+from twitchircclient.tagviews import EmoteIndex, BadgeList
+from twitchircclient.intern import InternTable
 
 class ExpectedException(Exception):
     
@@ -192,7 +197,7 @@ class RegexTest(unittest.TestCase):
         try:
             self.irc._handle_incomming(msg)
         except ExpectedException as e:
-            self.assertEqual(e.message,'PONG tmi.twitch.tv\r\n')
+            self.assertEqual(e.message,b'PONG tmi.twitch.tv\r\n')
             
     def testHOST1(self):
         hostlistener=listenerbuilder(self, channel='hosting_channel', target='target_channel', viewers='42')
@@ -236,3 +241,191 @@ class RegexTest(unittest.TestCase):
             assert self.handled_message
         finally:
             self.irc.nameslistspreader.remove(nameslistlistener)
+
+    def testGAINOPERATOR(self):
+        operatorlistener=listenerbuilder(self, channel='channel', username='operator_user')
+        self.irc.gainoperatorspreader.add(operatorlistener)
+        msg=':jtv MODE #channel +o operator_user'
+        try:
+            self.irc._handle_incomming(msg)
+            assert self.handled_message
+        finally:
+            self.irc.gainoperatorspreader.remove(operatorlistener)
+
+    def testLOOSEOPERATOR(self):
+        operatorlistener=listenerbuilder(self, channel='channel', username='operator_user')
+        self.irc.looseoperatorspreader.add(operatorlistener)
+        msg=':jtv MODE #channel -o operator_user'
+        try:
+            self.irc._handle_incomming(msg)
+            assert self.handled_message
+        finally:
+            self.irc.looseoperatorspreader.remove(operatorlistener)
+
+    def test_unknown_lines(self):
+        #Unknown or malformed lines must not reach any spreader
+        msglistener=listenerbuilder(self)
+        self.irc.messagespreader.add(msglistener)
+        self.irc.clearchatspreader.add(msglistener)
+        try:
+            for msg in (':tmi.twitch.tv 001 twitch_username :Welcome, GLHF!',
+                    '@badges=',
+                    ':tmi.twitch.tv',
+                    ':twitch_username!twitch_username@twitch_username.tmi.twitch.tv PRIVMSG twitch_username',
+                    '@room-id=1337 :tmi.twitch.tv CLEARCHAT #channel'):
+                self.irc._handle_incomming(msg)
+            assert not self.handled_message
+        finally:
+            self.irc.messagespreader.remove(msglistener)
+            self.irc.clearchatspreader.remove(msglistener)
+
+class EventTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = MockIrcClient()
+
+    def test_event_recievers(self):
+        events = []
+        kwargs = []
+        self.irc.messagespreader.add_event(events.append)
+        self.irc.messagespreader.add(lambda **event: kwargs.append(event))
+        self.irc._handle_incomming('@color=#0D4200 :ronni!ronni@ronni.tmi.twitch.tv PRIVMSG #dallas :Kappa')
+        self.assertEqual(events, [PrivMsg('ronni', 'dallas', {'color':'#0D4200'}, 'Kappa')])
+        self.assertEqual(events[0].message, 'Kappa')
+        self.assertEqual(kwargs, [{'username':'ronni', 'channel':'dallas', 'tags':{'color':'#0D4200'}, 'message':'Kappa'}])
+        with self.assertRaises(AttributeError):
+            events[0].other = 1
+
+    def test_join_confirm_event(self):
+        events = []
+        self.irc.joinconfirmspreader.add_event(events.append)
+        self.irc.joinspreader.add_event(events.append)
+        self.irc._handle_incomming(':twitch_username!twitch_username@twitch_username.tmi.twitch.tv JOIN #channel')
+        self.assertEqual(events, [Join('twitch_username', 'channel'), JoinConfirm('channel')])
+
+    def test_filtered_recievers(self):
+        recieved = []
+        spreader = self.irc.messagespreader
+        def listener(name):
+            return lambda **kwargs: recieved.append((name, kwargs['message']))
+        dallas = listener('dallas')
+        spreader.add(listener('all'))
+        spreader.add(dallas, channel='Dallas')
+        spreader.add(listener('ronni'), username='ronni')
+        spreader.add_event(lambda event: recieved.append(('event', event.message)), channel='other')
+        self.irc._handle_incomming(':ronni!ronni@ronni.tmi.twitch.tv PRIVMSG #dallas :a')
+        self.irc._handle_incomming(':user!user@user.tmi.twitch.tv PRIVMSG #other :b')
+        self.irc._handle_incomming(':user!user@user.tmi.twitch.tv PRIVMSG #third :c')
+        self.assertEqual(recieved, [('all', 'a'), ('dallas', 'a'), ('ronni', 'a'), ('event', 'b'), ('all', 'b'), ('all', 'c')])
+        spreader.remove(dallas, channel='dallas')
+        self.assertNotIn('dallas', spreader._channel_recievers)
+        with self.assertRaises(ValueError):
+            spreader.remove(dallas, channel='dallas')
+        with self.assertRaises(ValueError):
+            spreader.add(dallas, channel='dallas', username='ronni')
+
+class TagDictTest(unittest.TestCase):
+
+    def test_equal_to_dict(self):
+        tags = TagDict('badges=staff/1,bits/1000;color=;system-msg=a\\sb\\:c')
+        expected = {'badges':'staff/1,bits/1000','color':'','system-msg':'a b;c'}
+        self.assertEqual(tags, expected)
+        self.assertEqual(expected, tags)
+        self.assertEqual(len(tags), 3)
+        self.assertEqual(list(tags), ['badges','color','system-msg'])
+        self.assertEqual(TagDict(''), {})
+
+    def test_lazy_lookup(self):
+        tags = TagDict('bits=100;badges=bits/1000;id=1')
+        self.assertIsNone(tags._cache)
+        self.assertEqual(tags['badges'], 'bits/1000')
+        self.assertEqual(tags._cache, {'badges':'bits/1000'})
+        #a key that is only a suffix of another key doesn't match
+        self.assertNotIn('its', tags)
+        self.assertNotIn('d', tags)
+        self.assertIn('id', tags)
+        self.assertEqual(tags.get('missing','default'), 'default')
+        with self.assertRaises(KeyError):
+            tags['missing']
+
+    def test_tags_without_value(self):
+        for raw in ('flag;a=1', 'a=1;flag', 'a=1;flag;b=2', 'flag'):
+            tags = TagDict(raw)
+            self.assertEqual(tags['flag'], '')
+            self.assertIn('flag', tags)
+        self.assertEqual(dict(TagDict('flag;a=1')), {'flag':'', 'a':'1'})
+        self.assertNotIn('fla', TagDict('flag;a=1'))
+
+    def test_copy_for_json(self):
+        irc = MockIrcClient()
+        recieved = []
+        irc.messagespreader.add(lambda tags, **kwargs: recieved.append(tags))
+        irc._handle_incomming('@badges=moderator/1;flag;system-msg=a\\sb :ronni!ronni@ronni.tmi.twitch.tv PRIVMSG #dallas :Kappa')
+        tags = recieved[0]
+        #Keyword recievers get the TagDict itself, it isn't parsed until it is read
+        self.assertIsInstance(tags, TagDict)
+        self.assertIsNone(tags._cache)
+        with self.assertRaises(TypeError):
+            json.dumps(tags)
+        copy = tags.copy()
+        self.assertIs(type(copy), dict)
+        self.assertEqual(json.loads(json.dumps(copy)), {'badges':'moderator/1', 'flag':'', 'system-msg':'a b'})
+
+class TagViewTest(unittest.TestCase):
+
+    def test_emote_index(self):
+        index = EmoteIndex('25:0-4,12-16/1902:6-10')
+        self.assertEqual(list(index), [('25', 0, 4), ('1902', 6, 10), ('25', 12, 16)])
+        self.assertEqual(index[1], ('1902', 6, 10))
+        self.assertEqual(index.count('25'), 2)
+        self.assertEqual(index.count('1'), 0)
+        message = 'Kappa Keepo Kappa!'
+        self.assertEqual([(message[start:end], emote) for start, end, emote in index.segments(message)],
+            [('Kappa', '25'), (' ', None), ('Keepo', '1902'), (' ', None), ('Kappa', '25'), ('!', None)])
+        self.assertEqual(len(EmoteIndex('')), 0)
+        self.assertEqual(list(EmoteIndex('').segments('text')), [(0, 4, None)])
+
+    def test_badge_list(self):
+        badges = BadgeList.parse('subscriber/12,bits/1000')
+        self.assertEqual(list(badges), [('subscriber', '12'), ('bits', '1000')])
+        self.assertEqual(badges.get('bits'), '1000')
+        self.assertIn('subscriber', badges)
+        self.assertNotIn('staff', badges)
+        #The pairs are shared with other badge lists
+        self.assertIs(BadgeList.parse('bits/1000').pairs[0], badges.pairs[1])
+
+    def test_views_are_shared(self):
+        irc = MockIrcClient()
+        events = []
+        irc.messagespreader.add_event(events.append)
+        irc.messagespreader.add(lambda tags, **kwargs: events.append(tags))
+        irc._handle_incomming('@badges=moderator/1;emotes=25:0-4 :ronni!ronni@ronni.tmi.twitch.tv PRIVMSG #dallas :Kappa')
+        event, tags = events
+        self.assertIs(event.emotes, tags.emote_index())
+        self.assertEqual(list(event.emotes), [('25', 0, 4)])
+        self.assertEqual(event.badges.get('moderator'), '1')
+
+class InternTableTest(unittest.TestCase):
+
+    def test_bounded(self):
+        table = InternTable(2)
+        first = table.intern(''.join(['user', 'a']))
+        self.assertIs(table.intern(''.join(['user', 'a'])), first)
+        table.intern('userb')
+        table.intern('userc')
+        #userc started a new generation, usera is still in the previous one and moves back
+        self.assertIs(table.intern(''.join(['user', 'a'])), first)
+        table.intern('userd')
+        table.intern('usere')
+        self.assertNotIn('userb', table)
+        self.assertLessEqual(len(table), 4)
+
+    def test_client_shares_strings(self):
+        irc = MockIrcClient()
+        events = []
+        irc.messagespreader.add_event(events.append)
+        for _ in range(2):
+            irc._handle_incomming('@color= :ronni!ronni@ronni.tmi.twitch.tv PRIVMSG #dallas :Kappa')
+        self.assertIs(events[0].username, events[1].username)
+        self.assertIs(events[0].channel, events[1].channel)
+        self.assertIs(list(events[0].tags)[0], list(events[1].tags)[0])
@@ -0,0 +1,104 @@
+#!/bin/python3
+
+import threading
+import time
+import unittest
+from twitchircclient import MockIrcClient, HotStandbyClient
+
+WELCOME = ':tmi.twitch.tv 001 twitch_username :Welcome, GLHF!'
+
+def privmsg(number, channel='channel'):
+    return MockIrcClient.generate_mock_privmsg(channel=channel, message=str(number), tags={'id': 'id-%d'%number})
+
+class HotStandbyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = HotStandbyClient('twitch_username', None, client_class=MockIrcClient)
+        self.primary, self.secondary = self.irc.connections
+        self.sent = [[], []]
+        for index, conn in enumerate(self.irc.connections):
+            conn.set_send_reciever(self.sent[index].append)
+            conn.mock_msg_incomming(WELCOME)
+
+    def test_messages_are_spread_once(self):
+        messages = []
+        self.irc.messagespreader.add(lambda channel, username, tags, message: messages.append(message))
+        for number in range(3):
+            self.primary.mock_msg_incomming(privmsg(number))
+        #The standby is behind, then ahead
+        for number in range(5):
+            self.secondary.mock_msg_incomming(privmsg(number))
+        self.primary.mock_msg_incomming(privmsg(3))
+        self.primary.mock_msg_incomming(privmsg(4))
+        self.assertEqual(messages, ['0', '1', '2', '3', '4'])
+        self.assertEqual(self.irc.duplicates, 5)
+
+    def test_threads_spread_in_order(self):
+        messages = []
+        overlaps = []
+        inside = threading.Lock()
+        def listener(channel, username, tags, message):
+            if not inside.acquire(blocking=False):
+                overlaps.append(message)
+                return
+            try:
+                #Gives the other thread the chance to spread at the same time
+                time.sleep(0.0001)
+                messages.append(int(message))
+            finally:
+                inside.release()
+        self.irc.messagespreader.add(listener)
+        lines = [privmsg(number) for number in range(300)]
+        def feed(conn):
+            for line in lines:
+                conn.mock_msg_incomming(line)
+        threads = [threading.Thread(target=feed, args=(conn,)) for conn in self.irc.connections]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(messages, list(range(300)))
+        self.assertEqual(self.irc.duplicates, 300)
+
+    def test_other_events_from_the_active_connection(self):
+        joins = []
+        self.irc.joinspreader.add(lambda channel, username: joins.append(username))
+        for conn in self.irc.connections:
+            conn.mock_msg_incomming(':user!user@user.tmi.twitch.tv JOIN #channel')
+        self.assertEqual(joins, ['user'])
+        #The standby doesn't parse the lines at all
+        self.irc.partspreader.add(lambda channel, username: None)
+        self.assertNotIn('PART', self.primary._skipped_commands)
+        self.assertIn('PART', self.secondary._skipped_commands)
+
+    def test_shared_join_limit(self):
+        irc = HotStandbyClient('twitch_username', None, client_class=MockIrcClient, rate_limit=True)
+        sent = []
+        for conn in irc.connections:
+            conn.set_send_reciever(sent.append)
+        for i in range(15):
+            irc.join('channel%d'%i)
+        for conn in irc.connections:
+            conn.send_queue.process()
+        #Both connections join every channel, together within 20 joins per 10 seconds
+        self.assertEqual(len(sent), 20)
+
+    def test_failover(self):
+        failovers = []
+        self.irc.failoverspreader.add(lambda: failovers.append(self.irc.active))
+        self.irc.join('channel')
+        self.assertEqual((self.sent[0], self.sent[1]), (['JOIN #channel\r\n'], ['JOIN #channel\r\n']))
+        self.primary.disconnectspreader.spread()
+        self.assertEqual(failovers, [self.secondary])
+        self.irc.sendprivmsg('channel', 'Kappa')
+        self.assertEqual(self.sent[1][-1], 'PRIVMSG #channel :Kappa\r\n')
+        joins = []
+        self.irc.joinspreader.add(lambda channel, username: joins.append(username))
+        self.primary.mock_msg_incomming(':old!old@old.tmi.twitch.tv JOIN #channel')
+        self.secondary.mock_msg_incomming(':new!new@new.tmi.twitch.tv JOIN #channel')
+        self.assertEqual(joins, ['new'])
+        #Losing the standby doesn't switch
+        self.primary.disconnectspreader.spread()
+        self.assertIs(self.irc.active, self.secondary)
+        self.assertEqual(self.irc.failovers, 1)
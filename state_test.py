@@ -0,0 +1,64 @@
+#!/bin/python3
+
+import unittest
+from twitchircclient import MockIrcClient
+
+def names_line(channel, names):
+    return ':twitch_username.tmi.twitch.tv 353 twitch_username = #%s :%s'%(channel, ' '.join(names))
+
+class ChannelStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.irc = MockIrcClient('twitch_username', None, track_state=True)
+        self.irc.mock_msg_incomming(':twitch_username!twitch_username@twitch_username.tmi.twitch.tv JOIN #channel')
+
+    def test_roomstate(self):
+        self.irc.mock_msg_incomming('@emote-only=0;followers-only=-1;r9k=0;room-id=1337;slow=0;subs-only=0 :tmi.twitch.tv ROOMSTATE #channel')
+        state = self.irc.state['Channel']
+        self.assertEqual((state.slow, state.followers_only, state.subs_only), (0, -1, False))
+        #Changes only contain the changed tag
+        self.irc.mock_msg_incomming('@room-id=1337;slow=10 :tmi.twitch.tv ROOMSTATE #channel')
+        self.irc.mock_msg_incomming('@followers-only=0;room-id=1337 :tmi.twitch.tv ROOMSTATE #channel')
+        self.assertEqual((state.slow, state.followers_only, state.r9k), (10, 0, False))
+
+    def test_userstate(self):
+        self.assertFalse(self.irc.state['channel'].is_moderator)
+        self.irc.mock_msg_incomming('@badges=moderator/1;color=;display-name=twitch_username;mod=1 :tmi.twitch.tv USERSTATE #channel')
+        self.assertTrue(self.irc.state['channel'].is_moderator)
+
+    def test_members(self):
+        ended = []
+        self.irc.nameslistendspreader.add(lambda channel, names: ended.append((channel, names)))
+        self.irc.mock_msg_incomming(names_line('channel', ['user%d'%i for i in range(3)]))
+        self.irc.mock_msg_incomming(':late!late@late.tmi.twitch.tv JOIN #channel')
+        self.irc.mock_msg_incomming(names_line('channel', ['user3']))
+        #Not merged before the end of the list
+        self.assertFalse(self.irc.state.is_member('channel', 'user0'))
+        self.irc.mock_msg_incomming(':twitch_username.tmi.twitch.tv 366 twitch_username #channel :End of /NAMES list')
+        self.assertEqual(ended, [('channel', ['user0', 'user1', 'user2', 'user3'])])
+        self.assertTrue(self.irc.state.is_member('channel', 'User0'))
+        self.assertTrue(self.irc.state.is_member('channel', 'late'))
+        self.irc.mock_msg_incomming(':user0!user0@user0.tmi.twitch.tv PART #channel')
+        self.assertFalse(self.irc.state.is_member('channel', 'user0'))
+        self.assertEqual(len(self.irc.state['channel'].members), 5)
+        #Our own PART forgets the channel
+        self.irc.mock_msg_incomming(':twitch_username!twitch_username@twitch_username.tmi.twitch.tv PART #channel')
+        self.assertNotIn('channel', self.irc.state)
+        self.assertFalse(self.irc.state.is_member('channel', 'user1'))
+
+    def test_usernames_are_interned(self):
+        self.irc.mock_msg_incomming(':twitch_username!twitch_username@twitch_username.tmi.twitch.tv JOIN #other')
+        for channel in ('channel', 'other'):
+            self.irc.mock_msg_incomming(names_line(channel, [''.join(['some', 'user'])]))
+            self.irc.mock_msg_incomming(':twitch_username.tmi.twitch.tv 366 twitch_username #%s :End of /NAMES list'%channel)
+        first, = [name for name in self.irc.state['channel'].members if name=='someuser']
+        second, = [name for name in self.irc.state['other'].members if name=='someuser']
+        self.assertIs(first, second)
+
+    def test_state_commands_are_not_skipped(self):
+        #No recievers, but the store needs the lines
+        self.irc.mock_msg_incomming(':user!user@user.tmi.twitch.tv JOIN #channel')
+        self.irc.mock_msg_incomming('@slow=5 :tmi.twitch.tv ROOMSTATE #channel')
+        self.assertTrue(self.irc.state.is_member('channel', 'user'))
+        self.assertEqual(self.irc.state['channel'].slow, 5)
+        self.assertEqual(self.irc._needed_capabilities(), {'twitch.tv/membership', 'twitch.tv/commands', 'twitch.tv/tags'})
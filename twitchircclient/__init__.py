@@ -1,2 +1,5 @@
 from .twitchircclient import TwitchIrcClient
 from .mockircclient import MockIrcClient
+from .asyncircclient import AsyncTwitchIrcClient
+from .pool import TwitchIrcClientPool
+from .standby import HotStandbyClient
@@ -0,0 +1,346 @@
+"""
+Twitch Client Library, asyncio version
+"""
+
+import asyncio
+import collections
+import ssl
+from .twitchircclient import TwitchIrcClient, EventSpreader, _pack_channels, KEEPALIVE_RECONNECT
+from .outbound import encode_privmsg, encode_join, encode_part, encode_pong
+
+class AsyncEventSpreader(EventSpreader):
+    """
+    EventSpreader whose recievers can also be coroutine functions
+    The coroutines are collected in pending and awaited by the AsyncTwitchIrcClient
+    in the order the events came in
+    """
+    def __init__(self, pending):
+        super().__init__()
+        self._pending=pending
+
+    def _call(self, rec, *args, **kwargs):
+        result = rec(*args, **kwargs)
+        if asyncio.iscoroutine(result):
+            self._pending.append(result)
+        return result
+
+class AsyncTwitchIrcClient(TwitchIrcClient):
+    """
+    TwitchIrcClient running in an asyncio event loop instead of its own thread
+    All methods that send something are coroutines, the EventSpreaders accept
+    normal functions and coroutine functions as recievers. Usage:
+
+    async def main():
+        irc = AsyncTwitchIrcClient('username','oauth:p4ssw0rd')
+        irc.messagespreader.add(messagelistener)
+        await irc.create_connection()
+        await irc.join('channel')
+        await irc.wait_closed()
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Same arguments as TwitchIrcClient, except rate_limit, dispatcher, reactor and write_delay:
+        they need threads the event loop doesn't use, ValueError is raised if one of them is given
+        """
+        #Coroutines returned by the recievers, needed by _create_spreader
+        self._pending = collections.deque()
+        super().__init__(*args, **kwargs)
+        unsupported = [name for name, given in (('rate_limit', self.send_queue), ('dispatcher', self.dispatcher),
+            ('reactor', self.reactor), ('write_delay', self.write_delay)) if not given is None]
+        if unsupported:
+            raise ValueError('AsyncTwitchIrcClient does not support %s'%', '.join(unsupported))
+        self._reader=None
+        self._writer=None
+        self._reciever_task=None
+        self._keepalive_task=None
+        #Future of the running reconnect, None if there is none
+        self._reconnecting=None
+        #Set by shutdown, wakes up a reconnect that waits for the backoff
+        self._stopped=None
+        self.go_on=False
+
+    async def create_connection(self):
+        """
+        Create a connection to twitch, logs in with username and password and start recieving
+        messages in a task of the running event loop
+        """
+        await self._connect()
+        self.go_on=True
+        self._stopped = asyncio.Event()
+        await self._begin_connection()
+        self._reciever_task = asyncio.get_running_loop().create_task(self._reciever())
+        if not self.keepalive is None:
+            self._keepalive_task = asyncio.get_running_loop().create_task(self._keepalive_loop())
+
+    async def wait_closed(self):
+        """Wait until the connection is shut down"""
+        if not self._reciever_task is None:
+            await self._reciever_task
+
+    async def pingtest(self):
+        """Send a ping to twitch"""
+        await self.send('PING twitchircclient\r\n')
+
+    async def reconnect(self):
+        """
+        reconnects to the twitchIrc
+        If a reconnect is already running (e.g. started by the keepalive), this waits for it instead
+        """
+        if not self._reconnecting is None:
+            #Closing the old connection wakes up the reciever, it must not reconnect a second time
+            await asyncio.shield(self._reconnecting)
+            return
+        self._reconnecting = asyncio.get_running_loop().create_future()
+        try:
+            await self._kill_socket()
+            self._framer.clear()
+            self._forget_channels()
+            while self.go_on:
+                delay = self.backoff.next_delay()
+                if delay:
+                    self.log('reconnecting in %.1f seconds'%delay)
+                    try:
+                        await asyncio.wait_for(self._stopped.wait(), delay)
+                        #Shut down while waiting
+                        return
+                    except asyncio.TimeoutError:
+                        pass
+                try:
+                    await self._connect()
+                except OSError as e:
+                    self.log('Error during reconnect: %s'%e)
+                    continue
+                await self._begin_connection()
+                return
+        finally:
+            self._reconnecting.set_result(None)
+            self._reconnecting = None
+
+    async def shutdown(self):
+        """Shutdown the irc connection"""
+        self.go_on=False
+        self._requested_capabilities=None
+        if not self._stopped is None:
+            self._stopped.set()
+        if not self._keepalive_task is None and self._keepalive_task is not asyncio.current_task():
+            self._keepalive_task.cancel()
+        await self._kill_socket()
+        if not self._reciever_task is None and self._reciever_task is not asyncio.current_task():
+            await self._reciever_task
+        #Recievers of windowed batches get the rest of the events
+        self._flush_all_batches()
+        await self._await_pending()
+
+    async def authenticate(self, username, oauthtoken):
+        """
+        Authenticates at the twitchIrc with given username and oauthtoken
+        Args:
+            username (str): Your username to use for logging onto twitch
+            oauthtoken (str): Your oauthtoken, retrieved from twitchTv
+                See README.md for further information about oauth
+        """
+        await self.send('PASS %s\r\n' % oauthtoken)
+        await self.send('NICK %s\r\n' % username)
+        await self.send('USER %s %s %s :%s\r\n' % (username, username, username, username))
+
+    async def send(self, msg):
+        """
+        Send a message directly to the twitchIrc
+        Args:
+            msg (str/bytes): The line to be send, including \r\n
+        """
+        self._send_now(msg)
+        await self._writer.drain()
+
+    async def sendprivmsg(self, channel, message):
+        """
+        Send a Message to a channel
+        Raises ValueError if the channel or the message contain line breaks
+        """
+        await self.send(encode_privmsg(channel.lower(), message))
+
+    async def sendwhisper(self, username, message):
+        """
+        Send a whisper-message to a user
+        """
+        await self.sendprivmsg(self.username, '/w %s %s'%(username,message))
+
+    async def join(self, channel):
+        """
+        Join a channel to send messages to
+        """
+        line = encode_join(channel)
+        self.joined_channels.add(channel)
+        self.pending_joins.add(channel.lower())
+        await self.send(line)
+
+    async def join_many(self, channels):
+        """
+        Join many channels at once, they are packed into as few lines as possible
+        Every channel is spread by joinconfirmspreader when twitch confirms the join
+        """
+        channels = list(channels)
+        packed = _pack_channels('JOIN', channels)
+        self.joined_channels.update(channels)
+        self.pending_joins.update(channel.lower() for channel in channels)
+        for line, count in packed:
+            await self.send(line)
+
+    async def part(self, channel):
+        """
+        Leave a channel
+        """
+        line = encode_part(channel)
+        self.joined_channels.discard(channel)
+        self.pending_joins.discard(channel.lower())
+        await self.send(line)
+
+    async def part_many(self, channels):
+        """
+        Leave many channels at once, they are packed into as few lines as possible
+        """
+        channels = list(channels)
+        packed = _pack_channels('PART', channels)
+        self.joined_channels.difference_update(channels)
+        self.pending_joins.difference_update(channel.lower() for channel in channels)
+        for line, count in packed:
+            await self.send(line)
+
+    async def timeout(self, channel, username, duration=600):
+        """
+        Time out a user in a channel with an optional duration in seconds (default: 600)
+        You have to be moderator in the channel
+        """
+        await self.sendprivmsg(channel, '/timeout %s %s'%(username, duration))
+
+    async def ban(self, channel, username):
+        """
+        Ban a user from the channel
+        You have to be moderator in the channel
+        """
+        await self.sendprivmsg(channel, '/ban %s'%username)
+
+    async def unban(self, channel, username):
+        """
+        Unan a user from the channel
+        You have to be moderator in the channel
+        """
+        await self.sendprivmsg(channel, '/unban %s'%username)
+
+    @property
+    def socket_timeout(self):
+        return self._socket_timeout
+
+    @socket_timeout.setter
+    def socket_timeout(self,to):
+        #The timeout is used for every read, so there is no socket to update
+        if not to is None and to<0:
+            raise AttributeError("%s is invalid: socket_timeout can't be below 0!"%to)
+        self._socket_timeout=to
+
+    #Begin "private" methods
+    def _create_spreader(self):
+        return AsyncEventSpreader(self._pending)
+
+    def _send_now(self, msg):
+        #Called while handling a line or adding a reciever, written without waiting for the drain
+        self._writer.write(msg if isinstance(msg, bytes) else msg.encode('utf-8'))
+
+    def _pong(self, data):
+        self._send_now(encode_pong(data))
+
+    async def _kill_socket(self):
+        """
+        Close the connection, it can not longer be used
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (OSError, ssl.SSLError) as e:
+            self.log('Error during close: %s'%e)
+
+    async def _connect(self):
+        """
+        Open a new connection to the irc
+        """
+        #asyncio can't resume TLS sessions, but the context is still reused
+        sslcontext=self._get_ssl_context() if self.use_ssl else None
+        self._reader, self._writer = await asyncio.open_connection(self.irc_hostname, self.irc_port, ssl=sslcontext)
+
+    async def _begin_connection(self):
+        """
+        Start the conversation, requests capabilities, authenticates and joins previously joined channels
+        """
+        if not self.keepalive is None:
+            self.keepalive.start()
+        #All lines are sent in one write, so they take one TLS record instead of one each
+        lines = self._capability_lines()
+        lines.append('PASS %s\r\n' % self.oauthtoken)
+        lines.append('NICK %s\r\n' % self.username)
+        lines.append('USER %s %s %s :%s\r\n' % ((self.username,)*4))
+        self.pending_joins = set(channel.lower() for channel in self.joined_channels)
+        lines.extend(line for line, count in _pack_channels('JOIN', self.joined_channels))
+        await self.send(''.join(lines))
+
+    async def _keepalive_loop(self):
+        """
+        Sends the PINGs and reconnects if a PONG is overdue
+        """
+        while self.go_on:
+            await asyncio.sleep(self.keepalive.next_delay())
+            if self.go_on and self._keepalive_tick() is KEEPALIVE_RECONNECT:
+                await self.reconnect()
+
+    async def _handle_line(self, data):
+        """
+        Handles a line and awaits the coroutines of the recievers in order
+        A failing reciever must not stop the reciever task, like in the reciever thread
+        """
+        try:
+            self._handle_incomming(data)
+        except Exception as e:
+            print('%s error occurred:%s'%(type(e),e))
+        await self._await_pending()
+
+    async def _await_pending(self):
+        while self._pending:
+            try:
+                await self._pending.popleft()
+            except Exception as e:
+                print('%s error occurred:%s'%(type(e),e))
+
+    async def _reciever(self):
+        while self.go_on:
+            reader = self._reader
+            try:
+                #Everything twitch sent at once is read together, batch recievers get it as one batch
+                if self._socket_timeout is None:
+                    data = await reader.read(self._framer.read_size)
+                else:
+                    data = await asyncio.wait_for(reader.read(self._framer.read_size), self._socket_timeout)
+                if not data:
+                    raise ConnectionError('connection closed')
+            except asyncio.TimeoutError:
+                #On timeout, restart the connection
+                self.log('reconnection because of socket-timeout!')
+                await self.reconnect()
+                continue
+            except (ConnectionError, ssl.SSLError) as e:
+                if not self.go_on or not reader is self._reader:
+                    #Stopped or already reconnected somewhere else
+                    self.log('Error during restart: %s'%e)
+                    continue
+                #Connection is lost, lets reconnect!
+                self.log('reconnecting because of lost connection: %s'%e)
+                await self.reconnect()
+                continue
+            for line in self._framer.feed(data):
+                await self._handle_line(line)
+            try:
+                self._end_burst()
+            except Exception as e:
+                print('%s error occurred:%s'%(type(e),e))
+            await self._await_pending()
@@ -0,0 +1,66 @@
+"""
+Delays between reconnect attempts
+"""
+
+import random
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+
+class Backoff:
+    """
+    Exponential backoff with jitter and a circuit breaker for reconnects
+    The first attempt after a working connection is made at once, every failed attempt
+    doubles the delay up to maximum. The jitter spreads the attempts of many clients that
+    lost their connection at the same time. After failure_threshold attempts in a row
+    without a login the circuit opens: only one attempt is made every cooldown seconds
+    and sending fails right away instead of waiting. A login closes the circuit again.
+    Usage:
+    irc = TwitchIrcClient('username','oauth:p4ssw0rd', backoff=Backoff(initial=2, maximum=60))
+    """
+    def __init__(self, initial=1, maximum=120, factor=2, jitter=0.5, failure_threshold=10, cooldown=300, random=random.random):
+        """
+        Args:
+            initial (float)(optional): Seconds before the second attempt (default: 1)
+            maximum (float)(optional): Maximum seconds between two attempts (default: 120)
+            factor (float)(optional): Growth of the delay per failed attempt (default: 2)
+            jitter (float)(optional): Share of the delay that is random, 0 for none, 1 for full jitter (default: 0.5)
+            failure_threshold (int)(optional): Failed attempts that open the circuit (default: 10)
+            cooldown (float)(optional): Seconds between the attempts while the circuit is open (default: 300)
+            random (function)(optional): Returns a random float in [0, 1) (default: random.random)
+        """
+        self.initial=initial
+        self.maximum=maximum
+        self.factor=factor
+        self.jitter=jitter
+        self.failure_threshold=failure_threshold
+        self.cooldown=cooldown
+        self._random=random
+        #Attempts since the last login
+        self.attempts=0
+
+    @property
+    def state(self):
+        """(str): CIRCUIT_OPEN while waiting for an attempt after failure_threshold failed ones, CIRCUIT_CLOSED otherwise"""
+        return CIRCUIT_OPEN if self.attempts>self.failure_threshold else CIRCUIT_CLOSED
+
+    def next_delay(self):
+        """
+        Counts an attempt
+        Returns:
+            (float): Seconds to wait before it
+        """
+        #All attempts since the last login failed, or there were none
+        failed = self.attempts
+        self.attempts += 1
+        if failed==0:
+            return 0
+        if failed>=self.failure_threshold:
+            delay = self.cooldown
+        else:
+            delay = min(self.maximum, self.initial*self.factor**(failed-1))
+        return delay*(1-self.jitter*self._random())
+
+    def succeeded(self):
+        """Called when twitch accepted the login, closes the circuit"""
+        self.attempts=0
@@ -0,0 +1,175 @@
+"""
+Calling the recievers outside of the reciever thread
+"""
+
+import collections
+import threading
+import time
+import zlib
+from .twitchircclient import EventSpreader
+
+#What submit does if the lane of the event is full
+OVERFLOW_BLOCK='block'
+OVERFLOW_DROP_OLDEST='drop-oldest'
+OVERFLOW_DROP_NEWEST='drop-newest'
+
+class _Lane:
+    """Queue of one worker, events with the same key always use the same lane"""
+    def __init__(self, maxsize):
+        self.maxsize=maxsize
+        self.events=collections.deque()
+        self.cond=threading.Condition()
+
+class Dispatcher:
+    """
+    Calls functions in a pool of worker threads
+    Every key (e.g. the channel) is assigned to one worker, so calls with the same key
+    are made in the order they were submitted. Usage:
+    dispatcher = Dispatcher(workers=4)
+    irc = TwitchIrcClient('username','oauth:p4ssw0rd', dispatcher=dispatcher)
+    ...
+    dispatcher.stop()
+    """
+    def __init__(self, workers=4, maxsize=10000, overflow=OVERFLOW_BLOCK, clock=time.monotonic):
+        """
+        Args:
+            workers (int)(optional): Number of worker threads (default: 4)
+            maxsize (int)(optional): Maximum number of waiting calls, split over the workers (default: 10000)
+            overflow (str)(optional): OVERFLOW_BLOCK waits until there is space,
+                OVERFLOW_DROP_OLDEST drops the oldest waiting call of the worker,
+                OVERFLOW_DROP_NEWEST drops the new call (default: OVERFLOW_BLOCK)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        """
+        if not overflow in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            raise ValueError('unknown overflow policy %s'%overflow)
+        self.overflow=overflow
+        self._clock=clock
+        self._lanes = [_Lane(max(1, maxsize//workers)) for _ in range(workers)]
+        self._lock = threading.Lock()
+        self._running = True
+        self._dispatched = 0
+        self._dropped = 0
+        self._lag_total = 0
+        self._lag_max = 0
+        self._threads = [threading.Thread(target=self._run, args=(lane,), name='twitchircclient-dispatch-%d'%index, daemon=True)
+            for index, lane in enumerate(self._lanes)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Calls func with args and kwargs in the worker of key
+        Returns:
+            (bool): False if the call was dropped or the dispatcher is stopped
+        """
+        lane = self._lanes[zlib.crc32((key or '').encode('utf-8'))%len(self._lanes)]
+        with lane.cond:
+            if not self._running:
+                #The workers are gone or about to end, the call would never be made
+                return False
+            if len(lane.events)>=lane.maxsize:
+                if self.overflow==OVERFLOW_DROP_NEWEST:
+                    self._count_drop()
+                    return False
+                elif self.overflow==OVERFLOW_DROP_OLDEST:
+                    lane.events.popleft()
+                    self._count_drop()
+                else:
+                    lane.cond.wait_for(lambda: len(lane.events)<lane.maxsize or not self._running)
+                    if not self._running:
+                        return False
+            lane.events.append((self._clock(), func, args, kwargs))
+            lane.cond.notify_all()
+        return True
+
+    def create_spreader(self):
+        """
+        Returns:
+            (EventSpreader): An EventSpreader that calls its recievers with this dispatcher
+        """
+        return DispatchingEventSpreader(self)
+
+    def stop(self, wait=True):
+        """
+        Stops the workers after they made all waiting calls, later calls of submit return False
+        Args:
+            wait (bool)(optional): Wait until the workers are stopped (default: True)
+        """
+        for lane in self._lanes:
+            with lane.cond:
+                self._running = False
+                lane.cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                if not thread is threading.current_thread():
+                    thread.join()
+
+    def metrics(self):
+        """
+        Returns:
+            (dict): waiting calls, made calls, dropped calls, average and maximum seconds calls waited (lag)
+        """
+        with self._lock:
+            return {
+                'queued': sum(len(lane.events) for lane in self._lanes),
+                'dispatched': self._dispatched,
+                'dropped': self._dropped,
+                'lag_avg': self._lag_total/self._dispatched if self._dispatched else 0,
+                'lag_max': self._lag_max,
+            }
+
+    def _count_drop(self):
+        with self._lock:
+            self._dropped += 1
+
+    def _run(self, lane):
+        while True:
+            with lane.cond:
+                lane.cond.wait_for(lambda: lane.events or not self._running)
+                if not lane.events:
+                    return
+                queued, func, args, kwargs = lane.events.popleft()
+                lane.cond.notify_all()
+            lag = self._clock()-queued
+            with self._lock:
+                self._dispatched += 1
+                self._lag_total += lag
+                self._lag_max = max(self._lag_max, lag)
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print('%s error occurred:%s'%(type(e),e))
+
+class DispatchingEventSpreader(EventSpreader):
+    """
+    EventSpreader that calls its recievers in the worker of a Dispatcher
+    Events are keyed by their channel, or their username if they have no channel
+    """
+    def __init__(self, dispatcher):
+        super().__init__()
+        self._dispatcher=dispatcher
+
+    def spread(self, *args, **kwargs):
+        channel = kwargs.get('channel')
+        username = kwargs.get('username')
+        recievers = self._matching(channel, username)[1]
+        if not recievers:
+            return
+        self._dispatcher.submit(channel or username, self._spread_now, list(recievers), args, kwargs)
+
+    def spread_event(self, event):
+        channel = getattr(event, 'channel', None)
+        username = getattr(event, 'username', None)
+        event_recievers, recievers = self._matching(channel, username)
+        if event_recievers or recievers:
+            self._dispatcher.submit(channel or username, self._spread_event, list(event_recievers), list(recievers), event)
+        if self._batches:
+            self._collect(event)
+
+    def _deliver(self, reciever, events):
+        #A batch has events of many channels, all batches use the same worker and keep their order
+        self._dispatcher.submit(None, self._call, reciever, events)
+
+    def _spread_now(self, recievers, args, kwargs):
+        for rec in recievers:
+            self._call(rec, *args, **kwargs)
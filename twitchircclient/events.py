@@ -0,0 +1,179 @@
+"""
+Event objects spread by the TwitchIrcClient
+Every incomming line is turned into one of these objects once, recievers added with
+EventSpreader.add_event get the object itself, recievers added with EventSpreader.add
+get its fields as keyword arguments (see as_kwargs)
+"""
+
+from .tagviews import EmoteIndex, BadgeList
+
+class Event:
+    """
+    Base of all events, the fields are the __slots__ of the subclass
+    in the order of the keyword arguments
+    """
+    __slots__ = ()
+
+    def as_kwargs(self):
+        """
+        Returns:
+            (dict): The fields as keyword arguments for the recievers added with EventSpreader.add,
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, name)==getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return '%s(%s)'%(type(self).__name__, ', '.join('%s=%r'%(name, getattr(self, name)) for name in self.__slots__))
+
+class _TagViews:
+    """Parsed emotes and badges of events with tags, see tagviews.py"""
+    __slots__ = ()
+
+    @property
+    def emotes(self):
+        """(EmoteIndex): The emotes in message, shared by all recievers"""
+        if hasattr(self.tags, 'emote_index'):
+            return self.tags.emote_index()
+        return EmoteIndex(self.tags.get('emotes', ''))
+
+    @property
+    def badges(self):
+        """(BadgeList): The badges of the user, shared by all recievers"""
+        if hasattr(self.tags, 'badge_list'):
+            return self.tags.badge_list()
+        return BadgeList.parse(self.tags.get('badges', ''))
+
+class PrivMsg(_TagViews, Event):
+    """A message in a channel, spread by messagespreader"""
+    __slots__ = ('username', 'channel', 'tags', 'message')
+
+    def __init__(self, username, channel, tags, message):
+        self.username = username
+        self.channel = channel
+        self.tags = tags
+        self.message = message
+
+class Whisper(_TagViews, Event):
+    """A whisper to us, spread by whisperspreader"""
+    __slots__ = ('username', 'message', 'tags')
+
+    def __init__(self, username, message, tags):
+        self.username = username
+        self.message = message
+        self.tags = tags
+
+class Join(Event):
+    """A user joined a channel, spread by joinspreader"""
+    __slots__ = ('username', 'channel')
+
+    def __init__(self, username, channel):
+        self.username = username
+        self.channel = channel
+
+class Part(Event):
+    """A user left a channel, spread by partspreader"""
+    __slots__ = ('username', 'channel')
+
+    def __init__(self, username, channel):
+        self.username = username
+        self.channel = channel
+
+class JoinConfirm(Event):
+    """Twitch confirmed that we joined a channel, spread by joinconfirmspreader"""
+    __slots__ = ('channel',)
+
+    def __init__(self, channel):
+        self.channel = channel
+
+class Notice(Event):
+    """A notice from twitch, spread by noticespreader"""
+    __slots__ = ('channel', 'message', 'tags')
+
+    def __init__(self, channel, message, tags):
+        self.channel = channel
+        self.message = message
+        self.tags = tags
+
+class UserNotice(_TagViews, Event):
+    """Subscriptions, raids etc., message is '' if the user didn't write one, spread by usernoticespreader"""
+    __slots__ = ('channel', 'message', 'tags')
+
+    def __init__(self, channel, message, tags):
+        self.channel = channel
+        self.message = message
+        self.tags = tags
+
+class RoomState(Event):
+    """Settings of a channel changed, spread by roomstatespreader"""
+    __slots__ = ('channel', 'tags')
+
+    def __init__(self, channel, tags):
+        self.channel = channel
+        self.tags = tags
+
+class ClearChat(Event):
+    """The messages of a user were removed (timeout or ban), spread by clearchatspreader"""
+    __slots__ = ('channel', 'tags', 'username')
+
+    def __init__(self, channel, tags, username):
+        self.channel = channel
+        self.tags = tags
+        self.username = username
+
+class UserState(Event):
+    """Our state in a channel, spread by userstatespreader"""
+    __slots__ = ('channel', 'tags')
+
+    def __init__(self, channel, tags):
+        self.channel = channel
+        self.tags = tags
+
+class GlobalUserState(Event):
+    """Our state after the login, spread by globaluserstatespreader"""
+    __slots__ = ('tags',)
+
+    def __init__(self, tags):
+        self.tags = tags
+
+class HostTarget(Event):
+    """A channel started or stopped (target '-') hosting, spread by hostspreader"""
+    __slots__ = ('channel', 'target', 'viewers')
+
+    def __init__(self, channel, target, viewers):
+        self.channel = channel
+        self.target = target
+        self.viewers = viewers
+
+class Operator(Event):
+    """A user gained or lost operator status, spread by gainoperatorspreader and looseoperatorspreader"""
+    __slots__ = ('channel', 'username')
+
+    def __init__(self, channel, username):
+        self.channel = channel
+        self.username = username
+
+class NamesList(Event):
+    """Users in a channel, spread by nameslistspreader for every line and by nameslistendspreader for the whole list"""
+    __slots__ = ('channel', 'names')
+
+    def __init__(self, channel, names):
+        self.channel = channel
+        self.names = names
+
+class Health(Event):
+    """
+    Result of a keepalive PING, spread by healthspreader
+    rtt is the smoothed and last_rtt the last round trip time in seconds, healthy is False if the
+    PONG didn't come in time (a reconnect follows), missed counts these PINGs
+    """
+    __slots__ = ('rtt', 'last_rtt', 'healthy', 'missed')
+
+    def __init__(self, rtt, last_rtt, healthy, missed):
+        self.rtt = rtt
+        self.last_rtt = last_rtt
+        self.healthy = healthy
+        self.missed = missed
@@ -0,0 +1,294 @@
+"""
+Local server that speaks enough of the twitch irc protocol for tests
+"""
+
+import socket
+import ssl
+import threading
+import time
+from .twitchircclient import LineFramer, _parse_line
+from .ratelimit import TokenBucket
+
+HOSTNAME='tmi.twitch.tv'
+
+class _Connection:
+    """A client connected to the FakeTwitchServer"""
+    def __init__(self, sock, address):
+        self.sock=sock
+        self.address=address
+        self.nick=None
+        self.caps=set()
+        self.channels=set()
+        self.lock=threading.Lock()
+        self.bucket=None
+        self.closed=False
+
+class FakeTwitchServer:
+    """
+    TCP or TLS server that behaves like the twitch irc server
+    Knows CAP REQ, PASS/NICK, JOIN/PART with echoes and NAMES, PING and
+    PRIVMSG, which is sent to everyone else in the channel within a rate limit.
+    Traffic can be generated with generate, faults can be injected with
+    drop_connections, stall and split_utf8. Usage:
+    server = FakeTwitchServer()
+    server.start()
+    irc = TwitchIrcClient('username','oauth:test', irc_hostname=server.host, irc_port=server.port, use_ssl=False)
+    ...
+    server.stop()
+    """
+    def __init__(self, host='127.0.0.1', port=0, certfile=None, keyfile=None, privmsg_limit=(20, 30)):
+        """
+        Args:
+            host (str)(optional): Address to listen on (default: 127.0.0.1)
+            port (int)(optional): Port to listen on, 0 chooses a free port (default: 0)
+            certfile (str)(optional): Certificate in PEM format, enables TLS (default: plain TCP)
+            keyfile (str)(optional): Private key of the certificate (default: in certfile)
+            privmsg_limit (tuple)(optional): (lines, seconds) a connection can send before PRIVMSGs are dropped (default: (20, 30))
+        """
+        self.host=host
+        self.port=port
+        self.privmsg_limit=privmsg_limit
+        #Split written lines inside multibyte characters
+        self.split_utf8=False
+        self.connections=[]
+        #Lines recieved from the clients and PRIVMSGs that were dropped because of the rate limit
+        self.recieved_lines=[]
+        self.dropped_privmsgs=0
+        self.accepted=0
+        self._sslcontext=None
+        if not certfile is None:
+            self._sslcontext = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self._sslcontext.load_cert_chain(certfile, keyfile)
+        self._lock=threading.Lock()
+        #Cleared while the server is stalled
+        self._io=threading.Event()
+        self._io.set()
+        self._listener=None
+        self._running=False
+
+    def start(self):
+        """Starts listening, port is set to the real port afterwards"""
+        self._listener = socket.socket()
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        self._running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        """Closes the server and all connections"""
+        self._running = False
+        self._io.set()
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+        self.drop_connections()
+
+    def drop_connections(self):
+        """Closes all connections, the clients notice an empty read"""
+        with self._lock:
+            connections = list(self.connections)
+            self.connections = []
+        for conn in connections:
+            self._close(conn)
+
+    def stall(self, seconds):
+        """Stops reading from and writing to all connections for seconds, in the background"""
+        self._io.clear()
+        timer = threading.Timer(seconds, self._io.set)
+        timer.daemon = True
+        timer.start()
+
+    def wait_for_connections(self, count, timeout=5):
+        """
+        Waits until count clients sent NICK
+        Returns:
+            (bool): False on timeout
+        """
+        end = time.monotonic()+timeout
+        while time.monotonic()<end:
+            with self._lock:
+                if len([conn for conn in self.connections if conn.nick])>=count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def members(self, channel):
+        """
+        Returns:
+            (list): The connections that joined the channel
+        """
+        with self._lock:
+            return [conn for conn in self.connections if channel in conn.channels]
+
+    def send_line(self, line, channel=None, tags=None):
+        """
+        Sends a line to all connections or to all members of channel
+        Args:
+            line (str): The line without tags and \\r\\n
+            channel (str)(optional): Only send to the members of the channel (default: everyone)
+            tags (str)(optional): Tags without '@', only sent to connections with the tags capability
+        """
+        if channel is None:
+            with self._lock:
+                connections = list(self.connections)
+        else:
+            connections = self.members(channel)
+        for conn in connections:
+            self._send(conn, line, tags)
+
+    def generate(self, channel, count, rate=None, message=str):
+        """
+        Sends PRIVMSGs from generated users to the members of channel in a background thread
+        Args:
+            channel (str): The channel without '#'
+            count (int): Number of messages
+            rate (float)(optional): Messages per second (default: as fast as possible)
+            message (function)(optional): Returns the text of the message with the given number (default: str)
+        Returns:
+            (threading.Thread): The started thread, join it to wait until everything is sent
+        """
+        def generator():
+            start = time.monotonic()
+            for number in range(count):
+                if not rate is None:
+                    delay = start+number/rate-time.monotonic()
+                    if delay>0:
+                        time.sleep(delay)
+                user = 'gen_user%d'%(number%100)
+                tags = 'display-name=Gen_User%d;emotes=;id=%08d-0000-0000-0000-000000000000;mod=0;room-id=1337;user-id=%d'%(number%100, number, number%100)
+                self.send_line(':%s!%s@%s.%s PRIVMSG #%s :%s'%(user, user, user, HOSTNAME, channel, message(number)), channel, tags)
+        thread = threading.Thread(target=generator, daemon=True)
+        thread.start()
+        return thread
+
+    #Begin "private" methods
+    def _accept(self):
+        while self._running:
+            try:
+                sock, address = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock, address), daemon=True).start()
+
+    def _serve(self, sock, address):
+        if not self._sslcontext is None:
+            try:
+                sock = self._sslcontext.wrap_socket(sock, server_side=True)
+            except (OSError, ssl.SSLError):
+                sock.close()
+                return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _Connection(sock, address)
+        if not self.privmsg_limit is None:
+            conn.bucket = TokenBucket(*self.privmsg_limit)
+        with self._lock:
+            self.connections.append(conn)
+            self.accepted += 1
+        framer = LineFramer()
+        while self._running and not conn.closed:
+            self._io.wait()
+            try:
+                lines = framer.recv_from(sock)
+            except (OSError, ssl.SSLError):
+                lines = None
+            if lines is None:
+                break
+            for line in lines:
+                if line:
+                    self._handle(conn, line)
+        with self._lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+        self._close(conn)
+
+    def _close(self, conn):
+        conn.closed = True
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.sock.close()
+
+    def _send(self, conn, line, tags=None):
+        if not tags is None and 'twitch.tv/tags' in conn.caps:
+            line = '@'+tags+' '+line
+        data = (line+'\r\n').encode('utf-8')
+        self._io.wait()
+        with conn.lock:
+            if conn.closed:
+                return
+            try:
+                if self.split_utf8:
+                    #Write in pieces that end in the middle of multibyte characters
+                    start = 0
+                    for pos in range(1, len(data)):
+                        if data[pos]&0xC0==0x80 and data[pos-1]&0xC0!=0x80:
+                            conn.sock.sendall(data[start:pos])
+                            start = pos
+                    conn.sock.sendall(data[start:])
+                else:
+                    conn.sock.sendall(data)
+            except (OSError, ssl.SSLError):
+                conn.closed = True
+
+    def _handle(self, conn, line):
+        with self._lock:
+            self.recieved_lines.append(line)
+        parsed = _parse_line(line)
+        if parsed is None:
+            return
+        raw_tags, prefix, command, params = parsed
+        if command=='CAP' and len(params)>=2 and params[0]=='REQ':
+            conn.caps.update(params[1].split())
+            self._send(conn, ':%s CAP * ACK :%s'%(HOSTNAME, params[1]))
+        elif command=='NICK' and params:
+            conn.nick = params[0].lower()
+            for number, text in (('001', 'Welcome, GLHF!'), ('002', 'Your host is %s'%HOSTNAME),
+                    ('003', 'This server is rather new'), ('004', '-'), ('375', '-'), ('372', 'You are in a maze of twisty passages.'), ('376', '>')):
+                self._send(conn, ':%s %s %s :%s'%(HOSTNAME, number, conn.nick, text))
+            if 'twitch.tv/commands' in conn.caps:
+                self._send(conn, ':%s GLOBALUSERSTATE'%HOSTNAME, 'badges=;color=;display-name=%s;emote-sets=0;user-id=1;user-type='%conn.nick)
+        elif command=='PING':
+            self._send(conn, ':%s PONG %s :%s'%(HOSTNAME, HOSTNAME, params[0] if params else ''))
+        elif command=='JOIN' and params and conn.nick:
+            for channel in params[0].split(','):
+                self._join(conn, channel.lstrip('#').lower())
+        elif command=='PART' and params and conn.nick:
+            for channel in params[0].split(','):
+                channel = channel.lstrip('#').lower()
+                self._send_membership(channel, ':%s!%s@%s.%s PART #%s'%(conn.nick, conn.nick, conn.nick, HOSTNAME, channel), conn)
+                conn.channels.discard(channel)
+        elif command=='PRIVMSG' and len(params)>=2 and conn.nick:
+            channel = params[0].lstrip('#').lower()
+            if not conn.bucket is None:
+                if conn.bucket.delay()>0:
+                    with self._lock:
+                        self.dropped_privmsgs += 1
+                    return
+                conn.bucket.consume()
+            for member in self.members(channel):
+                if not member is conn:
+                    self._send(member, ':%s!%s@%s.%s PRIVMSG #%s :%s'%(conn.nick, conn.nick, conn.nick, HOSTNAME, channel, params[1]),
+                        'display-name=%s;emotes=;mod=0;room-id=1337;user-id=1'%conn.nick)
+
+    def _join(self, conn, channel):
+        conn.channels.add(channel)
+        self._send_membership(channel, ':%s!%s@%s.%s JOIN #%s'%(conn.nick, conn.nick, conn.nick, HOSTNAME, channel), conn)
+        if 'twitch.tv/commands' in conn.caps:
+            self._send(conn, ':%s USERSTATE #%s'%(HOSTNAME, channel), 'badges=;color=;display-name=%s;emote-sets=0;mod=0;subscriber=0;user-type='%conn.nick)
+            self._send(conn, ':%s ROOMSTATE #%s'%(HOSTNAME, channel), 'emote-only=0;followers-only=-1;r9k=0;room-id=1337;slow=0;subs-only=0')
+        if 'twitch.tv/membership' in conn.caps:
+            names = ' '.join(member.nick for member in self.members(channel))
+            self._send(conn, ':%s.%s 353 %s = #%s :%s'%(conn.nick, HOSTNAME, conn.nick, channel, names))
+        self._send(conn, ':%s.%s 366 %s #%s :End of /NAMES list'%(conn.nick, HOSTNAME, conn.nick, channel))
+
+    def _send_membership(self, channel, line, conn):
+        #JOIN and PART are sent to the connection itself and to members with the membership capability
+        for member in self.members(channel):
+            if member is conn or 'twitch.tv/membership' in member.caps:
+                self._send(member, line)
+        if not channel in conn.channels:
+            self._send(conn, line)
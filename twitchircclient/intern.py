@@ -0,0 +1,50 @@
+"""
+Sharing equal strings, e.g. channels and usernames of many messages
+"""
+
+class InternTable:
+    """
+    Bounded table that returns the same object for equal strings
+    Unlike sys.intern, strings are forgotten again: the table has two generations,
+    when the current one is full it becomes the previous one and a new one is started.
+    Strings found in the previous generation move to the current one, so strings seen
+    often stay and rarely seen ones are dropped after two generations. Usage:
+    table = InternTable(10000)
+    username = table.intern(username)
+    """
+    def __init__(self, maxsize=10000):
+        """
+        Args:
+            maxsize (int)(optional): Number of strings in a generation (default: 10000)
+        """
+        self.maxsize=maxsize
+        self._current = {}
+        self._previous = {}
+
+    def intern(self, value):
+        """
+        Returns:
+            (str): The stored string equal to value, value itself if there is none yet
+        """
+        found = self._current.get(value)
+        if not found is None:
+            return found
+        found = self._previous.get(value, value)
+        if len(self._current)>=self.maxsize:
+            self._previous = self._current
+            self._current = {}
+        self._current[found] = found
+        return found
+
+    def clear(self):
+        self._current = {}
+        self._previous = {}
+
+    def __contains__(self, value):
+        return value in self._current or value in self._previous
+
+    def __len__(self):
+        return len(self._current)+len(self._previous)
+
+#Tag keys of all clients, there are only a few dozen of them
+tag_keys = InternTable(1000)
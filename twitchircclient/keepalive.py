@@ -0,0 +1,112 @@
+"""
+Active keepalive: PINGs with a token, matched with the PONGs of twitch
+"""
+
+import itertools
+import threading
+import time
+
+#Actions returned by Keepalive.tick
+KEEPALIVE_PING = 'ping'
+KEEPALIVE_RECONNECT = 'reconnect'
+
+class Keepalive:
+    """
+    Decides when a PING is sent and when the connection is dead
+    A half-open connection doesn't fail, it just stops delivering lines, so waiting for a
+    socket error can take minutes. Instead every interval seconds a PING with a new token
+    is sent; if its PONG doesn't come back within timeout seconds the connection is dead.
+    Only one PING is outstanding at a time. The round trip times are averaged like the
+    smoothed rtt of TCP. The client calls tick and pong, the Keepalive never sends anything:
+    action, token = keepalive.tick()
+    if action==KEEPALIVE_PING: send('PING :%s\\r\\n'%token)
+    elif action==KEEPALIVE_RECONNECT: reconnect()
+    """
+    def __init__(self, interval=60, timeout=10, alpha=0.125, clock=time.monotonic):
+        """
+        Args:
+            interval (float)(optional): Seconds between two PINGs (default: 60)
+            timeout (float)(optional): Seconds a PONG may take before the connection is dead (default: 10)
+            alpha (float)(optional): Weight of a new round trip time in the average (default: 0.125)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        """
+        self.interval=interval
+        self.timeout=timeout
+        self.alpha=alpha
+        self.clock=clock
+        #Smoothed and last round trip time in seconds, None until the first PONG
+        self.rtt=None
+        self.last_rtt=None
+        #PINGs without a PONG in time
+        self.missed=0
+        #tick runs in the keepalive thread, pong and start in the reciever thread
+        self._lock=threading.Lock()
+        self._counter=itertools.count(1)
+        self._pending_token=None
+        self._pending_since=None
+        self._last_ping=None
+
+    def start(self):
+        """Called when a connection is (re)established, the first PING follows after interval seconds"""
+        with self._lock:
+            self._pending_token=None
+            self._pending_since=None
+            self._last_ping=self.clock()
+
+    def tick(self):
+        """
+        Returns:
+            (tuple): (KEEPALIVE_PING, token) if a PING has to be sent, (KEEPALIVE_RECONNECT, token of the
+                missed PING) if the connection is dead, (None, None) otherwise
+        """
+        with self._lock:
+            now = self.clock()
+            if not self._pending_token is None:
+                if now-self._pending_since<self.timeout:
+                    return None, None
+                token = self._pending_token
+                self.missed += 1
+                #The reconnect starts a new connection, which calls start again
+                self._pending_token=None
+                return KEEPALIVE_RECONNECT, token
+            if not self._last_ping is None and now-self._last_ping<self.interval:
+                return None, None
+            token = 'twitchircclient-%d'%next(self._counter)
+            self._pending_token=token
+            self._pending_since=now
+            self._last_ping=now
+            return KEEPALIVE_PING, token
+
+    def pong(self, token):
+        """
+        Args:
+            token (str): Token of a recieved PONG
+        Returns:
+            (float): The round trip time of our PING with this token, None if the PONG doesn't belong to it
+        """
+        with self._lock:
+            if token is None or token!=self._pending_token:
+                return None
+            sample = self.clock()-self._pending_since
+            self._pending_token=None
+            self.last_rtt=sample
+            if self.rtt is None:
+                self.rtt=sample
+            else:
+                self.rtt += self.alpha*(sample-self.rtt)
+            return sample
+
+    def next_delay(self):
+        """
+        Returns:
+            (float): Seconds until tick has something to do, at most interval while a PONG is
+                outstanding, so the next PING isn't late if the PONG comes in time
+        """
+        now = self.clock()
+        if not self._pending_token is None:
+            return max(0, min(self._pending_since+self.timeout-now, self.interval))
+        elif self._last_ping is None:
+            return 0
+        else:
+            due = self._last_ping+self.interval
+        return max(0, due-now)
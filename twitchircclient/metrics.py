@@ -0,0 +1,209 @@
+"""
+Counters and histograms of a TwitchIrcClient
+"""
+
+import bisect
+import threading
+import time
+
+#Upper bounds in seconds of the buckets of the time histograms
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+class Histogram:
+    """
+    Counts observed values in buckets with fixed upper bounds, like a prometheus histogram
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets (tuple)(optional): Sorted upper bounds of the buckets (default: DEFAULT_BUCKETS)
+        """
+        self.buckets=tuple(buckets)
+        #The last count is for values above the largest bound
+        self.counts=[0]*(len(self.buckets)+1)
+        self.count=0
+        self.sum=0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """
+        Returns:
+            (dict): count, sum and the count per upper bound ('+Inf' for the rest), not cumulative
+        """
+        buckets = dict(zip(self.buckets, self.counts))
+        buckets['+Inf'] = self.counts[-1]
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+class ClientMetrics:
+    """
+    Metrics of one or more clients (e.g. of a pool)
+    Counts the recieved lines and bytes per command, measures how long parsing and
+    dispatching a line takes, how long reconnects take, how long lines wait in the
+    send_queue, how long TLS handshakes take and how long every listener takes. Usage:
+    metrics = ClientMetrics(listener_budget=0.05)
+    irc = TwitchIrcClient('username','oauth:p4ssw0rd', metrics=metrics)
+    ...
+    metrics.snapshot()
+    metrics.prometheus()
+    Without metrics the client doesn't measure anything.
+    """
+    def __init__(self, listener_budget=0.1, on_slow_listener=None, clock=time.perf_counter, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            listener_budget (float)(optional): Seconds a listener may take before on_slow_listener is called (default: 0.1)
+            on_slow_listener (function)(optional): Called with the name of the listener and the seconds
+                it took (default: prints a warning)
+            clock (function)(optional): Returns the current time in seconds (default: time.perf_counter)
+            buckets (tuple)(optional): Upper bounds of the histogram buckets in seconds (default: DEFAULT_BUCKETS)
+        """
+        self.listener_budget=listener_budget
+        self.on_slow_listener=on_slow_listener or _print_slow_listener
+        self.clock=clock
+        self._lock=threading.Lock()
+        #command -> number of lines and bytes including \r\n
+        self.lines={}
+        self.bytes={}
+        self.parse_time=Histogram(buckets)
+        self.dispatch_time=Histogram(buckets)
+        self.reconnects=0
+        self.reconnect_time=Histogram(buckets)
+        self.send_wait=Histogram(buckets)
+        self.tls_handshake_time=Histogram(buckets)
+        #Handshakes that resumed the TLS session of the connection before
+        self.tls_resumed=0
+        #listener name -> [calls, seconds, maximum seconds, calls over the budget]
+        self.listeners={}
+
+    def line_handled(self, command, size, parse_time=None, dispatch_time=None):
+        """
+        Args:
+            command (str): Command of the line
+            size (int): Bytes of the line including \\r\\n
+            parse_time (float)(optional): Seconds splitting the line took (default: not parsed)
+            dispatch_time (float)(optional): Seconds the handler took, including the recievers (default: not handled)
+        """
+        with self._lock:
+            self.lines[command] = self.lines.get(command, 0)+1
+            self.bytes[command] = self.bytes.get(command, 0)+size
+            if not parse_time is None:
+                self.parse_time.observe(parse_time)
+            if not dispatch_time is None:
+                self.dispatch_time.observe(dispatch_time)
+
+    def reconnect_started(self):
+        with self._lock:
+            self.reconnects += 1
+
+    def reconnected(self, seconds):
+        with self._lock:
+            self.reconnect_time.observe(seconds)
+
+    def line_sent(self, waited):
+        #Called by the SendQueue with the seconds the line waited
+        with self._lock:
+            self.send_wait.observe(waited)
+
+    def tls_handshake(self, seconds, reused):
+        with self._lock:
+            self.tls_handshake_time.observe(seconds)
+            if reused:
+                self.tls_resumed += 1
+
+    def timed_call(self, call):
+        """
+        Returns:
+            (function): call, which calls a reciever, wrapped to measure the reciever
+        """
+        def timed(rec, *args, **kwargs):
+            start = self.clock()
+            try:
+                return call(rec, *args, **kwargs)
+            finally:
+                self._listener_called(rec, self.clock()-start)
+        return timed
+
+    def snapshot(self):
+        """
+        Returns:
+            (dict): All counters and histograms
+        """
+        with self._lock:
+            return {
+                'lines': dict(self.lines),
+                'bytes': dict(self.bytes),
+                'parse_time': self.parse_time.snapshot(),
+                'dispatch_time': self.dispatch_time.snapshot(),
+                'reconnects': self.reconnects,
+                'reconnect_time': self.reconnect_time.snapshot(),
+                'send_wait': self.send_wait.snapshot(),
+                'tls_handshake_time': self.tls_handshake_time.snapshot(),
+                'tls_resumed': self.tls_resumed,
+                'listeners': {name: {'calls': calls, 'seconds': seconds, 'max': maximum, 'slow': slow}
+                    for name, (calls, seconds, maximum, slow) in self.listeners.items()},
+            }
+
+    def prometheus(self, prefix='twitchircclient'):
+        """
+        Returns:
+            (str): The metrics in the prometheus text format
+        """
+        snapshot = self.snapshot()
+        out = []
+        for name, help_text in (('lines', 'Recieved lines'), ('bytes', 'Recieved bytes')):
+            out.append('# HELP %s_%s_total %s per command'%(prefix, name, help_text))
+            out.append('# TYPE %s_%s_total counter'%(prefix, name))
+            for command, value in sorted(snapshot[name].items()):
+                out.append('%s_%s_total{command="%s"} %d'%(prefix, name, _escape(command), value))
+        out.append('# HELP %s_reconnects_total Started reconnects'%prefix)
+        out.append('# TYPE %s_reconnects_total counter'%prefix)
+        out.append('%s_reconnects_total %d'%(prefix, snapshot['reconnects']))
+        out.append('# HELP %s_tls_resumed_total TLS handshakes that resumed the session'%prefix)
+        out.append('# TYPE %s_tls_resumed_total counter'%prefix)
+        out.append('%s_tls_resumed_total %d'%(prefix, snapshot['tls_resumed']))
+        for name, help_text in (('parse_time', 'Seconds to split a line'), ('dispatch_time', 'Seconds to handle a split line'),
+                ('reconnect_time', 'Seconds until twitch accepted the login after a reconnect'),
+                ('send_wait', 'Seconds lines waited in the send queue'),
+                ('tls_handshake_time', 'Seconds of the TLS handshakes')):
+            out.append('# HELP %s_%s_seconds %s'%(prefix, name, help_text))
+            out.append('# TYPE %s_%s_seconds histogram'%(prefix, name))
+            histogram = snapshot[name]
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                out.append('%s_%s_seconds_bucket{le="%s"} %d'%(prefix, name, bound, cumulative))
+            out.append('%s_%s_seconds_sum %r'%(prefix, name, histogram['sum']))
+            out.append('%s_%s_seconds_count %d'%(prefix, name, histogram['count']))
+        for name, key, help_text, kind in (('listener_calls_total', 'calls', 'Calls of a listener', 'counter'),
+                ('listener_seconds_total', 'seconds', 'Seconds spent in a listener', 'counter'),
+                ('listener_max_seconds', 'max', 'Longest call of a listener', 'gauge'),
+                ('listener_slow_calls_total', 'slow', 'Calls of a listener over the budget', 'counter')):
+            out.append('# HELP %s_%s %s'%(prefix, name, help_text))
+            out.append('# TYPE %s_%s %s'%(prefix, name, kind))
+            for listener, values in sorted(snapshot['listeners'].items()):
+                out.append('%s_%s{listener="%s"} %r'%(prefix, name, _escape(listener), values[key]))
+        return '\n'.join(out)+'\n'
+
+    def _listener_called(self, rec, seconds):
+        name = getattr(rec, '__qualname__', None) or repr(rec)
+        slow = seconds>self.listener_budget
+        with self._lock:
+            stats = self.listeners.get(name)
+            if stats is None:
+                stats = self.listeners[name] = [0, 0, 0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            if slow:
+                stats[3] += 1
+        if slow:
+            self.on_slow_listener(name, seconds)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _print_slow_listener(name, seconds):
+    print('listener %s took %.3f seconds'%(name, seconds))
@@ -6,6 +6,8 @@ class MockIrcClient(TwitchIrcClient):
         def _rec(msg):
             pass
         self.send_reciever=_rec
+        #There is no login, sending never has to wait
+        self._authenticated.set()
 
     def create_connection(self):
         pass
@@ -16,13 +18,27 @@ class MockIrcClient(TwitchIrcClient):
     def shutdown(self):
         pass
 
-    def send(self, msg):
+    def _send_now(self, msg):
+        #The send reciever gets every line as str
+        if isinstance(msg, bytes):
+            msg = msg.decode('utf-8')
         self.log(msg)
         self.send_reciever(msg)
 
     def mock_msg_incomming(self, msg):
         self.log(msg)
         self._handle_incomming(msg)
+        self._end_burst()
+
+    def mock_burst_incomming(self, msgs):
+        """
+        Handles several lines like they were read from the socket at once
+        Batch recievers get their events in one batch
+        """
+        for msg in msgs:
+            self.log(msg)
+            self._handle_incomming(msg)
+        self._end_burst()
 
     def set_send_reciever(self, reciever):
         self.send_reciever=reciever
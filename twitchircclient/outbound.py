@@ -0,0 +1,164 @@
+"""
+Encoding and coalescing of outgoing lines
+"""
+
+import functools
+import threading
+import time
+
+#Templates of the lines that are sent most, filled with encoded parameters
+PRIVMSG_TEMPLATE = b'PRIVMSG #%s :%s\r\n'
+JOIN_TEMPLATE = b'JOIN #%s\r\n'
+PART_TEMPLATE = b'PART #%s\r\n'
+PONG_TEMPLATE = b'PONG%s\r\n'
+
+#Maximum plaintext of a TLS record, a bigger write is split into several records anyway
+MAX_RECORD_SIZE = 16384
+
+def _check_param(value):
+    """
+    Raises ValueError if value would end the line early, e.g. 'Kappa\\r\\nPRIVMSG #other :spam'
+    """
+    if '\r' in value or '\n' in value or '\0' in value:
+        raise ValueError('line breaks are not allowed in irc parameters: %r'%value)
+
+def encode_privmsg(channel, message):
+    """
+    Args:
+        channel (str): The channel without '#'
+        message (str): The message, can't contain \\r, \\n or \\0
+    Returns:
+        (bytes): The PRIVMSG line
+    """
+    _check_param(channel)
+    _check_param(message)
+    return PRIVMSG_TEMPLATE % (channel.encode('utf-8'), message.encode('utf-8'))
+
+def encode_join(channel):
+    """
+    Args:
+        channel (str): The channel without '#'
+    Returns:
+        (bytes): The JOIN line
+    """
+    _check_param(channel)
+    return JOIN_TEMPLATE % channel.encode('utf-8')
+
+def encode_part(channel):
+    """
+    Args:
+        channel (str): The channel without '#'
+    Returns:
+        (bytes): The PART line
+    """
+    _check_param(channel)
+    return PART_TEMPLATE % channel.encode('utf-8')
+
+@functools.lru_cache(maxsize=16)
+def encode_pong(ping):
+    """
+    Args:
+        ping (str): A PING line of the server, e.g. 'PING :tmi.twitch.tv'
+    Returns:
+        (bytes): The PONG line that answers it, twitch sends the same PING every time so it is encoded once
+    """
+    return PONG_TEMPLATE % ping[4:].encode('utf-8')
+
+class OutboundBuffer:
+    """
+    Collects outgoing lines and writes them together
+    Every write to a TLS socket is at least one TLS record and one syscall. Instead of writing
+    every line on its own, the lines are buffered and written at once when the oldest one waited
+    delay seconds or max_size bytes are buffered, whatever comes first. A background thread
+    writes the lines that are due. Usage:
+    outbound = OutboundBuffer(sock.sendall, delay=0.005)
+    outbound.start()
+    outbound.put(b'PRIVMSG #channel :Kappa\\r\\n')
+    outbound.stop()
+    """
+    def __init__(self, write, delay=0.005, max_size=MAX_RECORD_SIZE, clock=time.monotonic):
+        """
+        Args:
+            write (function): Gets called with the buffered bytes
+            delay (float)(optional): Seconds a line may wait for more lines (default: 0.005)
+            max_size (int)(optional): Buffered bytes that are written at once without waiting (default: MAX_RECORD_SIZE)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        """
+        self._write=write
+        self.delay=delay
+        self.max_size=max_size
+        self._clock=clock
+        self._buffer = bytearray()
+        #Time the oldest buffered line was put, None if the buffer is empty
+        self._since = None
+        self._cond = threading.Condition()
+        #Held while writing, so two flushes can't reorder the lines
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        #Lines put and writes made, lines/writes is the number of lines per syscall
+        self.lines = 0
+        self.writes = 0
+
+    def put(self, data):
+        """
+        Buffers bytes, they are written when the delay is over or the buffer is full
+        """
+        with self._cond:
+            self._buffer += data
+            self.lines += 1
+            if self._since is None:
+                self._since = self._clock()
+                self._cond.notify_all()
+            full = len(self._buffer)>=self.max_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes everything that is buffered now"""
+        with self._write_lock:
+            with self._cond:
+                if not self._buffer:
+                    return
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                self._since = None
+                self.writes += 1
+            self._write(data)
+
+    def clear(self):
+        """Throws the buffered bytes away, e.g. when the connection is lost"""
+        with self._cond:
+            self._buffer.clear()
+            self._since = None
+
+    def start(self):
+        """Starts the background thread that writes the due lines"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, buffered lines stay in the buffer"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _next_delay(self):
+        #Seconds until the buffer is due, None if it is empty
+        if self._since is None:
+            return None
+        return self._since+self.delay-self._clock()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (self._next_delay() is None or self._next_delay()>0):
+                    self._cond.wait(self._next_delay())
+                if not self._running:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                #The reciever notices the lost connection
+                print('%s error occurred:%s'%(type(e),e))
@@ -0,0 +1,252 @@
+"""
+Pool of connections sharing one set of EventSpreaders
+"""
+
+import bisect
+import copy
+import ssl
+import threading
+import zlib
+from .twitchircclient import TwitchIrcClient
+from .ratelimit import AccountLimits
+
+#The EventSpreaders for events from twitch, they are shared by all connections of a pool
+EVENT_SPREADERS = ('messagespreader', 'joinspreader', 'partspreader', 'noticespreader',
+    'usernoticespreader', 'roomstatespreader', 'clearchatspreader', 'userstatespreader',
+    'globaluserstatespreader', 'hostspreader', 'whisperspreader', 'gainoperatorspreader',
+    'looseoperatorspreader', 'nameslistspreader', 'nameslistendspreader', 'joinconfirmspreader')
+
+STRATEGY_HASH='hash'
+STRATEGY_LOAD='load'
+
+#Points of every connection on the hash ring
+_VIRTUAL_NODES=64
+
+def _hash(key):
+    return zlib.crc32(key.encode('utf-8'))
+
+class TwitchIrcClientPool:
+    """
+    Spreads the joined channels over several connections
+    Every connection has its own socket and reciever thread, the events of all
+    connections are spread by the EventSpreaders of the pool. Usage:
+    pool = TwitchIrcClientPool('username','oauth:p4ssw0rd', size=4)
+    pool.messagespreader.add(messagelistener)
+    pool.create_connection()
+    pool.join_many(channels)
+    pool.sendprivmsg('channel','Kappa') #Sent by the connection that joined 'channel'
+    """
+    def __init__(self, username, oauthtoken, size=4, strategy=STRATEGY_HASH, client_class=TwitchIrcClient, **kwargs):
+        """
+        Args:
+            username (str): Your username to use for logging onto twitch
+            oauthtoken (str): Your oauthtoken, retrieved from twitchTv
+            size (int)(optional): Number of connections (default: 4)
+            strategy (str)(optional): STRATEGY_HASH assigns channels by consistent hashing,
+                STRATEGY_LOAD to the connection with the fewest channels (default: STRATEGY_HASH)
+            client_class (class)(optional): Class of the connections (default: TwitchIrcClient)
+            kwargs: Further arguments for every connection, see TwitchIrcClient, the connections
+                share one SSLContext and with rate_limit one AccountLimits, twitch limits the account
+        """
+        if not strategy in (STRATEGY_HASH, STRATEGY_LOAD):
+            raise ValueError('unknown strategy %s'%strategy)
+        self.username=username
+        self.strategy=strategy
+        if kwargs.get('use_ssl', True) and not isinstance(kwargs.get('ssl_context'), ssl.SSLContext):
+            #One context for all connections
+            kwargs['ssl_context'] = ssl.SSLContext(**kwargs.get('ssl_context', {}))
+        if kwargs.get('rate_limit') and not isinstance(kwargs['rate_limit'], AccountLimits):
+            kwargs['rate_limit'] = AccountLimits()
+        backoff = kwargs.pop('backoff', None)
+        #Every connection counts its own attempts
+        self.shards = [client_class(username, oauthtoken, backoff=copy.copy(backoff), **kwargs) for _ in range(size)]
+        for name in EVENT_SPREADERS:
+            spreader = self.shards[0]._create_spreader()
+            setattr(self, name, spreader)
+            for shard in self.shards:
+                setattr(shard, name, spreader)
+        for shard in self.shards:
+            shard._watch_spreaders()
+        #Lowercase channel -> index of the connection that joined it
+        self.channels = {}
+        self._healthy = set(range(size))
+        self._lock = threading.RLock()
+        self._ring = sorted((_hash('%d-%d'%(index, node)), index) for index in range(size) for node in range(_VIRTUAL_NODES))
+        for index, shard in enumerate(self.shards):
+            shard.disconnectspreader.add(self._shard_disconnected(index))
+            shard.connectspreader.add(self._shard_connected(index))
+
+    def create_connection(self):
+        """Creates the connections of all shards"""
+        for shard in self.shards:
+            shard.create_connection()
+
+    def shutdown(self):
+        """Shuts down all connections"""
+        for shard in self.shards:
+            shard.shutdown()
+
+    def shard_for(self, channel):
+        """
+        Returns:
+            (TwitchIrcClient): The connection that joined the channel, or would join it
+        """
+        with self._lock:
+            index = self.channels.get(channel.lower())
+            if index is None:
+                index = self._choose(channel.lower())
+            return self.shards[index]
+
+    def join(self, channel):
+        """
+        Join a channel on one of the connections
+        """
+        self.join_many([channel])
+
+    def join_many(self, channels):
+        """
+        Join many channels, every connection joins its channels with join_many
+        """
+        groups = {}
+        with self._lock:
+            for channel in channels:
+                key = channel.lower()
+                if key in self.channels:
+                    continue
+                index = self._choose(key)
+                self.channels[key] = index
+                groups.setdefault(index, []).append(channel)
+        for index, group in groups.items():
+            self.shards[index].join_many(group)
+
+    def part(self, channel):
+        """
+        Leave a channel
+        """
+        self.part_many([channel])
+
+    def part_many(self, channels):
+        """
+        Leave many channels
+        """
+        groups = {}
+        with self._lock:
+            for channel in channels:
+                index = self.channels.pop(channel.lower(), None)
+                if not index is None:
+                    groups.setdefault(index, []).append(channel)
+        for index, group in groups.items():
+            self.shards[index].part_many(group)
+
+    def sendprivmsg(self, channel, message):
+        """
+        Send a Message to a channel, using the connection that joined the channel
+        """
+        self.shard_for(channel).sendprivmsg(channel, message)
+
+    def sendwhisper(self, username, message):
+        """
+        Send a whisper-message to a user
+        """
+        self.shard_for(self.username).sendwhisper(username, message)
+
+    def timeout(self, channel, username, duration=600):
+        """
+        Time out a user in a channel with an optional duration in seconds (default: 600)
+        """
+        self.shard_for(channel).timeout(channel, username, duration)
+
+    def ban(self, channel, username):
+        """
+        Ban a user from the channel
+        """
+        self.shard_for(channel).ban(channel, username)
+
+    def unban(self, channel, username):
+        """
+        Unban a user from the channel
+        """
+        self.shard_for(channel).unban(channel, username)
+
+    def rebalance(self):
+        """
+        Moves channels to the connection they belong to
+        For STRATEGY_HASH that is their connection on the hash ring, for STRATEGY_LOAD
+        channels are moved until all connections have about the same number of channels
+        Called automatically when a connection is connected again
+        Returns:
+            (int): Number of moved channels
+        """
+        moves = []
+        with self._lock:
+            if self.strategy==STRATEGY_HASH:
+                for channel, index in self.channels.items():
+                    target = self._choose(channel)
+                    if target!=index:
+                        moves.append((channel, index, target))
+            else:
+                loads = {index: [] for index in self._healthy}
+                for channel, index in self.channels.items():
+                    if index in loads:
+                        loads[index].append(channel)
+                    else:
+                        #The connection is down, the channel has to be moved anyway
+                        moves.append((channel, index, None))
+                for move_index, (channel, index, target) in enumerate(moves):
+                    target = min(loads, key=lambda i: len(loads[i]))
+                    #In front, so balancing below moves channels that didn't move yet
+                    loads[target].insert(0, channel)
+                    moves[move_index] = (channel, index, target)
+                while loads:
+                    most = max(loads, key=lambda i: len(loads[i]))
+                    fewest = min(loads, key=lambda i: len(loads[i]))
+                    if len(loads[most])-len(loads[fewest])<=1:
+                        break
+                    channel = loads[most].pop()
+                    loads[fewest].append(channel)
+                    moves.append((channel, most, fewest))
+            for channel, index, target in moves:
+                self.channels[channel] = target
+        for channel, index, target in moves:
+            self._move(channel, index, target)
+        return len(moves)
+
+    #Begin "private" methods
+    def _choose(self, channel):
+        #Index of the connection a new channel is assigned to, only healthy connections are used
+        candidates = self._healthy or set(range(len(self.shards)))
+        if self.strategy==STRATEGY_LOAD:
+            loads = {index: 0 for index in candidates}
+            for index in self.channels.values():
+                if index in loads:
+                    loads[index]+=1
+            return min(sorted(loads), key=lambda index: loads[index])
+        pos = bisect.bisect(self._ring, (_hash(channel), len(self.shards)))
+        for offset in range(len(self._ring)):
+            index = self._ring[(pos+offset)%len(self._ring)][1]
+            if index in candidates:
+                return index
+
+    def _move(self, channel, index, target):
+        old = self.shards[index]
+        if index in self._healthy:
+            old.part(channel)
+        else:
+            #Don't let the connection rejoin the channel when it is back
+            old.joined_channels.discard(channel)
+        self.shards[target].join(channel)
+
+    def _shard_disconnected(self, index):
+        def listener():
+            with self._lock:
+                self._healthy.discard(index)
+        return listener
+
+    def _shard_connected(self, index):
+        def listener():
+            with self._lock:
+                returned = not index in self._healthy
+                self._healthy.add(index)
+            if returned:
+                self.rebalance()
+        return listener
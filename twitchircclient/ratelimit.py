@@ -0,0 +1,252 @@
+"""
+Rate limiting of outgoing lines
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+#Limit classes, each one has its own token buckets
+LIMIT_MESSAGE='message'
+LIMIT_MODERATOR='moderator'
+LIMIT_JOIN='join'
+LIMIT_WHISPER='whisper'
+
+#Lower values are sent first
+PRIORITY_HIGH=0
+PRIORITY_NORMAL=1
+
+#(lines, seconds) per limit class, see https://dev.twitch.tv/docs/irc/guide#command--message-limits
+DEFAULT_LIMITS = {
+    LIMIT_MESSAGE: [(20, 30)],
+    LIMIT_MODERATOR: [(100, 30)],
+    LIMIT_JOIN: [(20, 10)],
+    LIMIT_WHISPER: [(3, 1), (100, 60)],
+}
+
+#Limit classes whose lines also count against the buckets of other classes, twitch counts the
+#messages of an account in one window: moderator messages use up the limit of normal messages
+#and the other way around, but a line only waits for the buckets of its own class
+DEFAULT_SHARED = {
+    LIMIT_MESSAGE: (LIMIT_MODERATOR,),
+    LIMIT_MODERATOR: (LIMIT_MESSAGE,),
+}
+
+class TokenBucket:
+    """
+    Allows capacity tokens per period, refills continuously
+    Usage:
+    bucket = TokenBucket(20, 30)
+    if bucket.delay()==0:
+        bucket.consume()
+    """
+    def __init__(self, capacity, period, clock=time.monotonic):
+        """
+        Args:
+            capacity (int): Maximum number of tokens
+            period (float): Seconds until an empty bucket is full again
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        """
+        self.capacity=capacity
+        self.rate=capacity/period
+        self.tokens=capacity
+        self._clock=clock
+        self._last=clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens+(now-self._last)*self.rate)
+        self._last = now
+
+    def delay(self, cost=1):
+        """
+        Returns:
+            (float): Seconds until cost tokens are available, 0 if they are available now
+        """
+        self._refill()
+        if self.tokens>=cost:
+            return 0
+        return (cost-self.tokens)/self.rate
+
+    def consume(self, cost=1):
+        """Takes cost tokens out of the bucket"""
+        self._refill()
+        self.tokens-=cost
+
+    def drain(self, cost=1):
+        """Takes up to cost tokens out of the bucket, it doesn't get below empty"""
+        self._refill()
+        self.tokens = max(0, self.tokens-cost)
+
+class AccountLimits:
+    """
+    The token buckets of one account
+    Twitch limits the account, not the connection: connections of the same account
+    (e.g. the shards of a TwitchIrcClientPool) share one AccountLimits, so all of them
+    together stay within the limits. Usage:
+    limits = AccountLimits()
+    first = SendQueue(irc1.send, account_limits=limits)
+    second = SendQueue(irc2.send, account_limits=limits)
+    """
+    def __init__(self, limits=DEFAULT_LIMITS, clock=time.monotonic, shared=DEFAULT_SHARED):
+        """
+        Args:
+            limits (dict)(optional): List of (lines, seconds) per limit class (default: DEFAULT_LIMITS)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+            shared (dict)(optional): Limit classes whose buckets are drained by the lines of a limit
+                class as well (default: DEFAULT_SHARED)
+        """
+        self.buckets = {limit_class: [TokenBucket(capacity, period, clock) for capacity, period in bucket_limits]
+            for limit_class, bucket_limits in limits.items()}
+        self.shared=shared
+        #Held while the buckets are checked and consumed, the queues run in different threads
+        self.lock = threading.Lock()
+
+class SendQueue:
+    """
+    Bounded queue for outgoing lines, a background thread sends them as fast as
+    the token buckets of their limit class allow. Lines with a lower priority
+    value are sent first.
+    Usage:
+    sq = SendQueue(irc.send)
+    sq.start()
+    sq.put('PRIVMSG #channel :Kappa\\r\\n', LIMIT_MESSAGE)
+    sq.stop()
+    Instead of start, process can be called to send everything that is allowed right now
+    """
+    def __init__(self, send, maxsize=1000, limits=DEFAULT_LIMITS, clock=time.monotonic, shared=DEFAULT_SHARED, account_limits=None):
+        """
+        Args:
+            send (function): Gets called with every line that can be sent
+            maxsize (int)(optional): Maximum number of queued lines, put waits if the queue is full (default: 1000)
+            limits (dict)(optional): List of (lines, seconds) per limit class (default: DEFAULT_LIMITS)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+            shared (dict)(optional): Limit classes whose buckets are drained by the lines of a limit
+                class as well (default: DEFAULT_SHARED)
+            account_limits (AccountLimits)(optional): Buckets shared with the queues of other connections
+                of the account, limits and shared are not used then (default: own buckets)
+        """
+        self._send=send
+        self.maxsize=maxsize
+        self._clock=clock
+        if account_limits is None:
+            account_limits = AccountLimits(limits, clock, shared)
+        self.account_limits=account_limits
+        self._buckets = account_limits.buckets
+        self._queues = {limit_class: [] for limit_class in self._buckets}
+        self._cond = threading.Condition()
+        self._count = 0
+        #Set by put, so the background thread doesn't sleep over new lines
+        self._changed = False
+        self._seq = itertools.count()
+        self._running = False
+        self._thread = None
+        self._sent = 0
+        self._wait_total = 0
+        self._wait_max = 0
+        #Called with the seconds every sent line waited, see metrics.ClientMetrics.line_sent
+        self.on_sent = None
+
+    def put(self, msg, limit_class=LIMIT_MESSAGE, priority=PRIORITY_NORMAL, cost=1, timeout=None, force=False):
+        """
+        Queues a line
+        Args:
+            msg (str): The line to send
+            limit_class (str)(optional): The limit class whose buckets are used (default: LIMIT_MESSAGE)
+            priority (int)(optional): Lines with a lower priority are sent first (default: PRIORITY_NORMAL)
+            cost (int)(optional): Number of tokens the line takes (default: 1)
+            timeout (float)(optional): Seconds to wait if the queue is full before raising queue.Full (default: wait forever)
+            force (bool)(optional): Queue the line even if the queue is full (default: False)
+        """
+        with self._cond:
+            if not force and not self._cond.wait_for(lambda: self._count<self.maxsize, timeout):
+                raise queue.Full('send queue is full')
+            heapq.heappush(self._queues[limit_class], (priority, next(self._seq), self._clock(), msg, cost))
+            self._count += 1
+            self._changed = True
+            self._cond.notify_all()
+
+    def process(self):
+        """
+        Sends all queued lines the limits allow right now
+        Returns:
+            (float): Seconds until the next queued line can be sent, None if the queue is empty
+        """
+        while True:
+            with self._cond, self.account_limits.lock:
+                self._changed = False
+                next_delay = None
+                best = None
+                for limit_class, lines in self._queues.items():
+                    if not lines:
+                        continue
+                    cost = lines[0][4]
+                    delay = max(bucket.delay(cost) for bucket in self._buckets[limit_class])
+                    if delay>0:
+                        if next_delay is None or delay<next_delay:
+                            next_delay = delay
+                    elif best is None or lines[0][:2]<self._queues[best][0][:2]:
+                        best = limit_class
+                if best is None:
+                    return next_delay
+                priority, seq, queued, msg, cost = heapq.heappop(self._queues[best])
+                for bucket in self._buckets[best]:
+                    bucket.consume(cost)
+                for other in self.account_limits.shared.get(best, ()):
+                    for bucket in self._buckets.get(other, ()):
+                        bucket.drain(cost)
+                self._count -= 1
+                waited = self._clock()-queued
+                self._sent += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                self._cond.notify_all()
+            if not self.on_sent is None:
+                self.on_sent(waited)
+            self._send(msg)
+
+    def max_cost(self, limit_class):
+        """
+        Returns:
+            (int): The highest cost a single line of the limit class can have
+        """
+        return min(bucket.capacity for bucket in self._buckets[limit_class])
+
+    def start(self):
+        """Starts the background thread that sends the queued lines"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, queued lines stay in the queue"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def metrics(self):
+        """
+        Returns:
+            (dict): queued lines in total and per limit class, sent lines, average and maximum seconds lines waited
+        """
+        with self._cond:
+            return {
+                'queued': self._count,
+                'queued_by_class': {limit_class: len(lines) for limit_class, lines in self._queues.items()},
+                'sent': self._sent,
+                'wait_avg': self._wait_total/self._sent if self._sent else 0,
+                'wait_max': self._wait_max,
+            }
+
+    def _run(self):
+        while self._running:
+            try:
+                delay = self.process()
+            except Exception as e:
+                print('%s error occurred:%s'%(type(e),e))
+                delay = 1
+            with self._cond:
+                if self._running and not self._changed:
+                    self._cond.wait(delay)
@@ -0,0 +1,303 @@
+"""
+Running many TwitchIrcClients in one thread with selectors
+"""
+
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import selectors
+import socket
+import ssl
+import threading
+import time
+
+#Raised by non-blocking sockets that can't read or write right now
+_WOULD_BLOCK = (BlockingIOError, InterruptedError, ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+class Timer:
+    """Call scheduled with Reactor.call_later"""
+    __slots__ = ('when', 'func', 'args', 'cancelled')
+
+    def __init__(self, when, func, args):
+        self.when = when
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Reactor:
+    """
+    Reads and writes the sockets of many TwitchIrcClients in a single thread
+    Without a reactor every client has its own reciever thread with a blocking socket.
+    With a reactor the sockets are non-blocking and registered with a selector (epoll on
+    linux), the recievers and keepalives of all clients run in the reactor thread. Lines
+    sent from other threads are buffered and written by the reactor thread, so a TLS
+    socket is never used by two threads. Connecting blocks (DNS, TLS handshake), so
+    reconnects connect in a small pool of connect threads. Usage:
+    reactor = Reactor()
+    reactor.start()
+    for username, oauthtoken in accounts:
+        irc = TwitchIrcClient(username, oauthtoken, reactor=reactor)
+        irc.messagespreader.add(messagelistener)
+        irc.create_connection()
+    ...
+    reactor.stop()
+    """
+    def __init__(self, connect_workers=4, selector=None, clock=time.monotonic):
+        """
+        Args:
+            connect_workers (int)(optional): Threads that connect the sockets of reconnects (default: 4)
+            selector (selectors.BaseSelector)(optional): The selector (default: selectors.DefaultSelector())
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        """
+        self._selector = selector or selectors.DefaultSelector()
+        self._clock = clock
+        #Other threads add calls and write a byte to wake up the select
+        self._calls = collections.deque()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, None)
+        self._timers = []
+        self._counter = itertools.count()
+        self._connector = concurrent.futures.ThreadPoolExecutor(connect_workers, thread_name_prefix='twitchircclient-connect')
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """Runs the reactor in a new thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='twitchircclient-reactor', daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """Runs the reactor in the current thread until stop is called"""
+        self._running = True
+        self._thread = threading.current_thread()
+        self._run()
+
+    def stop(self, wait=True):
+        """
+        Stops the reactor, the clients should be shut down before
+        Args:
+            wait (bool)(optional): Wait until the reactor thread is finished (default: True)
+        """
+        self._running = False
+        self._wake()
+        self._connector.shutdown(wait)
+        if wait and not self._thread is None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def in_reactor_thread(self):
+        return threading.current_thread() is self._thread
+
+    def call_soon(self, func, *args):
+        """Calls func with args in the reactor thread, can be called from any thread"""
+        self._calls.append((func, args))
+        if not self.in_reactor_thread():
+            self._wake()
+
+    def call_later(self, delay, func, *args):
+        """
+        Calls func with args in the reactor thread after delay seconds
+        Returns:
+            (Timer): Handle to cancel the call
+        """
+        timer = Timer(self._clock()+delay, func, args)
+        self.call_soon(self._add_timer, timer)
+        return timer
+
+    #Called by the TwitchIrcClient
+    def add(self, client):
+        """Starts reading the connected socket of the client"""
+        self.call_soon(self._register, client)
+
+    def remove(self, client):
+        """Stops reading the socket of the client, writes what is buffered and closes it"""
+        self.call_soon(self._close, client)
+
+    def write(self, client, delay=0):
+        """
+        Writes the buffered output of the client after the current round, so the lines sent
+        while handling the reads of one round are written together
+        Args:
+            delay (float)(optional): Seconds to wait for more lines before writing (default: 0)
+        """
+        if delay:
+            self.call_later(delay, self._flush, client)
+        else:
+            self.call_soon(self._flush, client)
+
+    def reconnect(self, client):
+        """Closes the socket of the client and connects a new one in a connect thread"""
+        if not self.in_reactor_thread():
+            self.call_soon(self.reconnect, client)
+            return
+        self._unregister(client)
+        with client._out_lock:
+            client._out.clear()
+        client._reconnect_begin()
+        self._connect(client)
+
+    #Begin "private" methods
+    def _wake(self):
+        try:
+            self._wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            #Already woken up, or stopped
+            pass
+
+    def _add_timer(self, timer):
+        heapq.heappush(self._timers, (timer.when, next(self._counter), timer))
+
+    def _run(self):
+        try:
+            while self._running:
+                for key, mask in self._selector.select(self._timeout()):
+                    if key.data is None:
+                        self._drain_wakeup()
+                        continue
+                    if mask&selectors.EVENT_READ:
+                        self._read(key.data)
+                    if mask&selectors.EVENT_WRITE:
+                        self._flush(key.data)
+                self._run_timers()
+                self._run_calls()
+        finally:
+            self._selector.close()
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
+
+    def _timeout(self):
+        if self._calls:
+            return 0
+        if not self._timers:
+            return None
+        return max(0, self._timers[0][0]-self._clock())
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _run_calls(self):
+        #Calls added while running are made in the next round, after the next select
+        for _ in range(len(self._calls)):
+            func, args = self._calls.popleft()
+            self._guarded(func, *args)
+
+    def _run_timers(self):
+        now = self._clock()
+        while self._timers and self._timers[0][0]<=now:
+            timer = heapq.heappop(self._timers)[2]
+            if not timer.cancelled:
+                self._guarded(timer.func, *timer.args)
+
+    def _guarded(self, func, *args):
+        #An exception must not stop the reactor and the other clients
+        try:
+            func(*args)
+        except Exception as e:
+            print('%s error occurred:%s'%(type(e),e))
+
+    def _register(self, client):
+        client._sock.setblocking(False)
+        self._selector.register(client._sock, self._events(client), client)
+
+    def _unregister(self, client):
+        try:
+            self._selector.unregister(client._sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _events(self, client):
+        if client._out:
+            return selectors.EVENT_READ|selectors.EVENT_WRITE
+        return selectors.EVENT_READ
+
+    def _close(self, client):
+        self._flush(client)
+        self._unregister(client)
+        try:
+            client._kill_socket()
+        except OSError as e:
+            client.log('Error during shutdown: %s'%e)
+
+    def _read(self, client):
+        sock = client._sock
+        while True:
+            try:
+                lines = client._framer.recv_from(sock)
+            except _WOULD_BLOCK:
+                break
+            except OSError as e:
+                client.log('reconnecting because of %s'%e)
+                lines = None
+            if lines is None:
+                if client.go_on:
+                    client.log('reconnecting because of empty data')
+                    self.reconnect(client)
+                else:
+                    self._unregister(client)
+                return
+            for data in lines:
+                self._guarded(client._handle_incomming, data)
+            #A TLS socket can have decrypted data left that the selector doesn't report
+            if not isinstance(sock, ssl.SSLSocket) or not sock.pending():
+                break
+        self._guarded(client._end_burst)
+
+    def _flush(self, client):
+        with client._out_lock:
+            while client._out:
+                try:
+                    sent = client._sock.send(client._out)
+                except _WOULD_BLOCK:
+                    break
+                except OSError as e:
+                    #The reader notices the lost connection
+                    client.log('Error during send: %s'%e)
+                    client._out.clear()
+                    break
+                del client._out[:sent]
+            events = self._events(client)
+        try:
+            key = self._selector.get_key(client._sock)
+        except (KeyError, ValueError):
+            #Not registered yet or anymore, add/reconnect write the rest
+            return
+        if key.events!=events:
+            self._selector.modify(client._sock, events, client)
+
+    def _connect(self, client):
+        #Waits for the backoff of the client, like TwitchIrcClient._connect_with_backoff
+        if not client.go_on:
+            return
+        delay = client.backoff.next_delay()
+        if delay:
+            client.log('reconnecting in %.1f seconds'%delay)
+            self.call_later(delay, self._connector.submit, self._connect_in_background, client)
+        else:
+            self._connector.submit(self._connect_in_background, client)
+
+    def _connect_in_background(self, client):
+        try:
+            client._connect()
+        except OSError as e:
+            client.log('Error during reconnect: %s'%e)
+            self.call_soon(self._connect, client)
+            return
+        self.call_soon(self._reconnected, client)
+
+    def _reconnected(self, client):
+        if not client.go_on:
+            #Shut down while connecting
+            client._kill_socket()
+            return
+        self._register(client)
+        client._reconnect_end()
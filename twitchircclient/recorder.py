@@ -0,0 +1,183 @@
+"""
+Recording raw irc traffic and replaying it without a connection
+Log format: the header b'TIRC' and a version byte, followed by blocks.
+Every block starts with flags (1 byte), the length of the records (4 bytes) and the
+stored length (4 bytes), all little endian. The stored bytes are the records, zlib
+compressed if flags has BLOCK_ZLIB set. A record is the timestamp (8 byte double),
+the length of the line (4 bytes) and the utf-8 encoded line without \\r\\n.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from .mockircclient import MockIrcClient
+
+MAGIC = b'TIRC'
+VERSION = 1
+BLOCK_ZLIB = 1
+
+_header = struct.Struct('<4sB')
+_block = struct.Struct('<BII')
+_record = struct.Struct('<dI')
+
+class TrafficRecorder:
+    """
+    Appends raw lines with their timestamps to a log file
+    Lines are collected in a block, which is written when it is full or on flush/close.
+    Usage:
+    recorder = TrafficRecorder('traffic.tirc', compress=True)
+    irc = TwitchIrcClient('username','oauth:p4ssw0rd', recorder=recorder)
+    ...
+    irc.shutdown()
+    recorder.close()
+    """
+    def __init__(self, path, compress=False, block_size=65536, clock=time.time):
+        """
+        Args:
+            path (str): The log file, new lines are appended if it exists
+            compress (bool)(optional): Whether the blocks are compressed with zlib (default: False)
+            block_size (int)(optional): Bytes of records collected before a block is written (default: 65536)
+            clock (function)(optional): Returns the timestamp of a line (default: time.time)
+        """
+        self.path=path
+        self.compress=compress
+        self.block_size=block_size
+        self._clock=clock
+        self._lock=threading.Lock()
+        self._buffer=bytearray()
+        self._file=open(path, 'ab')
+        if self._file.tell()==0:
+            self._file.write(_header.pack(MAGIC, VERSION))
+        else:
+            _check_header(path)
+
+    def record(self, line, timestamp=None):
+        """
+        Args:
+            line (str): The line without \\r\\n
+            timestamp (float)(optional): When the line was recieved (default: now)
+        """
+        if timestamp is None:
+            timestamp = self._clock()
+        data = line.encode('utf-8')
+        with self._lock:
+            self._buffer += _record.pack(timestamp, len(data))
+            self._buffer += data
+            if len(self._buffer)>=self.block_size:
+                self._write_block()
+
+    def flush(self):
+        """Writes the collected lines to the file"""
+        with self._lock:
+            self._write_block()
+            self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_block(self):
+        if not self._buffer:
+            return
+        if self.compress:
+            flags = BLOCK_ZLIB
+            stored = zlib.compress(self._buffer)
+        else:
+            flags = 0
+            stored = self._buffer
+        self._file.write(_block.pack(flags, len(self._buffer), len(stored)))
+        self._file.write(stored)
+        self._buffer = bytearray()
+
+def _check_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(_header.size)
+    if len(header)<_header.size or _header.unpack(header)!=(MAGIC, VERSION):
+        raise ValueError('%s is not a traffic log'%path)
+
+def read_records(path):
+    """
+    Reads a log written by TrafficRecorder, the file is memory mapped
+    Returns:
+        (generator): (timestamp, line) tuples
+    """
+    _check_header(path)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size==_header.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pos = _header.size
+            while pos+_block.size<=len(mapped):
+                flags, length, stored = _block.unpack_from(mapped, pos)
+                pos += _block.size
+                #The views have to be released before the mmap is closed
+                with memoryview(mapped)[pos:pos+stored] as records:
+                    if flags&BLOCK_ZLIB:
+                        yield from _read_block(zlib.decompress(records))
+                    else:
+                        yield from _read_block(records)
+                pos += stored
+
+def _read_block(records):
+    pos = 0
+    end = len(records)
+    while pos<end:
+        timestamp, length = _record.unpack_from(records, pos)
+        pos += _record.size
+        yield timestamp, str(records[pos:pos+length], 'utf-8')
+        pos += length
+
+class ReplayClient(MockIrcClient):
+    """
+    MockIrcClient that handles the lines of a log written by TrafficRecorder
+    The recievers are called like with a real connection. Usage:
+    irc = ReplayClient('traffic.tirc')
+    irc.messagespreader.add(messagelistener)
+    irc.replay() #As fast as possible
+    irc.replay(realtime=True) #With the delays of the recording
+    """
+    def __init__(self, path, username='replay_user', *args, **kwargs):
+        """
+        Args:
+            path (str): The log file
+            username (str)(optional): Our username in the recording (default: replay_user)
+            args, kwargs: Further arguments, see TwitchIrcClient
+        """
+        super().__init__(username, None, *args, **kwargs)
+        self.path=path
+
+    def replay(self, realtime=False, speed=1.0, sleep=time.sleep, clock=time.monotonic):
+        """
+        Handles all lines of the log
+        Args:
+            realtime (bool)(optional): Wait between the lines as long as in the recording (default: False)
+            speed (float)(optional): How much faster than recorded a realtime replay is (default: 1.0)
+            sleep (function)(optional): Waits for the given seconds (default: time.sleep)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        Returns:
+            (int): Number of handled lines
+        """
+        count = 0
+        first = None
+        start = clock()
+        for timestamp, line in read_records(self.path):
+            if realtime:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp-first)/speed-(clock()-start)
+                if delay>0:
+                    sleep(delay)
+            self._handle_incomming(line)
+            self._end_burst()
+            count += 1
+        self._flush_all_batches()
+        return count
@@ -0,0 +1,168 @@
+"""
+Two connections for the same channels, one of them as a hot standby
+"""
+
+import copy
+import ssl
+import threading
+from .twitchircclient import TwitchIrcClient
+from .intern import InternTable
+from .pool import EVENT_SPREADERS
+from .ratelimit import AccountLimits
+
+#Spreaders of events with the unique id tag, they get the events of both connections, every id once
+DEDUP_SPREADERS = ('messagespreader', 'usernoticespreader')
+
+class HotStandbyClient:
+    """
+    Two logged in connections that joined the same channels
+    Messages and usernotices are recieved on both connections and spread once (by their id
+    tag), so no message is lost while one connection reconnects. The other events and
+    sending use the active connection; when it looses its connection the standby becomes
+    the active one right away. Usage:
+    irc = HotStandbyClient('username','oauth:p4ssw0rd')
+    irc.messagespreader.add(messagelistener)
+    irc.create_connection()
+    irc.join('channel')
+    irc.sendprivmsg('channel','Kappa') #Sent by the active connection
+    """
+    def __init__(self, username, oauthtoken, client_class=TwitchIrcClient, dedup_size=10000, **kwargs):
+        """
+        Args:
+            username (str): Your username to use for logging onto twitch
+            oauthtoken (str): Your oauthtoken, retrieved from twitchTv
+            client_class (class)(optional): Class of the connections (default: TwitchIrcClient)
+            dedup_size (int)(optional): Number of recent message ids that are remembered, see
+                intern.InternTable (default: 10000)
+            kwargs: Further arguments for both connections, see TwitchIrcClient, the connections
+                share one SSLContext and with rate_limit one AccountLimits. Both connections join
+                every channel, so rate_limit=True is recommended: the joins of both are paced
+                against the join limit of the account
+        """
+        if kwargs.get('use_ssl', True) and not isinstance(kwargs.get('ssl_context'), ssl.SSLContext):
+            kwargs['ssl_context'] = ssl.SSLContext(**kwargs.get('ssl_context', {}))
+        if kwargs.get('rate_limit') and not isinstance(kwargs['rate_limit'], AccountLimits):
+            kwargs['rate_limit'] = AccountLimits()
+        backoff = kwargs.pop('backoff', None)
+        self.username=username
+        self.connections = [client_class(username, oauthtoken, backoff=copy.copy(backoff), **kwargs) for _ in range(2)]
+        self._active = 0
+        self._lock = threading.RLock()
+        #Held while a message or usernotice is checked and spread, not by the failover, so a
+        #listener that waits for the connection can't block it
+        self._spread_lock = threading.RLock()
+        self._seen = InternTable(dedup_size)
+        #Events with an id that was already spread
+        self.duplicates = 0
+        self.failovers = 0
+        #Called without arguments when the standby became the active connection
+        self.failoverspreader = self.connections[0]._create_spreader()
+        for name in EVENT_SPREADERS:
+            spreader = self.connections[0]._create_spreader()
+            if name in DEDUP_SPREADERS:
+                spreader.spread_event = self._deduplicated(spreader.spread_event)
+                for conn in self.connections:
+                    setattr(conn, name, spreader)
+            setattr(self, name, spreader)
+        #Spreaders without recievers for the other events of the standby
+        self._idle = [{name: conn._create_spreader() for name in EVENT_SPREADERS if not name in DEDUP_SPREADERS}
+            for conn in self.connections]
+        self._assign()
+        for index, conn in enumerate(self.connections):
+            conn.disconnectspreader.add(self._connection_lost(index))
+
+    @property
+    def active(self):
+        """(TwitchIrcClient): The connection that sends and spreads the events without id"""
+        return self.connections[self._active]
+
+    @property
+    def standby(self):
+        return self.connections[1-self._active]
+
+    def create_connection(self):
+        """Creates both connections"""
+        for conn in self.connections:
+            conn.create_connection()
+
+    def shutdown(self):
+        """Shuts down both connections"""
+        for conn in self.connections:
+            conn.shutdown()
+
+    def join(self, channel):
+        """
+        Join a channel on both connections
+        """
+        for conn in self.connections:
+            conn.join(channel)
+
+    def join_many(self, channels):
+        channels = list(channels)
+        for conn in self.connections:
+            conn.join_many(channels)
+
+    def part(self, channel):
+        for conn in self.connections:
+            conn.part(channel)
+
+    def part_many(self, channels):
+        channels = list(channels)
+        for conn in self.connections:
+            conn.part_many(channels)
+
+    def send(self, msg):
+        self.active.send(msg)
+
+    def sendprivmsg(self, channel, message):
+        self.active.sendprivmsg(channel, message)
+
+    def sendwhisper(self, username, message):
+        self.active.sendwhisper(username, message)
+
+    def timeout(self, channel, username, duration=600):
+        self.active.timeout(channel, username, duration)
+
+    def ban(self, channel, username):
+        self.active.ban(channel, username)
+
+    def unban(self, channel, username):
+        self.active.unban(channel, username)
+
+    #Begin "private" methods
+    def _assign(self):
+        """
+        Gives the shared spreaders to the active connection and the idle ones to the standby
+        """
+        for index, conn in enumerate(self.connections):
+            for name, idle in self._idle[index].items():
+                setattr(conn, name, getattr(self, name) if index==self._active else idle)
+            #Updates the skipped commands and capabilities of the connection
+            conn._watch_spreaders()
+
+    def _deduplicated(self, spread_event):
+        def spread_once(event):
+            message_id = event.tags.get('id')
+            #Both reciever threads spread here, the events are spread one after the other in the
+            #order they were admitted, so the listeners are never called at the same time
+            with self._spread_lock:
+                if not message_id is None:
+                    if message_id in self._seen:
+                        self.duplicates += 1
+                        return
+                    self._seen.intern(message_id)
+                spread_event(event)
+        return spread_once
+
+    def _connection_lost(self, index):
+        def listener():
+            with self._lock:
+                other = self.connections[1-index]
+                if index!=self._active or not other._authenticated.is_set():
+                    #The standby is lost, or there is nothing to switch to
+                    return
+                self._active = 1-index
+                self.failovers += 1
+                self._assign()
+            self.failoverspreader.spread()
+        return listener
@@ -0,0 +1,148 @@
+"""
+State of the joined channels, kept up to date by the TwitchIrcClient
+"""
+
+import sys
+
+#Commands the store needs, they are handled even if no spreader has recievers
+STATE_COMMANDS = ('JOIN', 'PART', 'ROOMSTATE', 'USERSTATE', '353', '366')
+
+class ChannelState:
+    """
+    State of one joined channel
+    roomstate holds the last value of every ROOMSTATE tag (twitch only sends the changed
+    ones after the first ROOMSTATE), userstate the tags of our last USERSTATE and
+    members the lowercase usernames in the channel
+    """
+    __slots__ = ('channel', 'roomstate', 'userstate', 'members')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.roomstate = {}
+        self.userstate = None
+        self.members = set()
+
+    @property
+    def slow(self):
+        """(int): Seconds users have to wait between messages, 0 if slow mode is off"""
+        return int(self.roomstate.get('slow') or 0)
+
+    @property
+    def followers_only(self):
+        """(int): Minutes users have to follow before they can chat, -1 if followers-only mode is off"""
+        return int(self.roomstate.get('followers-only') or -1)
+
+    @property
+    def subs_only(self):
+        """(bool): Whether only subscribers can chat"""
+        return self.roomstate.get('subs-only')=='1'
+
+    @property
+    def emote_only(self):
+        """(bool): Whether only emotes can be sent"""
+        return self.roomstate.get('emote-only')=='1'
+
+    @property
+    def r9k(self):
+        """(bool): Whether messages have to be unique"""
+        return self.roomstate.get('r9k')=='1'
+
+    @property
+    def is_moderator(self):
+        """(bool): Whether we are moderator or broadcaster in the channel"""
+        if self.userstate is None:
+            return False
+        return self.userstate.get('mod')=='1' or 'broadcaster' in self.userstate.badge_list()
+
+    def __repr__(self):
+        return 'ChannelState(%r, members=%d, roomstate=%r)'%(self.channel, len(self.members), self.roomstate)
+
+class ChannelStateStore:
+    """
+    Per channel state, updated by ROOMSTATE, USERSTATE, NAMES (353 until 366), JOIN and PART
+    Usernames are interned, so a user in many channels is stored once. Enable it with
+    TwitchIrcClient(..., track_state=True), the store is irc.state. Usage:
+    irc.state.is_member('channel', 'username')
+    irc.state['channel'].slow
+    """
+    def __init__(self, username, intern=sys.intern):
+        """
+        Args:
+            username (str): Our own username, the channel is removed when we leave it
+            intern (function)(optional): Returns a shared string for a username (default: sys.intern)
+        """
+        self.username=username.lower()
+        self.channels={}
+        self._intern=intern
+
+    def __getitem__(self, channel):
+        """
+        Returns:
+            (ChannelState): State of the joined channel, raises KeyError if it isn't joined
+        """
+        return self.channels[channel.lower()]
+
+    def __contains__(self, channel):
+        return channel.lower() in self.channels
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def get(self, channel):
+        """
+        Returns:
+            (ChannelState): State of the joined channel, None if it isn't joined
+        """
+        return self.channels.get(channel.lower())
+
+    def is_member(self, channel, username):
+        """
+        Returns:
+            (bool): Whether the user is in the channel
+        """
+        state = self.channels.get(channel.lower())
+        return not state is None and username.lower() in state.members
+
+    def clear(self):
+        """Forgets all channels, called when the connection is lost"""
+        self.channels.clear()
+
+    #Updates from the TwitchIrcClient
+    def joined(self, channel, username):
+        state = self.channels.get(channel)
+        if state is None:
+            if username!=self.username:
+                #JOINs of a channel we don't know anymore
+                return
+            state = self.channels[channel] = ChannelState(channel)
+        state.members.add(self._intern(username))
+
+    def parted(self, channel, username):
+        if username==self.username:
+            self.channels.pop(channel, None)
+            return
+        state = self.channels.get(channel)
+        if not state is None:
+            state.members.discard(username)
+
+    def roomstate(self, channel, tags):
+        state = self.channels.get(channel)
+        if state is None:
+            state = self.channels[channel] = ChannelState(channel)
+        for key in tags:
+            state.roomstate[key] = tags[key]
+
+    def userstate(self, channel, tags):
+        state = self.channels.get(channel)
+        if not state is None:
+            state.userstate = tags
+
+    def names(self, channel, names):
+        #All names of a NAMES reply, after the end of the list (366)
+        state = self.channels.get(channel)
+        if not state is None:
+            #Users that joined during the reply are already members
+            state.members.update(self._intern(name) for name in names)
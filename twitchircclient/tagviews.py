@@ -0,0 +1,159 @@
+"""
+Parsed views of the emotes and badges tags
+Use TagDict.emote_index() and TagDict.badge_list(), they parse the tag once and
+every reciever of the line gets the same object
+"""
+
+import sys
+from array import array
+
+#Maximum number of cached badge strings and pairs, a cache is cleared when it is full
+BADGE_CACHE_SIZE = 10000
+
+#Value of the badges tag -> tuple of pairs
+_badge_lists = {}
+#'name/version' -> (name, version), every pair exists only once
+_badge_pairs = {}
+
+def _badge_pair(badge):
+    pair = _badge_pairs.get(badge)
+    if pair is None:
+        name, version = badge.split('/', 1)
+        pair = (sys.intern(name), version)
+        if len(_badge_pairs)>=BADGE_CACHE_SIZE:
+            _badge_pairs.clear()
+        _badge_pairs[badge] = pair
+    return pair
+
+class EmoteIndex:
+    """
+    The emotes of a message, sorted by their position
+    Positions are indexes of characters in the message, end is inclusive like in the tag.
+    ids holds every emote id once (they are strings like '25' or 'emotesv2_...'),
+    the occurrences are stored in arrays of ints. Usage:
+    index = EmoteIndex('25:0-4,12-16/1902:6-10')
+    list(index) #[('25', 0, 4), ('1902', 6, 10), ('25', 12, 16)]
+    index.count('25') #2
+    """
+    __slots__ = ('ids', 'id_indexes', 'starts', 'ends')
+
+    def __init__(self, raw_emotes=''):
+        """
+        Args:
+            raw_emotes (str)(optional): Value of the emotes tag (default: no emotes)
+        """
+        ids = []
+        occurrences = []
+        for emote in raw_emotes.split('/') if raw_emotes else ():
+            emote_id, _, ranges = emote.partition(':')
+            if not ranges:
+                continue
+            id_index = len(ids)
+            ids.append(emote_id)
+            for emote_range in ranges.split(','):
+                start, _, end = emote_range.partition('-')
+                if start.isdigit() and end.isdigit():
+                    occurrences.append((int(start), int(end), id_index))
+        occurrences.sort()
+        self.ids = tuple(ids)
+        self.starts = array('I', [start for start, end, id_index in occurrences])
+        self.ends = array('I', [end for start, end, id_index in occurrences])
+        self.id_indexes = array('I', [id_index for start, end, id_index in occurrences])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        """
+        Returns:
+            (tuple): emote id, start and end of the occurrence
+        """
+        return self.ids[self.id_indexes[index]], self.starts[index], self.ends[index]
+
+    def __iter__(self):
+        ids = self.ids
+        for id_index, start, end in zip(self.id_indexes, self.starts, self.ends):
+            yield ids[id_index], start, end
+
+    def count(self, emote_id):
+        """
+        Returns:
+            (int): How often the emote is used in the message
+        """
+        if not emote_id in self.ids:
+            return 0
+        return self.id_indexes.count(self.ids.index(emote_id))
+
+    def segments(self, message):
+        """
+        Splits the message into text and emotes, only the positions are returned so
+        nothing is copied, message[start:end] is the text of a segment
+        Args:
+            message (str): The message the emotes belong to
+        Returns:
+            (generator): start, end (exclusive) and emote id of each segment, the emote id is None for text
+        """
+        pos = 0
+        length = len(message)
+        for emote_id, start, end in self:
+            if start<pos or end>=length:
+                #Overlapping or outside of the message, the tag doesn't fit
+                continue
+            if start>pos:
+                yield pos, start, None
+            yield start, end+1, emote_id
+            pos = end+1
+        if pos<length:
+            yield pos, length, None
+
+    def __repr__(self):
+        return 'EmoteIndex(%r)'%list(self)
+
+class BadgeList:
+    """
+    The badges of a user as (name, version) pairs
+    Parsed pairs are cached, so users with the same badges share the same tuples. Usage:
+    badges = BadgeList.parse('subscriber/12,bits/1000')
+    badges.get('subscriber') #'12'
+    'bits' in badges #True
+    """
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs=()):
+        self.pairs = pairs
+
+    @staticmethod
+    def parse(raw_badges):
+        """
+        Returns:
+            (BadgeList): The badges of the value of a badges tag
+        """
+        pairs = _badge_lists.get(raw_badges)
+        if pairs is None:
+            pairs = tuple(_badge_pair(badge) for badge in raw_badges.split(',') if '/' in badge)
+            if len(_badge_lists)>=BADGE_CACHE_SIZE:
+                _badge_lists.clear()
+            _badge_lists[raw_badges] = pairs
+        return BadgeList(pairs)
+
+    def get(self, name, default=None):
+        """
+        Returns:
+            (str): Version of the badge, default if the user doesn't have it
+        """
+        for badge, version in self.pairs:
+            if badge==name:
+                return version
+        return default
+
+    def __contains__(self, name):
+        return any(badge==name for badge, version in self.pairs)
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __repr__(self):
+        return 'BadgeList(%r)'%(self.pairs,)
@@ -4,14 +4,27 @@ Twitch Client Library
 
 import socket
 import ssl
+import collections.abc
 import threading
 import re
 import time
+from .events import (PrivMsg, Whisper, Join, Part, JoinConfirm, Notice, UserNotice, RoomState,
+    ClearChat, UserState, GlobalUserState, HostTarget, Operator, NamesList, Health)
+from .tagviews import EmoteIndex, BadgeList
+from .intern import InternTable, tag_keys
+from .state import ChannelStateStore, STATE_COMMANDS
+from .keepalive import Keepalive, KEEPALIVE_PING, KEEPALIVE_RECONNECT
+from .backoff import Backoff, CIRCUIT_OPEN
+from .outbound import OutboundBuffer, MAX_RECORD_SIZE, encode_privmsg, encode_join, encode_part, encode_pong, _check_param
+from .ratelimit import SendQueue, AccountLimits, LIMIT_MESSAGE, LIMIT_MODERATOR, LIMIT_JOIN, LIMIT_WHISPER, PRIORITY_HIGH, PRIORITY_NORMAL
 
 tags_regex='(?P<tags>([-a-zA-Z0-9_]+=[^; \n\r]*;)*([-a-zA-Z0-9_]+=[^; \n\r]*))'
 username_regex='(?P<username>[a-zA-Z0-9_]+)!(?P=username)@(?P=username)'
 channel_regex='#(?P<channel>[a-zA-Z0-9_]+)'
 
+#The client itself splits lines with _parse_line, the regular expressions are
+#kept for everyone who uses them to match lines on their own
+
 #Regex for Sent messages:
 #First section are tags, some characters=something, ';'-seperated list, but there is no ; after the last one
 #Followed by the username section, 'username!username@username.tmi.twitch.tv
@@ -61,17 +74,352 @@ loose_operator_regex = re.compile('^:jtv MODE '+channel_regex+ r' -o (?P<usernam
 #Regex for PONG from twitch
 pong_regex = re.compile('^:tmi.twitch.tv PONG tmi.twitch.tv :(?P<message>.*)$')
 
+#Maximum length of an irc line in bytes, including \r\n
+MAX_LINE_LENGTH = 512
+
 def _deescape_tag(tag):
     #See IRCv3 Spec for escaping in tags
     return tag.replace('\\:',';').replace('\\s',' ').replace('\\r','\r').replace('\\n','\n').replace('\\\\','\\')
 
 def _parse_tags(raw_tags):
-    tags = {}
-    for tag in raw_tags.split(';'):
-        splittag = tag.split('=',1)
-        tags[splittag[0]]=_deescape_tag(splittag[1])
-    return tags
+    if raw_tags is None:
+        return TagDict('')
+    return TagDict(raw_tags)
+
+
+class TagDict(collections.abc.Mapping):
+    """
+    Read-only dict of the tags of a message
+    Keeps the raw tag string and only parses and deescapes a tag if it is read,
+    the result is cached. Compares equal to a dict with the same items
+    Usage:
+    tags = TagDict('badges=staff/1;color=#0D4200')
+    tags['color'] #'#0D4200'
+    tags == {'badges':'staff/1','color':'#0D4200'} #True
+    tags.badge_list().get('staff') #'1', parsed once, see tagviews.py
+    """
+    __slots__ = ('_raw', '_cache', '_emote_index', '_badge_list')
+
+    def __init__(self, raw_tags):
+        self._raw = raw_tags
+        self._cache = None
+        self._emote_index = None
+        self._badge_list = None
+
+    def emote_index(self):
+        """
+        Returns:
+            (EmoteIndex): The parsed emotes tag, parsed once and shared by all recievers
+        """
+        if self._emote_index is None:
+            self._emote_index = EmoteIndex(self.get('emotes', ''))
+        return self._emote_index
+
+    def badge_list(self):
+        """
+        Returns:
+            (BadgeList): The parsed badges tag, parsed once and shared by all recievers
+        """
+        if self._badge_list is None:
+            self._badge_list = BadgeList.parse(self.get('badges', ''))
+        return self._badge_list
+
+    def _find(self, key):
+        #Returns the index where the value of key starts, -1 if the key doesn't exist
+        raw = self._raw
+        search = key+'='
+        if raw.startswith(search):
+            return len(search)
+        pos = raw.find(';'+search)
+        if pos!=-1:
+            return pos+len(search)+1
+        #A tag without '=' (e.g. 'flag' in 'flag;a=1') has an empty value, the index of its end is returned
+        if raw==key or raw.startswith(key+';'):
+            return len(key)
+        pos = raw.find(';'+key+';')
+        if pos!=-1:
+            return pos+len(key)+1
+        if raw.endswith(';'+key):
+            return len(raw)
+        return -1
+
+    def __getitem__(self, key):
+        cache = self._cache
+        if cache is None:
+            cache = self._cache = {}
+        elif key in cache:
+            return cache[key]
+        start = self._find(key)
+        if start==-1:
+            raise KeyError(key)
+        end = self._raw.find(';', start)
+        if end==-1:
+            end = len(self._raw)
+        value = self._raw[start:end]
+        if '\\' in value:
+            value = _deescape_tag(value)
+        cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        if self._cache is not None and key in self._cache:
+            return True
+        return isinstance(key, str) and self._find(key)!=-1
+
+    def __iter__(self):
+        if not self._raw:
+            return
+        for tag in self._raw.split(';'):
+            yield tag_keys.intern(tag.split('=',1)[0])
+
+    def __len__(self):
+        if not self._raw:
+            return 0
+        return self._raw.count(';')+1
+
+    def copy(self):
+        """
+        Returns a regular (mutable) dict with all tags, e.g. for json.dumps
+        All tags are parsed in one pass over the raw string
+        """
+        tags = {}
+        if not self._raw:
+            return tags
+        for tag in self._raw.split(';'):
+            key, _, value = tag.partition('=')
+            if '\\' in value:
+                value = _deescape_tag(value)
+            tags[key] = value
+        return tags
+
+    def __repr__(self):
+        return 'TagDict(%r)'%self.copy()
+
+
+def _parse_line(data):
+    """
+    Splits an irc line once into its parts:
+    '@tags :prefix COMMAND param param :trailing param'
+    Returns:
+        (tuple): raw_tags (str or None), prefix (str or None), command (str), params (list of str)
+        None if the line is malformed
+    """
+    raw_tags = None
+    prefix = None
+    pos = 0
+    if data.startswith('@'):
+        pos = data.find(' ')
+        if pos==-1:
+            return None
+        raw_tags = data[1:pos]
+        pos += 1
+    if data.startswith(':', pos):
+        end = data.find(' ', pos)
+        if end==-1:
+            return None
+        prefix = data[pos+1:end]
+        pos = end+1
+    trailing = data.find(' :', pos)
+    if trailing==-1:
+        params = data[pos:].split()
+    else:
+        params = data[pos:trailing].split()
+        params.append(data[trailing+2:])
+    if not params:
+        return None
+    command = params.pop(0)
+    return raw_tags, prefix, command, params
+
+def _pack_channels(command, channels, max_count=None):
+    """
+    Packs channels into as few 'COMMAND #a,#b,#c' lines as possible
+    Args:
+        command (str): JOIN or PART
+        channels (iterable): The channels without '#'
+        max_count (int)(optional): Maximum number of channels per line (default: no limit)
+    Returns:
+        (list): (line, number of channels in the line) tuples
+    Raises ValueError if a channel contains line breaks
+    """
+    packed = []
+    current = []
+    length = len(command)+3 #command, space and \r\n
+    for channel in channels:
+        _check_param(channel)
+        channel_length = len(channel.encode('utf-8'))+2 #'#' and ','
+        if current and (length+channel_length>MAX_LINE_LENGTH+1 or len(current)==max_count):
+            packed.append(('%s %s\r\n'%(command, ','.join(current)), len(current)))
+            current = []
+            length = len(command)+3
+        current.append('#'+channel)
+        length += channel_length
+    if current:
+        packed.append(('%s %s\r\n'%(command, ','.join(current)), len(current)))
+    return packed
+
+def _line_command(data):
+    #The command of a line, without splitting the rest of it
+    pos = 0
+    if data.startswith('@'):
+        pos = data.find(' ')+1
+    if data.startswith(':', pos):
+        pos = data.find(' ', pos)+1
+    end = data.find(' ', pos)
+    if end==-1:
+        return data[pos:]
+    return data[pos:end]
+
+def _no_intern(value):
+    return value
+
+def _prefix_username(prefix):
+    #prefix is 'username!username@username.tmi.twitch.tv'
+    return prefix.split('!',1)[0]
+
+def _channel_param(params):
+    #Returns the channel without '#' of the first param, None if it isn't a channel
+    if not params or not params[0].startswith('#'):
+        return None
+    return params[0][1:]
+
+
+class LineFramer:
+    """
+    Splits the byte stream of a socket into irc lines
+    Reads into a preallocated bytearray, complete lines are decoded at once
+    and the incomplete rest is kept for the next read.
+    Usage:
+    framer = LineFramer(4096)
+    lines = framer.recv_from(sock) #list of complete lines, None if the connection is closed
+    """
+    def __init__(self, read_size=4096):
+        """
+        Args:
+            read_size (int)(optional): Maximum number of bytes read from the socket at once (default: 4096)
+        """
+        self.read_size=read_size
+        self._buf = bytearray(2*read_size)
+        self._view = memoryview(self._buf)
+        self._end = 0
+        #Bytes at the start that are known to contain no linebreak
+        self._scanned = 0
+
+    def _reserve(self, size):
+        #Make sure there is room for size more bytes after the current rest
+        if len(self._buf)-self._end>=size:
+            return
+        #the view has to be released before the bytearray can be resized
+        self._view.release()
+        self._buf.extend(bytes(max(len(self._buf), size)))
+        self._view = memoryview(self._buf)
+
+    def recv_from(self, sock):
+        """
+        Reads once from the socket
+        Returns:
+            (list): The complete lines that are now available, None if the socket is closed
+        """
+        self._reserve(self.read_size)
+        count = sock.recv_into(self._view[self._end:self._end+self.read_size], self.read_size)
+        if count==0:
+            return None
+        self._end += count
+        return self._pop_lines()
+
+    def feed(self, data):
+        """
+        Adds bytes that were read somewhere else
+        Returns:
+            (list): The complete lines that are now available
+        """
+        self._reserve(len(data))
+        self._view[self._end:self._end+len(data)] = data
+        self._end += len(data)
+        return self._pop_lines()
+
+    def clear(self):
+        """Throws away an incomplete rest, e.g. after a reconnect"""
+        self._end = 0
+        self._scanned = 0
+
+    def _pop_lines(self):
+        #Only the new bytes are searched, a long line read in many parts isn't scanned again and again
+        #One byte before them is included, it can be the \r of a split linebreak
+        last = self._buf.rfind(b'\r\n', max(0, self._scanned-1), self._end)
+        if last==-1:
+            self._scanned = self._end
+            return []
+        #Everything up to the last linebreak is decoded at once, so multibyte characters are never split
+        #Invalid bytes are replaced, otherwise they would stay in the buffer and fail every later read
+        lines = str(self._view[:last], 'utf-8', 'replace').split('\r\n')
+        rest = self._end-last-2
+        if rest:
+            self._buf[:rest] = self._buf[last+2:self._end]
+        self._end = rest
+        #The rest comes after the last linebreak
+        self._scanned = rest
+        return lines
+
+
+CAP_MEMBERSHIP='twitch.tv/membership'
+CAP_COMMANDS='twitch.tv/commands'
+CAP_TAGS='twitch.tv/tags'
+#Order the capabilities are requested in
+CAPABILITIES=(CAP_MEMBERSHIP, CAP_COMMANDS, CAP_TAGS)
+
+#Capabilities twitch needs before it sends the events of a spreader (with their tags)
+SPREADER_CAPABILITIES = {
+    'messagespreader': (CAP_TAGS,),
+    'joinspreader': (CAP_MEMBERSHIP,),
+    'partspreader': (CAP_MEMBERSHIP,),
+    'noticespreader': (CAP_COMMANDS, CAP_TAGS),
+    'usernoticespreader': (CAP_COMMANDS, CAP_TAGS),
+    'roomstatespreader': (CAP_COMMANDS, CAP_TAGS),
+    'clearchatspreader': (CAP_COMMANDS, CAP_TAGS),
+    'userstatespreader': (CAP_COMMANDS, CAP_TAGS),
+    'globaluserstatespreader': (CAP_COMMANDS, CAP_TAGS),
+    'hostspreader': (CAP_COMMANDS,),
+    'whisperspreader': (CAP_COMMANDS, CAP_TAGS),
+    'gainoperatorspreader': (CAP_MEMBERSHIP,),
+    'looseoperatorspreader': (CAP_MEMBERSHIP,),
+    'nameslistspreader': (CAP_MEMBERSHIP,),
+    'nameslistendspreader': (CAP_MEMBERSHIP,),
+}
+
+#Commands that are only handled to spread them, they are dropped without parsing if these
+#spreaders have no recievers. Commands that aren't listed are always handled
+COMMAND_SPREADERS = {
+    'PRIVMSG': ('messagespreader',),
+    'PART': ('partspreader',),
+    'NOTICE': ('noticespreader',),
+    'USERNOTICE': ('usernoticespreader',),
+    'ROOMSTATE': ('roomstatespreader',),
+    'CLEARCHAT': ('clearchatspreader',),
+    'GLOBALUSERSTATE': ('globaluserstatespreader',),
+    'HOSTTARGET': ('hostspreader',),
+    'WHISPER': ('whisperspreader',),
+    'MODE': ('gainoperatorspreader', 'looseoperatorspreader'),
+    '353': ('nameslistspreader', 'nameslistendspreader'),
+    '366': ('nameslistendspreader',),
+}
 
+class _Batch:
+    """Events collected for a batch reciever, see EventSpreader.add_batch"""
+    __slots__ = ('reciever', 'max_size', 'max_delay', 'clock', 'events', 'started')
+
+    def __init__(self, reciever, max_size, max_delay, clock):
+        self.reciever = reciever
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.clock = clock
+        self.events = []
+        self.started = None
+
+    def is_due(self):
+        #Without a window every read is delivered, with max_delay the window ends after the delay
+        if not self.max_delay is None:
+            return self.clock()-self.started>=self.max_delay
+        return self.max_size is None
 
 class EventSpreader:
     """
@@ -81,29 +429,223 @@ class EventSpreader:
     es+=handleFunc #Add a handler to the spreader
     es.spread(args) #Call all eventHandlers with the args/kwargs
     es-=handleFunc #Remove a handler from the spreader
+    es.add_event(eventFunc) #Add a handler that gets the event object of spread_event
+    es.add(handleFunc, channel='channel') #Only called for events of this channel
+    es.add_batch(batchFunc) #Called with a list of the events of every read
     """
     def __init__(self):
         self.reciever=list()
+        #Recievers that get the event object itself, see spread_event
+        self.event_reciever=list()
+        #Lowercase channel/username -> ([event recievers], [recievers]) that only get events with it
+        self._channel_recievers={}
+        self._user_recievers={}
+        #Batch recievers, flush_batches is called by the client after every read
+        self._batches=list()
+        self._batch_lock=threading.Lock()
+        self._watchers=list()
 
     def __iadd__(self, reciever):
-        self.reciever.append(reciever)
+        self.add(reciever)
 
     def __isub__(self, reciever):
-        self.reciever.remove(reciever)
+        self.remove(reciever)
         
-    def add(self, reciever):
-        self.reciever.append(reciever)
+    def add(self, reciever, channel=None, username=None):
+        """
+        Adds a reciever, with a channel or username it is only called for events of it
+        Spreading looks the filtered recievers up, so they cost nothing for other events
+        Args:
+            reciever (function): Called with the keyword arguments of the event
+            channel (str)(optional): Only events of this channel (default: all events)
+            username (str)(optional): Only events of this user (default: all events)
+        """
+        self._recievers(channel, username, True)[1].append(reciever)
+        self._changed()
+
+    def remove(self, reciever, channel=None, username=None):
+        """
+        Removes a reciever, channel or username have to be the ones it was added with
+        """
+        self._recievers(channel, username, False)[1].remove(reciever)
+        self._forget_filter(channel, username)
+        self._changed()
+
+    def add_event(self, reciever, channel=None, username=None):
+        """
+        Adds a reciever that is called with the event object (see events.py)
+        instead of keyword arguments, channel and username filter like in add
+        """
+        self._recievers(channel, username, True)[0].append(reciever)
+        self._changed()
+
+    def remove_event(self, reciever, channel=None, username=None):
+        self._recievers(channel, username, False)[0].remove(reciever)
+        self._forget_filter(channel, username)
+        self._changed()
+
+    def add_batch(self, reciever, max_size=None, max_delay=None, clock=time.monotonic):
+        """
+        Adds a reciever that is called with a list of event objects instead of every single one
+        By default it gets the events of every read from the socket, with max_size or max_delay
+        the events are collected over several reads. The delay is checked after every read,
+        flush_batches(force=True) delivers the collected events at once (e.g. from a timer).
+        Args:
+            reciever (function): Called with a list of events
+            max_size (int)(optional): Deliver when this many events are collected (default: no limit)
+            max_delay (float)(optional): Deliver the events after the first read this many seconds after
+                the first event of the batch (default: no limit)
+            clock (function)(optional): Returns the current time in seconds (default: time.monotonic)
+        """
+        with self._batch_lock:
+            self._batches.append(_Batch(reciever, max_size, max_delay, clock))
+        self._changed()
+
+    def remove_batch(self, reciever):
+        """
+        Removes a batch reciever, the events it collected are delivered first
+        """
+        with self._batch_lock:
+            batch = next((batch for batch in self._batches if batch.reciever==reciever), None)
+            if batch is None:
+                raise ValueError('%r is not a batch reciever'%reciever)
+            self._batches.remove(batch)
+            events, batch.events = batch.events, []
+        if events:
+            self._deliver(reciever, events)
+        self._changed()
+
+    def flush_batches(self, force=False):
+        """
+        Delivers the collected events of the batch recievers whose batch is due
+        Args:
+            force (bool)(optional): Deliver all collected events (default: False)
+        """
+        due = []
+        with self._batch_lock:
+            for batch in self._batches:
+                if batch.events and (force or batch.is_due()):
+                    due.append((batch.reciever, batch.events))
+                    batch.events = []
+        for reciever, events in due:
+            self._deliver(reciever, events)
+
+    def has_recievers(self):
+        """
+        Returns:
+            (bool): Whether any reciever is added
+        """
+        return bool(self.reciever or self.event_reciever or self._channel_recievers or self._user_recievers or self._batches)
+
+    def watch(self, watcher):
+        """
+        Calls watcher without arguments whenever a reciever is added or removed
+        """
+        #Spreaders can be handed to a client again, e.g. by a HotStandbyClient
+        if not watcher in self._watchers:
+            self._watchers.append(watcher)
 
-    def remove(self, reciever):
-        self.reciever.remove(reciever)
+    def _changed(self):
+        for watcher in self._watchers:
+            watcher()
 
     def spread(self, *args, **kwargs):
-        for rec in self.reciever:
-            rec(*args, **kwargs)
+        recievers = self.reciever
+        if self._channel_recievers or self._user_recievers:
+            recievers = self._matching(kwargs.get('channel'), kwargs.get('username'))[1]
+        for rec in recievers:
+            self._call(rec, *args, **kwargs)
+
+    def spread_event(self, event):
+        """
+        Calls the event recievers with the event and the other recievers with its fields as keyword arguments
+        """
+        if self._channel_recievers or self._user_recievers:
+            event_recievers, recievers = self._matching(getattr(event, 'channel', None), getattr(event, 'username', None))
+            self._spread_event(event_recievers, recievers, event)
+        else:
+            self._spread_event(self.event_reciever, self.reciever, event)
+        if self._batches:
+            self._collect(event)
+
+    def _collect(self, event):
+        """
+        Adds the event to every batch, full batches are delivered right away
+        """
+        full = []
+        with self._batch_lock:
+            for batch in self._batches:
+                if not batch.events and not batch.max_delay is None:
+                    batch.started = batch.clock()
+                batch.events.append(event)
+                if not batch.max_size is None and len(batch.events)>=batch.max_size:
+                    full.append((batch.reciever, batch.events))
+                    batch.events = []
+        for reciever, events in full:
+            self._deliver(reciever, events)
+
+    def _deliver(self, reciever, events):
+        #Calls a batch reciever, subclasses can change where it is called
+        self._call(reciever, events)
+
+    def _recievers(self, channel, username, create):
+        """
+        Returns:
+            (tuple): The lists of event recievers and recievers for the filter
+        """
+        if channel is None and username is None:
+            return self.event_reciever, self.reciever
+        if not channel is None and not username is None:
+            raise ValueError('a reciever can only be filtered by channel or by username')
+        if channel is None:
+            index, key = self._user_recievers, username.lower()
+        else:
+            index, key = self._channel_recievers, channel.lower()
+        if not create:
+            #remove raises ValueError for unknown recievers, like list.remove
+            return index.get(key, ([], []))
+        if not key in index:
+            index[key] = ([], [])
+        return index[key]
+
+    def _forget_filter(self, channel, username):
+        #Drops the lists of a filter without recievers, so has_recievers stays exact
+        for index, key in ((self._channel_recievers, channel), (self._user_recievers, username)):
+            if not key is None and index.get(key.lower()) == ([], []):
+                del index[key.lower()]
+
+    def _matching(self, channel, username):
+        """
+        Returns:
+            (tuple): The event recievers and recievers for an event of the channel and user,
+                the unfiltered ones first
+        """
+        event_recievers = self.event_reciever
+        recievers = self.reciever
+        for index, key in ((self._channel_recievers, channel), (self._user_recievers, username)):
+            if not key is None:
+                found = index.get(key)
+                if not found is None:
+                    event_recievers = event_recievers+found[0]
+                    recievers = recievers+found[1]
+        return event_recievers, recievers
+
+    def _spread_event(self, event_recievers, recievers, event):
+        for rec in event_recievers:
+            self._call(rec, event)
+        if recievers:
+            #The keyword arguments are only built if somebody uses them
+            kwargs = event.as_kwargs()
+            for rec in recievers:
+                self._call(rec, **kwargs)
+
+    def _call(self, rec, *args, **kwargs):
+        #Calls a single reciever, subclasses can change how the reciever is called
+        return rec(*args, **kwargs)
 
 class TwitchIrcClient:
 
-    def __init__(self, username, oauthtoken, irc_hostname='irc.chat.twitch.tv', irc_port=443, socket_timeout=None, ssl_context={}, debug=False):
+    def __init__(self, username, oauthtoken, irc_hostname='irc.chat.twitch.tv', irc_port=443, socket_timeout=None, ssl_context={}, debug=False, read_size=4096, send_timeout=None, rate_limit=False, dispatcher=None, use_ssl=True, capabilities=None, track_state=False, intern_size=10000, recorder=None, metrics=None, keepalive=None, keepalive_timeout=10, reactor=None, backoff=None, write_delay=None, write_size=MAX_RECORD_SIZE):
         """
         Constructor, start the connection witch create_connection
         Args:
@@ -113,34 +655,152 @@ class TwitchIrcClient:
             irc_hostname (str)(optional): Hostname of the twitch irc server (default: irc.chat.twitch.tv)
             irc_port (int)(optional): Port used to connect to the twitch irc server (default: 443)
             socket_timeout (int)(optional): set timeout for the socket in seconds (default: No timeout)
-            ssl_context (dict)(optional): set params for the SSLContext used for the socket, otherwise the defaults are used
+            ssl_context (dict/SSLContext)(optional): set params for the SSLContext used for the socket, otherwise the defaults
+                are used. The context is created once and reused by every reconnect, an SSLContext can be shared by many clients
             debug (bool)(optional): Whether or not debug information should be printed out (default: False)
+            read_size (int)(optional): Maximum number of bytes read from the socket at once (default: 4096)
+            send_timeout (int)(optional): Seconds send waits for the (re)connection to be authenticated
+                before raising socket.timeout (default: wait forever)
+            rate_limit (bool/AccountLimits)(optional): Whether messages, joins and whispers are queued and sent within
+                twitchs rate limits by a background thread, see send_queue. Clients of the same account can
+                share a ratelimit.AccountLimits to stay within the limits together (default: False)
+            dispatcher (Dispatcher)(optional): Calls the recievers in its worker threads instead
+                of the reciever thread, see dispatch.Dispatcher (default: None)
+            use_ssl (bool)(optional): Whether the connection uses TLS, twitch also accepts plain
+                connections on port 6667 (default: True)
+            capabilities (iterable)(optional): Capabilities to request from twitch, e.g. CAP_TAGS
+                (default: the ones the spreaders with recievers need, see SPREADER_CAPABILITIES)
+            track_state (bool)(optional): Whether the room modes, our USERSTATE and the members of the joined
+                channels are kept in state, see state.ChannelStateStore (default: False)
+            intern_size (int)(optional): Channels and usernames of incomming lines are shared through an
+                intern.InternTable of this size, 0 disables it (default: 10000)
+            recorder (TrafficRecorder)(optional): Records every recieved line, it can be replayed
+                with a recorder.ReplayClient (default: None)
+            metrics (ClientMetrics)(optional): Counts lines and measures parsing, dispatching, reconnects,
+                the send_queue and every listener, see metrics.py (default: None)
+            keepalive (float)(optional): Seconds between PINGs that check the connection, if the PONG
+                doesn't come back within keepalive_timeout seconds the client reconnects, the round trip
+                times are spread by healthspreader, see keepalive.Keepalive (default: no PINGs)
+            keepalive_timeout (float)(optional): Seconds a PONG may take (default: 10)
+            reactor (Reactor)(optional): Reads and writes the socket in the thread of a reactor.Reactor
+                shared by many clients instead of a reciever thread, socket_timeout is not used (default: None)
+            backoff (Backoff)(optional): Delays between reconnect attempts and the circuit breaker, see
+                backoff.Backoff (default: Backoff())
+            write_delay (float)(optional): Seconds a sent line may wait for more lines, they are written
+                to the socket together, see outbound.OutboundBuffer. With a reactor the lines are written
+                by its thread after the delay (default: every line is written at once)
+            write_size (int)(optional): Buffered bytes that are written without waiting for write_delay
+                (default: MAX_RECORD_SIZE, one TLS record)
         """
         self.username=username
+        self.dispatcher=dispatcher
         self.oauthtoken=oauthtoken
         self.irc_hostname=irc_hostname
         self.irc_port=irc_port
         self.ssl_context=ssl_context
+        self._sslcontext = ssl_context if isinstance(ssl_context, ssl.SSLContext) else None
+        #TLS session of the last connection, a reconnect resumes it if the server still knows it
+        self._tls_session=None
+        #Seconds the last TLS handshake took and whether it resumed the session
+        self.tls_handshake_time=None
+        self.tls_session_reused=None
+        self.use_ssl=use_ssl
         self.debug=debug
         self._socket_timeout=socket_timeout
+        self._framer = LineFramer(read_size)
+        self.send_timeout=send_timeout
+        #Set while the socket can be read, cleared during a reconnect
+        self._connected = threading.Event()
+        #Set after twitch accepted the login, sending waits for it
+        self._authenticated = threading.Event()
+        self._restarting=False
+        self._irc_reciever_thread=None
+        self._reconnect_started=None
+        #Seconds the last reconnect took until twitch accepted the login again
+        self.reconnect_latency=None
+        #Queue for rate limited lines, see ratelimit.SendQueue
+        self.send_queue = None
+        if rate_limit:
+            account_limits = rate_limit if isinstance(rate_limit, AccountLimits) else None
+            self.send_queue = SendQueue(self.send, account_limits=account_limits)
+        if not self.send_queue is None and not metrics is None:
+            self.send_queue.on_sent = metrics.line_sent
+        #Channels where we are moderator or broadcaster, they have a higher message limit
+        self._moderated_channels = set()
+        #Lowercase channels we sent a JOIN for, but twitch didn't confirm yet
+        self.pending_joins = set()
         self.joined_channels = set()
-        self.messagespreader = EventSpreader()
-        self.joinspreader = EventSpreader()
-        self.partspreader = EventSpreader()
-        self.noticespreader = EventSpreader()
-        self.usernoticespreader = EventSpreader()
-        self.roomstatespreader = EventSpreader()
-        self.clearchatspreader = EventSpreader()
-        self.userstatespreader = EventSpreader()
-        self.globaluserstatespreader = EventSpreader()
-        self.hostspreader = EventSpreader()
-        self.whisperspreader = EventSpreader()
-        self.gainoperatorspreader = EventSpreader()
-        self.looseoperatorspreader = EventSpreader()
-        self.nameslistspreader = EventSpreader()
-        
-        #Regex for names list recieved
-        self.nameslist_regex = re.compile('^:{login}.tmi.twitch.tv 353 {login} = '.format(login=self.username)+channel_regex+' :(?P<names>[a-zA-Z0-9_ ]+)$')
+        #Returns a shared string equal to the given channel or username
+        self._intern = InternTable(intern_size).intern if intern_size else _no_intern
+        self.state = ChannelStateStore(username, self._intern) if track_state else None
+        self.recorder=recorder
+        self.metrics=metrics
+        self.keepalive = None if keepalive is None else Keepalive(keepalive, keepalive_timeout)
+        self._keepalive_thread=None
+        self._keepalive_timer=None
+        self.reactor=reactor
+        #Bytes the reactor didn't write yet
+        self._out = bytearray()
+        self._out_lock = threading.Lock()
+        self.write_delay=write_delay
+        self.write_size=write_size
+        #Lines written together after write_delay, not used with a reactor
+        self._outbound = None
+        if not write_delay is None and reactor is None:
+            self._outbound = OutboundBuffer(self._write_socket, write_delay, write_size)
+        #Lines the reciever thread sent while handling a read, written before the next read
+        self._burst_out = bytearray()
+        #Set on shutdown, stops the keepalive thread and a reconnect waiting for the backoff
+        self._stopping = threading.Event()
+        self.backoff = Backoff() if backoff is None else backoff
+        #Lowercase channel -> names of the NAMES reply until its end (366)
+        self._names_chunks = {}
+        self.capabilities = None if capabilities is None else set(capabilities)
+        #Capabilities requested on the current connection, None if not connected
+        self._requested_capabilities = None
+        #Commands whose spreaders have no recievers, see COMMAND_SPREADERS
+        self._skipped_commands = frozenset()
+        self.messagespreader = self._create_spreader()
+        self.joinspreader = self._create_spreader()
+        self.partspreader = self._create_spreader()
+        self.noticespreader = self._create_spreader()
+        self.usernoticespreader = self._create_spreader()
+        self.roomstatespreader = self._create_spreader()
+        self.clearchatspreader = self._create_spreader()
+        self.userstatespreader = self._create_spreader()
+        self.globaluserstatespreader = self._create_spreader()
+        self.hostspreader = self._create_spreader()
+        self.whisperspreader = self._create_spreader()
+        self.gainoperatorspreader = self._create_spreader()
+        self.looseoperatorspreader = self._create_spreader()
+        self.nameslistspreader = self._create_spreader()
+        self.nameslistendspreader = self._create_spreader()
+        self.joinconfirmspreader = self._create_spreader()
+        #Connection events without arguments: twitch accepted the login, a reconnect started
+        self.connectspreader = self._create_spreader()
+        self.disconnectspreader = self._create_spreader()
+        #Round trip times and missed PONGs of the keepalive
+        self.healthspreader = self._create_spreader()
+        #Handlers for the commands, see _handle_incomming
+        self._command_handlers = {
+            'PRIVMSG': self._messagerecieved,
+            'JOIN': self._joinrecieved,
+            'PART': self._partrecieved,
+            'NOTICE': self._noticerecieved,
+            'USERNOTICE': self._usernoticerecieved,
+            'ROOMSTATE': self._roomstaterecieved,
+            'CLEARCHAT': self._clearchatrecieved,
+            'USERSTATE': self._userstaterecieved,
+            'GLOBALUSERSTATE': self._globaluserstaterecieved,
+            'HOSTTARGET': self._hostrecieved,
+            'WHISPER': self._whisperrecieved,
+            'MODE': self._moderecieved,
+            '353': self._nameslistreciever,
+            '366': self._namesendrecieved,
+            '001': self._welcomerecieved,
+            'PONG': self._pongrecieved,
+        }
+        self._watch_spreaders()
 
     def create_connection(self):
         """
@@ -149,34 +809,46 @@ class TwitchIrcClient:
         """
 
         #Create new Socket and connect to irc.twitch.tv
+        self._authenticated.clear()
+        self._stopping.clear()
         self._connect()
+        self._connected.set()
+        if not self.reactor is None:
+            self._connect_reactor()
+            return
 
         #setup for recieving messages
         def reciever():
             self.go_on=True
-            self._restarting=False
             while self.go_on:
-                #Messages from the socket are raw bytes
-                multidata = bytes()
                 try:
-                    #If messages are too big fetch them in multidata. The end of a message is always a newline
-                    while not multidata or not multidata.endswith(b'\n'):
-                        while self._restarting:
-                            #during the restart of the socket, no messages can be recieved
-                            continue
+                    #during the restart of the socket, no messages can be recieved
+                    self._connected.wait()
+                    if not self.go_on:
+                        break
+                    sock = self._sock
+                    #Lines sent while handling the last read go out in one write
+                    self._write_burst()
+                    #Twitch can send more messages than one at once, the framer returns all complete lines
+                    lines = self._framer.recv_from(sock)
+                    if lines is None:
                         if not self.go_on:
+                            #The socket was shut down
                             break
-                        #direct decoding might fail on long non-ascii messages
-                        gotdata=self._sock.recv(1024)
-                        if len(gotdata)==0:
-                            #Connection is lost, lets reconnect!
-                            self.log('reconnecting because of empty data')
-                            self.reconnect()
-                        multidata+=gotdata
-                    #Twitch can send more messages than one at once, but they are linebreak-seperated
-                    decoded = multidata.decode('utf-8')
-                    for data in decoded.split('\r\n'):
-                        self._handle_incomming(data)
+                        if self._restarting or not sock is self._sock:
+                            #Another thread (e.g. the keepalive) already reconnects
+                            continue
+                        #Connection is lost, lets reconnect!
+                        self.log('reconnecting because of empty data')
+                        self.reconnect()
+                        continue
+                    for data in lines:
+                        try:
+                            self._handle_incomming(data)
+                        except Exception as e:
+                            #A failing listener must not cost the other lines of the read
+                            print('%s error occurred:%s'%(type(e),e))
+                    self._end_burst()
                 except KeyboardInterrupt:
                     self.go_on=False
                 except socket.timeout:
@@ -191,6 +863,13 @@ class TwitchIrcClient:
         
         self._irc_reciever_thread = threading.Thread(target=reciever)
         self._irc_reciever_thread.start()
+        if not self.send_queue is None:
+            self.send_queue.start()
+        if not self._outbound is None:
+            self._outbound.start()
+        if not self.keepalive is None:
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+            self._keepalive_thread.start()
 
         #Set up authentication, tags, etc.
         self._begin_connection()
@@ -200,18 +879,83 @@ class TwitchIrcClient:
         self.send('PING twitchircclient\r\n')
 
     def reconnect(self):
-        """reconnects to the twitchIrc"""
+        """
+        reconnects to the twitchIrc
+        Sending waits until twitch accepted the login on the new socket,
+        the time until then is stored in reconnect_latency
+        """
+        if not self.reactor is None:
+            #The new socket is connected in the background
+            self.reactor.reconnect(self)
+            return
+        self._reconnect_begin()
+        if self._connect_with_backoff():
+            self._reconnect_end()
+
+    def _reconnect_begin(self):
+        #Throws the old connection away
         self._restarting=True
-        self._kill_socket()
-        self._connect()
+        self._connected.clear()
+        self._authenticated.clear()
+        self._reconnect_started=time.monotonic()
+        if not self.metrics is None:
+            self.metrics.reconnect_started()
+        self.disconnectspreader.spread()
+        try:
+            self._kill_socket()
+        except OSError as e:
+            self.log('Error during restart: %s'%e)
+        self._framer.clear()
+        #Lines that weren't written belong to the old connection
+        self._burst_out.clear()
+        if not self._outbound is None:
+            self._outbound.clear()
+        self._forget_channels()
+
+    def _connect_with_backoff(self):
+        """
+        Connects a new socket, failed attempts are repeated after the delay of the backoff
+        Returns:
+            (bool): False if the client was shut down before it was connected
+        """
+        while not self._stopping.is_set():
+            delay = self.backoff.next_delay()
+            if delay:
+                self.log('reconnecting in %.1f seconds'%delay)
+                if self._stopping.wait(delay):
+                    break
+            try:
+                self._connect()
+                return True
+            except OSError as e:
+                self.log('Error during reconnect: %s'%e)
+        return False
+
+    def _reconnect_end(self):
+        #Logs in on the new connection
         self._restarting=False
-        time.sleep(1)
+        self._connected.set()
         self._begin_connection()
 
     def shutdown(self):
         """Shutdown the irc connection"""
         self.go_on=False
-        self._kill_socket()
+        self._requested_capabilities=None
+        self._stopping.set()
+        if not self.send_queue is None:
+            self.send_queue.stop()
+        if self.reactor is None:
+            self._write_pending()
+            self._kill_socket()
+        else:
+            if not self._keepalive_timer is None:
+                self._keepalive_timer.cancel()
+            self.reactor.remove(self)
+        #Recievers of windowed batches get the rest of the events
+        self._flush_all_batches()
+        #wake up the reciever and waiting senders, they notice the shutdown
+        self._connected.set()
+        self._authenticated.set()
 
     def authenticate(self, username, oauthtoken):
         """
@@ -228,59 +972,92 @@ class TwitchIrcClient:
     def send(self, msg):
         """
         Send a message directly to the twitchIrc
+        Waits until the connection is authenticated, see send_timeout
         Args:
-            msg (str): The message to be send
+            msg (str/bytes): The line to be send, including \r\n
         """
-        while self._restarting:
-            continue
-        self._sock.sendall(msg.encode('utf-8'))
+        #The reciever thread never waits, it is the one that notices the authentication
+        if not self._in_reciever_thread() and not self._authenticated.is_set() and self.backoff.state==CIRCUIT_OPEN:
+            raise ConnectionError('not connected after %d reconnect attempts'%self.backoff.attempts)
+        if not self._in_reciever_thread() and not self._authenticated.wait(self.send_timeout):
+            raise socket.timeout('connection not authenticated after %s seconds'%self.send_timeout)
+        self._send_now(msg)
 
     def sendprivmsg(self, channel, message):
         """
         Send a Message to a channel
+        Raises ValueError if the channel or the message contain line breaks
         """
-        self.send('PRIVMSG #%s :%s\r\n' % (channel.lower(), message))
+        self._sendprivmsg(channel, message, PRIORITY_NORMAL)
 
     def sendwhisper(self, username, message):
         """
         Send a whisper-message to a user
         """
-        self.sendprivmsg(self.username, '/w %s %s'%(username,message))
+        self._queue_send(encode_privmsg(self.username.lower(), '/w %s %s' % (username, message)), LIMIT_WHISPER)
 
     def join(self, channel):
         """
         Join a channel to send messages to
         """
+        line = encode_join(channel)
         self.joined_channels.add(channel)
-        self.send('JOIN #%s\r\n'%channel)
+        self.pending_joins.add(channel.lower())
+        self._queue_send(line, LIMIT_JOIN)
+
+    def join_many(self, channels):
+        """
+        Join many channels at once, they are packed into as few lines as possible
+        Every channel is spread by joinconfirmspreader when twitch confirms the join
+        """
+        channels = list(channels)
+        packed = _pack_channels('JOIN', channels, self._max_joins_per_line())
+        self.joined_channels.update(channels)
+        self.pending_joins.update(channel.lower() for channel in channels)
+        for line, count in packed:
+            self._queue_send(line, LIMIT_JOIN, cost=count)
 
     def part(self, channel):
         """
         Leave a channel
         """
+        line = encode_part(channel)
         self.joined_channels.discard(channel)
-        self.send('PART #%s\r\n'%channel)
+        self.pending_joins.discard(channel.lower())
+        #Parting is not limited, but it must not overtake a queued join
+        self._queue_send(line, LIMIT_JOIN, cost=0)
+
+    def part_many(self, channels):
+        """
+        Leave many channels at once, they are packed into as few lines as possible
+        """
+        channels = list(channels)
+        packed = _pack_channels('PART', channels)
+        self.joined_channels.difference_update(channels)
+        self.pending_joins.difference_update(channel.lower() for channel in channels)
+        for line, count in packed:
+            self._queue_send(line, LIMIT_JOIN, cost=0)
 
     def timeout(self, channel, username, duration=600):
         """
         Time out a user in a channel with an optional duration in seconds (default: 600)
         You have to be moderator in the channel
         """
-        self.sendprivmsg(channel, '/timeout %s %s'%(username, duration))
+        self._sendprivmsg(channel, '/timeout %s %s'%(username, duration), PRIORITY_HIGH)
 
     def ban(self, channel, username):
         """
         Ban a user from the channel
         You have to be moderator in the channel
         """
-        self.sendprivmsg(channel, '/ban %s'%username)
+        self._sendprivmsg(channel, '/ban %s'%username, PRIORITY_HIGH)
 
     def unban(self, channel, username):
         """
         Unan a user from the channel
         You have to be moderator in the channel
         """
-        self.sendprivmsg(channel, '/unban %s'%username)
+        self._sendprivmsg(channel, '/unban %s'%username, PRIORITY_HIGH)
         
     @property
     def socket_timeout(self):
@@ -302,10 +1079,243 @@ class TwitchIrcClient:
             print(msg)
 
     #Begin "private" methods
+    def _create_spreader(self):
+        """
+        Creates the EventSpreader for one event
+        """
+        if not self.dispatcher is None:
+            return self.dispatcher.create_spreader()
+        return EventSpreader()
+
+    def _watch_spreaders(self):
+        """
+        Updates the skipped commands and capabilities whenever a spreader gets or looses recievers
+        Has to be called again if the spreaders are replaced
+        """
+        for name in SPREADER_CAPABILITIES:
+            getattr(self, name).watch(self._spreaders_changed)
+        #All spreaders, their batches are delivered after every read
+        self._spreaders = [spreader for spreader in vars(self).values() if isinstance(spreader, EventSpreader)]
+        self._spreaders_changed()
+        if not self.metrics is None:
+            for spreader in vars(self).values():
+                #Spreaders shared by a pool are only wrapped once
+                if isinstance(spreader, EventSpreader) and not '_call' in vars(spreader):
+                    spreader._call = self.metrics.timed_call(spreader._call)
+
+    def _needed_capabilities(self):
+        """
+        Returns:
+            (set): The capabilities for the spreaders with recievers and the client itself
+        """
+        if not self.capabilities is None:
+            return set(self.capabilities)
+        needed = set()
+        for name, capabilities in SPREADER_CAPABILITIES.items():
+            if getattr(self, name).has_recievers():
+                needed.update(capabilities)
+        if not self.send_queue is None:
+            #USERSTATE tells in which channels we are moderator
+            needed.update((CAP_COMMANDS, CAP_TAGS))
+        if not self.state is None:
+            needed.update(CAPABILITIES)
+        return needed
+
+    def _spreaders_changed(self):
+        skipped = set(command for command, names in COMMAND_SPREADERS.items()
+            if not any(getattr(self, name).has_recievers() for name in names))
+        if not self.state is None:
+            skipped.difference_update(STATE_COMMANDS)
+        self._skipped_commands = frozenset(skipped)
+        if self._requested_capabilities is None:
+            return
+        #Twitch accepts CAP REQ at any time, so new recievers get their events right away
+        missing = self._needed_capabilities()-self._requested_capabilities
+        if missing:
+            self._requested_capabilities |= missing
+            try:
+                self._send_now(''.join('CAP REQ :%s\r\n'%capability for capability in CAPABILITIES if capability in missing))
+            except OSError as e:
+                #The next connection requests them anyway
+                self.log('Error during capability request: %s'%e)
+
+    def _capability_lines(self):
+        """
+        Returns:
+            (list): CAP REQ lines for the needed capabilities at the start of a connection
+        """
+        needed = self._needed_capabilities()
+        self._requested_capabilities = needed
+        return ['CAP REQ :%s\r\n'%capability for capability in CAPABILITIES if capability in needed]
+
+    def _pong(self, data):
+        """
+        Answers a PING line from twitch
+        """
+        self.send(encode_pong(data))
+
+    def _keepalive_loop(self):
+        """
+        Runs in the keepalive thread, sends the PINGs and reconnects if a PONG is overdue
+        """
+        while not self._stopping.is_set():
+            #Nothing to check while the login isn't accepted (e.g. during a reconnect)
+            if not self._authenticated.wait(self.keepalive.interval):
+                continue
+            if self._stopping.wait(self.keepalive.next_delay()):
+                break
+            if self._authenticated.is_set() and self._keepalive_tick() is KEEPALIVE_RECONNECT:
+                self.reconnect()
+
+    def _keepalive_tick(self):
+        """
+        Sends the next PING if it is due
+        Returns:
+            (str): KEEPALIVE_RECONNECT if the last PING wasn't answered in time, the caller has to reconnect
+        """
+        action, token = self.keepalive.tick()
+        if action==KEEPALIVE_PING:
+            try:
+                self._send_now('PING :%s\r\n'%token)
+            except OSError as e:
+                #The reciever notices the lost connection as well
+                self.log('Error during keepalive: %s'%e)
+        elif action==KEEPALIVE_RECONNECT:
+            self.log('reconnecting because PING %s was not answered'%token)
+            keepalive = self.keepalive
+            self.healthspreader.spread_event(Health(keepalive.rtt, keepalive.last_rtt, False, keepalive.missed))
+        return action
+
+    def _end_burst(self):
+        """
+        Called after the lines of one read are handled, delivers the due batches
+        """
+        for spreader in self._spreaders:
+            if spreader._batches:
+                spreader.flush_batches()
+
+    def _flush_all_batches(self):
+        for spreader in self._spreaders:
+            if spreader._batches:
+                spreader.flush_batches(force=True)
+
+    def _forget_channels(self):
+        """
+        The state of the channels is lost with the connection, it is rebuilt when they are rejoined
+        """
+        self._names_chunks.clear()
+        if not self.state is None:
+            self.state.clear()
+
+    def _queue_send(self, msg, limit_class, priority=PRIORITY_NORMAL, cost=1):
+        """
+        Sends the message through the send_queue if rate limiting is enabled, directly otherwise
+        """
+        if self.send_queue is None:
+            self.send(msg)
+        else:
+            self.send_queue.put(msg, limit_class, priority, cost)
+
+    def _max_joins_per_line(self):
+        #A line can't join more channels than the join buckets allow at once
+        if self.send_queue is None:
+            return None
+        return self.send_queue.max_cost(LIMIT_JOIN)
+
+    def _sendprivmsg(self, channel, message, priority):
+        channel = channel.lower()
+        if channel in self._moderated_channels:
+            limit_class = LIMIT_MODERATOR
+        else:
+            limit_class = LIMIT_MESSAGE
+        self._queue_send(encode_privmsg(channel, message), limit_class, priority)
+
+    def _send_now(self, msg):
+        """
+        Writes to the socket without waiting for the authentication
+        """
+        self._write(msg if isinstance(msg, bytes) else msg.encode('utf-8'))
+
+    def _write(self, data):
+        """
+        Writes bytes to the socket, with a reactor they are buffered and written by the reactor thread
+        Lines sent by the reciever thread are written together before it reads again, with
+        write_delay the lines of all threads are written together by the OutboundBuffer
+        """
+        if not self.reactor is None:
+            with self._out_lock:
+                idle = not self._out
+                self._out += data
+                full = len(self._out)>=self.write_size
+            #A flush is already on its way if the buffer wasn't empty
+            if full:
+                self.reactor.write(self)
+            elif idle:
+                self.reactor.write(self, self.write_delay or 0)
+        elif not self._outbound is None:
+            self._outbound.put(data)
+        elif self._in_reciever_thread():
+            self._burst_out += data
+        else:
+            self._sock.sendall(data)
+
+    def _write_socket(self, data):
+        self._sock.sendall(data)
+
+    def _write_burst(self):
+        #Called by the reciever thread
+        if self._burst_out:
+            data = bytes(self._burst_out)
+            self._burst_out.clear()
+            self._sock.sendall(data)
+
+    def _write_pending(self):
+        """
+        Writes the buffered lines before the socket is closed
+        """
+        try:
+            if not self._outbound is None:
+                self._outbound.stop()
+                self._outbound.flush()
+            if self._in_reciever_thread():
+                self._write_burst()
+        except OSError as e:
+            self.log('Error during shutdown: %s'%e)
+
+    def _in_reciever_thread(self):
+        if not self.reactor is None:
+            return self.reactor.in_reactor_thread()
+        return threading.current_thread() is self._irc_reciever_thread
+
+    def _connect_reactor(self):
+        """
+        create_connection with a reactor: the reactor reads the socket and runs the keepalive
+        """
+        self.go_on=True
+        self.reactor.add(self)
+        if not self.send_queue is None:
+            self.send_queue.start()
+        if not self.keepalive is None:
+            self._keepalive_timer = self.reactor.call_later(self.keepalive.interval, self._keepalive_reactor)
+        self._begin_connection()
+
+    def _keepalive_reactor(self):
+        #_keepalive_loop for the reactor thread, called again after the next delay
+        if not self.go_on:
+            return
+        delay = self.keepalive.interval
+        if self._authenticated.is_set():
+            if self._keepalive_tick() is KEEPALIVE_RECONNECT:
+                self.reconnect()
+            else:
+                delay = self.keepalive.next_delay()
+        self._keepalive_timer = self.reactor.call_later(delay, self._keepalive_reactor)
+
     def _kill_socket(self):
         """
         Shutdown the socket, it can not longer be used
         """
+        self._save_tls_session()
         self._sock.shutdown(socket.SHUT_RDWR)
         self._sock.close()
 
@@ -314,171 +1324,287 @@ class TwitchIrcClient:
         Connect a new socket to the irc
         """
         ircsocket = socket.socket()
-        #get default context and apply given params to it
-        sslcontext=ssl.SSLContext(**self.ssl_context)
-        self._sock=sslcontext.wrap_socket(ircsocket)
-        self._sock.connect((self.irc_hostname, self.irc_port))
+        if self.use_ssl:
+            self._sock=self._get_ssl_context().wrap_socket(ircsocket, do_handshake_on_connect=False, session=self._tls_session)
+            self._sock.connect((self.irc_hostname, self.irc_port))
+            started = time.perf_counter()
+            self._sock.do_handshake()
+            self._tls_connected(time.perf_counter()-started, self._sock.session_reused)
+        else:
+            self._sock=ircsocket
+            self._sock.connect((self.irc_hostname, self.irc_port))
         self._sock.settimeout(self.socket_timeout)
 
+    def _get_ssl_context(self):
+        """
+        Returns:
+            (SSLContext): The context of the client, created once so the loaded certificates and
+                the sessions survive reconnects
+        """
+        if self._sslcontext is None:
+            #get default context and apply given params to it
+            self._sslcontext=ssl.SSLContext(**self.ssl_context)
+        return self._sslcontext
+
+    def _tls_connected(self, seconds, reused):
+        self.tls_handshake_time=seconds
+        self.tls_session_reused=reused
+        self._save_tls_session()
+        if not self.metrics is None:
+            self.metrics.tls_handshake(seconds, reused)
+
+    def _save_tls_session(self):
+        #With TLS 1.3 the session ticket comes after the handshake, so it is saved again before closing
+        session = getattr(self._sock, 'session', None)
+        if not session is None:
+            self._tls_session=session
+
     def _begin_connection(self):
         """
         Start the conversation, requests capabilities, authenticates and joins previously joined channels
         """
-        self.send('CAP REQ :twitch.tv/membership\r\n')
-        self.send('CAP REQ :twitch.tv/commands\r\n')
-        self.send('CAP REQ :twitch.tv/tags\r\n')
-        self.authenticate(self.username, self.oauthtoken)
-        for channel in self.joined_channels:
-            self.join(channel)
+        if not self.keepalive is None:
+            self.keepalive.start()
+        #The connection is not authenticated yet, send without waiting
+        #All lines are sent in one write, so they take one TLS record instead of one each
+        lines = self._capability_lines()
+        lines.append('PASS %s\r\n' % self.oauthtoken)
+        lines.append('NICK %s\r\n' % self.username)
+        lines.append('USER %s %s %s :%s\r\n' % ((self.username,)*4))
+        #Rejoin the channels, paced by the send_queue if rate limiting is enabled
+        self.pending_joins = set(channel.lower() for channel in self.joined_channels)
+        for line, count in _pack_channels('JOIN', self.joined_channels, self._max_joins_per_line()):
+            if self.send_queue is None:
+                lines.append(line)
+            else:
+                #Called by the reciever thread, it must not wait for space in the queue
+                self.send_queue.put(line, LIMIT_JOIN, cost=count, force=True)
+        self._send_now(''.join(lines))
 
     def _handle_incomming(self, data):
+        if not self.recorder is None:
+            self.recorder.record(data)
+        if not self.metrics is None:
+            self._handle_measured(data)
+            return
         if not len(data):
             return
         elif data.startswith('PING'):
             #Respond to PING, looses connection otherwise
-            self.send(data.replace('PING','PONG')+'\r\n')
+            self._pong(data)
+        elif self._skipped_commands and _line_command(data) in self._skipped_commands:
+            #Nobody listens, don't parse the line at all
+            return
         else:
-            #Try to match regular expressions!
-            msg_match = privmsg_regex.match(data)
-            if not msg_match is None:
-                self._messagerecieved(msg_match)
-                return
-            join_match = join_regex.match(data)
-            if not join_match is None:
-                self._joinrecieved(join_match)
-                return
-            part_match = part_regex.match(data)
-            if not part_match is None:
-                self._partrecieved(part_match)
-                return
-            notice_match = notice_regex.match(data)
-            if not notice_match is None:
-                self._noticerecieved(notice_match)
-                return
-            usernotice_match = usernotice_regex.match(data)
-            if not usernotice_match is None:
-                self._usernoticerecieved(usernotice_match)
-                return
-            roomstate_match = roomstate_regex.match(data)
-            if not roomstate_match is None:
-                self._roomstaterecieved(roomstate_match)
-                return
-            clearchat_match = clearchat_regex.match(data)
-            if not clearchat_match is None:
-                self._clearchatrecieved(clearchat_match)
-                return
-            userstate_match = userstate_regex.match(data)
-            if not userstate_match is None:
-                self._userstaterecieved(userstate_match)
-                return
-            globaluserstate_match = globaluserstate_regex.match(data)
-            if not globaluserstate_match is None:
-                self._globaluserstaterecieved(globaluserstate_match)
-                return
-            host_match = host_regex.match(data)
-            if not host_match is None:
-                self._hostrecieved(host_match)
-                return
-            whisper_match = whisper_regex.match(data)
-            if not whisper_match is None:
-                self._whisperrecieved(whisper_match)
-                return
-            gain_operator_match = gain_operator_regex.match(data)
-            if not gain_operator_match is None:
-                self._gainoperatorreciever(gain_operator_match)
-                return
-            loose_operator_match = loose_operator_regex.match(data)
-            if not loose_operator_match is None:
-                self._looseoperatorreciever(loose_operator_match)
-                return
-            #This regex requires self because it has the username in it 
-            nameslist_match = self.nameslist_regex.match(data)
-            if not nameslist_match is None:
-                self._nameslistreciever(nameslist_match)
+            #Split the line once and look up the handler for its command
+            parsed = _parse_line(data)
+            if parsed is None:
+                self.log('"'+data+'"')
                 return
+            raw_tags, prefix, command, params = parsed
+            handler = self._command_handlers.get(command)
+            if handler is None or handler(raw_tags, prefix, params) is False:
+                self.log('"'+data+'"')
+
+    def _handle_measured(self, data):
+        """
+        _handle_incomming with metrics, the same steps with time measurements in between
+        """
+        metrics = self.metrics
+        clock = metrics.clock
+        if not len(data):
+            return
+        command = _line_command(data)
+        size = len(data.encode('utf-8'))+2
+        if command=='PING':
+            metrics.line_handled(command, size)
+            self._pong(data)
+            return
+        if command in self._skipped_commands:
+            metrics.line_handled(command, size)
+            return
+        start = clock()
+        parsed = _parse_line(data)
+        parsed_at = clock()
+        if parsed is None:
+            metrics.line_handled(command, size, parsed_at-start)
             self.log('"'+data+'"')
+            return
+        raw_tags, prefix, command, params = parsed
+        handler = self._command_handlers.get(command)
+        if handler is None or handler(raw_tags, prefix, params) is False:
+            self.log('"'+data+'"')
+        metrics.line_handled(command, size, parsed_at-start, clock()-parsed_at)
 
-    def _messagerecieved(self, match):
+    #The handlers get the splitted line, they return False if the line doesn't look like expected
+    def _messagerecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None or len(params)<2 or prefix is None:
+            return False
         #Twtichnotify doesnt't send tags, empty dicct is returned cause it's easier to deal with
-        raw_tags = match.group('tags')
-        if raw_tags is None:
-            tags={}
-        else:
-            tags=_parse_tags(raw_tags)
-        username = match.group('username')
-        channel = match.group('channel')
-        message = match.group('message')
-        self.messagespreader.spread(username=username, channel=channel, tags=tags, message=message)
-
-    def _joinrecieved(self, match):
-        username = match.group('username')
-        channel = match.group('channel')
-        self.joinspreader.spread(username=username,channel=channel)
-
-    def _partrecieved(self, match):
-        username = match.group('username')
-        channel = match.group('channel')
-        self.partspreader.spread(username=username,channel=channel)
+        tags=_parse_tags(raw_tags)
+        username = self._intern(_prefix_username(prefix))
+        channel = self._intern(channel)
+        message = params[1]
+        self.messagespreader.spread_event(PrivMsg(username, channel, tags, message))
+
+    def _joinrecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None or prefix is None:
+            return False
+        username = self._intern(_prefix_username(prefix))
+        channel = self._intern(channel)
+        if not self.state is None:
+            self.state.joined(channel, username)
+        #JOINs are always handled, only build the event if somebody listens
+        if self.joinspreader.has_recievers():
+            self.joinspreader.spread_event(Join(username, channel))
+        if username==self.username.lower():
+            self.pending_joins.discard(channel)
+            self.joinconfirmspreader.spread_event(JoinConfirm(channel))
+
+    def _partrecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None or prefix is None:
+            return False
+        username = self._intern(_prefix_username(prefix))
+        channel = self._intern(channel)
+        if not self.state is None:
+            self.state.parted(channel, username)
+        self.partspreader.spread_event(Part(username, channel))
         
-    def _noticerecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        channel = match.group('channel')
-        message = match.group('message')
-        self.noticespreader.spread(channel=channel, message=message, tags=tags)
-
-    def _usernoticerecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        channel = match.group('channel')
-        message = match.group('message')
+    def _noticerecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None or len(params)<2:
+            return False
+        tags = _parse_tags(raw_tags)
+        message = params[1]
+        self.noticespreader.spread_event(Notice(channel, message, tags))
+
+    def _usernoticerecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None:
+            return False
+        tags = _parse_tags(raw_tags)
         #no resubcription message:
-        if message is None:
+        if len(params)<2:
             message = ''
-        self.usernoticespreader.spread(channel=channel, message=message, tags=tags)
+        else:
+            message = params[1]
+        channel = self._intern(channel)
+        self.usernoticespreader.spread_event(UserNotice(channel, message, tags))
 
-    def _roomstaterecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        channel = match.group('channel')
-        self.roomstatespreader.spread(channel=channel, tags=tags)
+    def _roomstaterecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None:
+            return False
+        tags = _parse_tags(raw_tags)
+        if not self.state is None:
+            self.state.roomstate(channel, tags)
+        self.roomstatespreader.spread_event(RoomState(channel, tags))
         
-    def _clearchatrecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        channel = match.group('channel')
-        username = match.group('username')
-        self.clearchatspreader.spread(channel=channel, tags=tags, username=username)
+    def _clearchatrecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        #Clearing the whole chat has no username, that was never spread
+        if channel is None or len(params)<2:
+            return False
+        tags = _parse_tags(raw_tags)
+        username = self._intern(params[1])
+        channel = self._intern(channel)
+        self.clearchatspreader.spread_event(ClearChat(channel, tags, username))
         
-    def _userstaterecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        channel = match.group('channel')
-        self.userstatespreader.spread(channel=channel, tags=tags)
+    def _userstaterecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None:
+            return False
+        tags = _parse_tags(raw_tags)
+        #Moderators and the broadcaster can send more messages
+        if tags.get('mod')=='1' or 'broadcaster' in tags.badge_list():
+            self._moderated_channels.add(channel)
+        else:
+            self._moderated_channels.discard(channel)
+        if not self.state is None:
+            self.state.userstate(channel, tags)
+        self.userstatespreader.spread_event(UserState(channel, tags))
         
-    def _globaluserstaterecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        self.globaluserstatespreader.spread(tags=tags)
+    def _globaluserstaterecieved(self, raw_tags, prefix, params):
+        tags = _parse_tags(raw_tags)
+        self.globaluserstatespreader.spread_event(GlobalUserState(tags))
         
-    def _hostrecieved(self, match):
-        channel=match.group('channel')
-        target=match.group('target')
-        viewers=match.group('viewers')
-        self.hostspreader.spread(channel=channel, target=target, viewers=viewers)
-
-    def _whisperrecieved(self, match):
-        tags = _parse_tags(match.group('tags'))
-        username = match.group('username')
-        message = match.group('message')
-        self.whisperspreader.spread(username=username, message=message, tags=tags)
-
-    def _gainoperatorreciever(self, match):
-        channel = match.group('channel')
-        username = match.group('username')
-        self.gainoperatorspreader.spread(channel=channel, username=username)
-
-    def _looseoperatorreciever(self, match):
-        channel = match.group('channel')
-        username = match.group('username')
-        self.looseoperatorspreader.spread(channel=channel, username=username)
-
-    def _nameslistreciever(self, match):
-        raw_names = match.group('names')
-        channel = match.group('channel')
-        names = raw_names.split()
-        self.nameslistspreader.spread(channel=channel, names=names)
+    def _hostrecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None or len(params)<2:
+            return False
+        #The trailing param is 'target viewers', target is '-' if hosting stopped
+        hostinfo = params[1].split()
+        if len(hostinfo)!=2:
+            return False
+        target, viewers = hostinfo
+        self.hostspreader.spread_event(HostTarget(channel, target, viewers))
+
+    def _whisperrecieved(self, raw_tags, prefix, params):
+        if len(params)<2 or prefix is None:
+            return False
+        tags = _parse_tags(raw_tags)
+        username = self._intern(_prefix_username(prefix))
+        message = params[1]
+        self.whisperspreader.spread_event(Whisper(username, message, tags))
+
+    def _moderecieved(self, raw_tags, prefix, params):
+        channel = _channel_param(params)
+        if channel is None or len(params)<3:
+            return False
+        mode = params[1]
+        username = params[2]
+        if mode=='+o':
+            self.gainoperatorspreader.spread_event(Operator(channel, username))
+        elif mode=='-o':
+            self.looseoperatorspreader.spread_event(Operator(channel, username))
+        else:
+            return False
+
+    def _welcomerecieved(self, raw_tags, prefix, params):
+        #Twitch accepted the login, waiting senders can continue
+        self.backoff.succeeded()
+        if not self._reconnect_started is None:
+            self.reconnect_latency = time.monotonic()-self._reconnect_started
+            self._reconnect_started = None
+            if not self.metrics is None:
+                self.metrics.reconnected(self.reconnect_latency)
+        self._authenticated.set()
+        self.connectspreader.spread()
+
+    def _pongrecieved(self, raw_tags, prefix, params):
+        #Answer to a PING, the keepalive PINGs carry a token
+        if self.keepalive is None or len(params)<2:
+            return
+        if self.keepalive.pong(params[1]) is None:
+            #e.g. the PONG of pingtest
+            return
+        keepalive = self.keepalive
+        self.healthspreader.spread_event(Health(keepalive.rtt, keepalive.last_rtt, True, keepalive.missed))
+
+    def _nameslistreciever(self, raw_tags, prefix, params):
+        #params are: login, channel type, channel, names
+        if len(params)<4 or params[0]!=self.username:
+            return False
+        channel = _channel_param(params[2:])
+        if channel is None:
+            return False
+        names = params[3].split()
+        if not self.state is None or self.nameslistendspreader.has_recievers():
+            #The names come in several lines, they are merged until the end of the list
+            self._names_chunks.setdefault(channel, []).extend(names)
+        self.nameslistspreader.spread_event(NamesList(channel, names))
+
+    def _namesendrecieved(self, raw_tags, prefix, params):
+        #params are: login, channel, 'End of /NAMES list'
+        if len(params)<2 or params[0]!=self.username:
+            return False
+        channel = _channel_param(params[1:])
+        if channel is None:
+            return False
+        names = self._names_chunks.pop(channel, [])
+        if not self.state is None:
+            self.state.names(channel, names)
+        self.nameslistendspreader.spread_event(NamesList(channel, names))